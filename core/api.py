@@ -1,10 +1,11 @@
 from typing import List
 
-from ninja import ModelSchema, Router
+from ninja import ModelSchema, Query, Router
 from ninja.orm import create_schema
 from django.shortcuts import get_object_or_404
 
 from .models import DataType
+from .pagination import Page, paginated_response
 
 router = Router(tags=["core"])
 
@@ -19,7 +20,7 @@ DataTypeOut = create_schema(
 
 # === /datatype/all === get a list of all data types ==========================
 @router.get("/datatype/all", response=List[DataTypeOut])
-def get_all_datatypes(request):
+def get_all_datatypes(request, page: Page = Query(...)):
     """
     Retrieves all datatypes that exist in the database. The **id** is used as a
     primary key, though the **name** also needs to be unique. The
@@ -27,8 +28,12 @@ def get_all_datatypes(request):
     The property **kind_of_data** specifies what kind of data type is expected,
     e.g. integer, boolean, ... This data type will NOT be enforced, it is just
     a hint!
+
+    Optionally use **limit** to get at most this many data types ordered by id and
+    **after** (the id of the last data type of the previous page) for the next page.
+    With **stream**=true the data types are sent as NDJSON (one per line).
     """
-    return DataType.objects.all()
+    return paginated_response(DataType.objects.all(), DataTypeOut, page)
 
 
 # === /datatypes/#id === get data type by id===================================
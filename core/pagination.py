@@ -0,0 +1,94 @@
+from functools import reduce
+from typing import Iterable, Iterator, Sequence, Type, Union
+
+from ninja import Field, Schema
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from django.http import StreamingHttpResponse
+
+
+class Page(Schema):
+    """
+    query parameters of list endpoints: without limit all rows are returned, with
+    limit one page of the rows after the row with the id after. stream returns the
+    rows as NDJSON (one json object per line) instead of a json list.
+    """
+
+    limit: int = Field(None, ge=1)
+    after: int = None
+    stream: bool = False
+
+
+def keyset_filter(queryset: QuerySet, after: int, order: Sequence[str]) -> QuerySet:
+    """
+    input: a queryset, the id of the last row of the previous page and the fields
+    the rows are ordered by (ending with "id")
+    output: the rows that come after that row in this order
+    """
+    if list(order) == ["id"]:
+        return queryset.filter(id__gt=after)
+    anchor = queryset.model.objects.filter(id=after).values(*order).first()
+    if anchor is None:
+        # the row is gone, continue with the ids after it
+        return queryset.filter(id__gt=after)
+    # (a, b, id) > (anchor a, anchor b, anchor id), one alternative per field
+    alternatives = [
+        Q(**{field: anchor[field] for field in order[:index]})
+        & Q(**{order[index] + "__gt": anchor[order[index]]})
+        for index in range(len(order))
+    ]
+    return queryset.filter(reduce(lambda first, second: first | second, alternatives))
+
+
+def paginate(
+    queryset: QuerySet, page: Page, order: Sequence[str] = ("id",)
+) -> QuerySet:
+    """
+    input: all rows of a list endpoint, the page parameters and the fields the rows
+    are ordered by (ending with "id", an index should cover them)
+    output: the rows of the requested page
+    """
+    queryset = queryset.order_by(*order)
+    if page.after is not None:
+        queryset = keyset_filter(queryset, page.after, order)
+    if page.limit is not None:
+        queryset = queryset[: page.limit]
+    return queryset
+
+
+def ndjson_lines(
+    queryset: Union[QuerySet, Iterable], schema: Type[Schema]
+) -> Iterator[str]:
+    """
+    output: one line of json per row, the rows of a queryset are fetched in chunks
+    with a server side cursor so only one chunk is held in memory
+    """
+    if isinstance(queryset, QuerySet):
+        chunk_size = getattr(settings, "TREEXPERT_STREAM_CHUNK_SIZE", 2000)
+        queryset = queryset.iterator(chunk_size=chunk_size)
+    for row in queryset:
+        yield schema.from_orm(row).model_dump_json() + "\n"
+
+
+def stream_ndjson(
+    queryset: Union[QuerySet, Iterable], schema: Type[Schema]
+) -> StreamingHttpResponse:
+    return StreamingHttpResponse(
+        ndjson_lines(queryset, schema), content_type="application/x-ndjson"
+    )
+
+
+def paginated_response(
+    queryset: QuerySet,
+    schema: Type[Schema],
+    page: Page,
+    order: Sequence[str] = ("id",),
+) -> Union[QuerySet, StreamingHttpResponse]:
+    """
+    output: the requested page of the rows, as NDJSON stream if page.stream is set
+    """
+    rows = paginate(queryset, page, order)
+    if page.stream:
+        return stream_ndjson(rows, schema)
+    return rows
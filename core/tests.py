@@ -1,7 +1,9 @@
 import json
+from unittest.mock import patch
 
 from django.test import Client, TestCase
 
+from .cache import LRUCache
 from .models import DataType
 
 
@@ -28,6 +30,31 @@ class CoreApiTests(TestCase):
         self.assertEqual(response.json()[1]["name"], "test2")
         self.assertEqual(response.status_code, 200)
 
+    def test_return_data_types_page(self):
+        data_types = [DataType.objects.create(name="test" + str(i)) for i in range(5)]
+        response = self.client.get("/api/core/datatype/all?limit=2")
+        self.assertEqual([d["name"] for d in response.json()], ["test0", "test1"])
+        response = self.client.get(
+            "/api/core/datatype/all?limit=2&after=" + str(data_types[1].id)
+        )
+        self.assertEqual([d["name"] for d in response.json()], ["test2", "test3"])
+        response = self.client.get(
+            "/api/core/datatype/all?limit=2&after=" + str(data_types[4].id)
+        )
+        self.assertEqual(response.json(), [])
+        response = self.client.get("/api/core/datatype/all?limit=0")
+        self.assertEqual(response.status_code, 422)
+
+    def test_stream_data_types(self):
+        for i in range(3):
+            DataType.objects.create(name="test" + str(i))
+        response = self.client.get("/api/core/datatype/all?stream=true")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)["name"] for line in lines], ["test0", "test1", "test2"]
+        )
+
     def test_return_data_types_by_id(self):
         type_one = DataType(name="test1", id=1)
         type_two = DataType(name="test2", id=2)
@@ -91,3 +118,48 @@ class CoreViewTests(TestCase):
     def test_redirect_to_docs(self):
         response = self.client.get("/")
         self.assertRedirects(response, "/api/docs")
+
+
+class LRUCacheTests(TestCase):
+    def test_get_and_put(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    @patch("core.cache.time.monotonic")
+    def test_evicts_by_age(self, mock_monotonic):
+        cache = LRUCache(max_size=2, max_age=10)
+        mock_monotonic.return_value = 100
+        cache.put("a", 1)
+        mock_monotonic.return_value = 111
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_get_or_load(self):
+        cache = LRUCache(max_size=2)
+        loads = []
+        for _ in range(3):
+            value = cache.get_or_load("a", lambda: loads.append(1) or "loaded")
+        self.assertEqual(value, "loaded")
+        self.assertEqual(len(loads), 1)
+
+    def test_invalidate(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.invalidate("a")
+        cache.invalidate("b")
+        self.assertNotIn("a", cache)
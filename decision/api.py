@@ -1,14 +1,50 @@
-from typing import List, Optional, Tuple, Union
+import heapq
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from ninja import Field, ModelSchema, Router, Schema
+from ninja import Field, ModelSchema, Query, Router, Schema
 from ninja.orm import create_schema
+from pydantic import ValidationError
 
-from django.db import utils
-from django.shortcuts import get_list_or_404, get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.http import Http404, StreamingHttpResponse
 
-from tree.models import Tree, TreeKind, Version
+from core.pagination import Page, paginated_response, stream_ndjson
+from tree.cache import get_current_version
+from tree.models import Version
 from .models import Decision, ExpertRequest, RequestData
-from .evaluator import Evaluator
+from .archive import get_archive
+from .audit import get_audit_log, write_behind_enabled
+from .cache import (
+    cached_result,
+    decision_cache,
+    evaluate_cached,
+    evaluate_many_cached,
+    evaluator_cache,
+    get_cached_evaluator,
+)
+from .evaluator import (
+    EvaluationResult,
+    Evaluator,
+    EvaluatorException,
+    pack_path,
+    saved_path,
+)
+from .export import export_requests, gzipped, ndjson
+from .persistence import (
+    allocate_request_ids,
+    build_requests,
+    known_data_types,
+    load_request_data,
+    request_data_storage,
+    save_decisions,
+    save_requests,
+    store_data,
+)
 
 
 router = Router(tags=["decision"])
@@ -77,53 +113,78 @@ class ShortResultOut(Schema):
 def get_version(kind_of_tree_id: int = None) -> Version:
     """
     if given a tree kind id, this returns the current version for this tree kind
-    else it returns the current version of the first tree kind in the database
+    else it returns the current version of the first tree kind in the database.
+    the current version is the one that was published last (or rolled back to), it
+    is cached so most calls don't need a query
     """
-    if kind_of_tree_id:
-        return Version.objects.get_current_version(
-            kind_of_tree=TreeKind.objects.get(id=kind_of_tree_id)
-        )
-    return Version.objects.get_current_version(kind_of_tree=TreeKind.objects.first())
+    return get_current_version(kind_of_tree_id)
 
 
 def save_request_data(
-    expert_request: ExpertRequestIn, kind_id: int = None
+    expert_request: ExpertRequestIn, kind_id: int = None, version: Version = None
 ) -> Tuple[ExpertRequest, List[RequestData]]:
     """
-    input: a single expert request with input data
+    input: a single expert request with input data and the tree kind or the version
     split the data and identification and save both for later analysis
     output: the request information that was saved and the saved data
     """
-    version = get_version(kind_id)
+    if version is None:
+        version = get_version(kind_id)
+    if request_data_storage() != "rows":
+        requests, data_lists = build_requests([expert_request], version)
+        store_data(requests, data_lists)
+        requests[0].save()
+        return requests[0], data_lists[0]
     saved_request = ExpertRequest.objects.create(
         identifier=expert_request.identifier,
         sec_identifier=expert_request.sec_identifier,
         version=version,
     )
+    # do not save data with strange data type identifiers to prevent IntegrityError
+    known = known_data_types({data.data_type for data in expert_request.data})
     # split saved request data for evaluation
     saved_data = []
     for data in expert_request.data:
-        try:
+        if data.data_type in known:
             saving = RequestData.objects.create(
-                request=saved_request, type_id=data.data_type, value=data.data_value
+                request=saved_request,
+                request_date=saved_request.date,
+                type_id=data.data_type,
+                value=data.data_value,
             )
             saved_data.append(saving)
-        except utils.IntegrityError:
-            # do not save data with strange data type identifiers to prevent
-            # IntegrityError
-            pass
     return saved_request, saved_data
 
 
+def unlogged_cache_hit(
+    expert_request: ExpertRequestIn, version: Version, known: Set[int] = None
+) -> Optional[EvaluationResult]:
+    """
+    output: the cached result for this request if cache hits are answered without
+    saving the request (TREEXPERT_DECISION_CACHE_LOG_HITS), else None
+    """
+    if getattr(settings, "TREEXPERT_DECISION_CACHE_LOG_HITS", True):
+        return None
+    data = expert_request.data or []
+    if known is None:
+        known = known_data_types({value.data_type for value in data})
+    return cached_result(
+        version,
+        (
+            (value.data_type, value.data_value)
+            for value in data
+            if value.data_type in known
+        ),
+    )
+
+
 def get_evaluator_for_version(version: Version) -> Evaluator:
     """
-    look for current complete tree and build an evaluator with it
+    look for the complete tree of this version and build an evaluator with it, the
+    evaluator is cached per version (see decision.cache)
     output: evaluator ready to run
     """
-    # get tree
-    tree = Tree.objects.get_complete_tree(version)
-    # build evaluator
-    return Evaluator(tree=tree[0], nodes=tree[1], leafs=tree[2])
+    return get_cached_evaluator(version)
 
 
 def get_decision(
@@ -142,23 +203,50 @@ def get_decision(
         criteria: all the nodes that were visited while running through the tree
     run evaluator through tree and save the response
     """
-    # run a data set through tree and record criteria
-    evaluator.run_tree(data=request_data_list)
+    # run a data set through tree (or take the result of the same input from the
+    # cache) and record criteria
+    result = evaluate_cached(evaluator, expert_request.version, request_data_list)
+    return record_decision(result, expert_request)
+
+
+def record_decision(
+    result: EvaluationResult, expert_request: ExpertRequest
+) -> Tuple[DecisionOut, FullCriteriaOut]:
+    """
+    input:
+        result: result of running the evaluator for this entity
+        expert_request: information about the entity to identify it by
+    output: see get_decision
+    save the decision of this result
+    """
+    decision, criteria, decision_fields = evaluate_decision(result, expert_request)
+    Decision.objects.create(**decision_fields)
+    return decision, criteria
+
+
+def evaluate_decision(
+    result: EvaluationResult, expert_request: ExpertRequest
+) -> Tuple[DecisionOut, FullCriteriaOut, dict]:
+    """
+    input:
+        result: result of running the evaluator for this entity
+        expert_request: information about the entity to identify it by
+    output: decision and criteria (see get_decision) and the fields of the Decision
+    that has to be saved for this request
+    """
+    path, path_results = pack_path(
+        (criteria.number, criteria.result) for criteria in result.criteria
+    )
     # was the evaluation successful or is data missing?
-    if evaluator.missing_data is not None:
+    if result.missing_data is not None:
         # save the partial way through the tree
-        result = (
+        description = (
             "missing data to evaluate tree: "
-            + evaluator.missing_data.display_name
+            + result.missing_data.display_name
             + " ("
-            + str(evaluator.missing_data.id)
+            + str(result.missing_data.id)
             + ") at node with id:"
-            + str(evaluator.node_missing_sth.id)
-        )
-        Decision.objects.create(
-            request=expert_request,
-            description=result,
-            is_preliminary=True,
+            + str(result.node_missing_sth.id)
         )
         # return full information
         return (
@@ -167,34 +255,44 @@ def get_decision(
                 sec_identifier=expert_request.sec_identifier,
                 version=str(expert_request.version),
                 is_preliminary=True,
-                description=result,
-                missing_data=evaluator.missing_data.id,
-                node_missing_sth=evaluator.node_missing_sth.id,
+                description=description,
+                missing_data=result.missing_data.id,
+                node_missing_sth=result.node_missing_sth.id,
+            ),
+            list(result.criteria),
+            dict(
+                request=expert_request,
+                request_date=expert_request.date,
+                description=description,
+                is_preliminary=True,
+                path=path,
+                path_results=path_results,
             ),
-            evaluator.criteria,
         )
     else:
-        # save decision
-        Decision.objects.create(
-            request=expert_request,
-            description=evaluator.end_leaf.display_name,
-            result=evaluator.end_leaf.result,
-            end_leaf=evaluator.end_leaf,
-            is_preliminary=False,
-        )
         return (
             DecisionOut(
                 identifier=expert_request.identifier,
                 sec_identifier=expert_request.sec_identifier,
                 version=str(expert_request.version),
                 is_preliminary=False,
-                description=evaluator.end_leaf.display_name,
-                result=evaluator.end_leaf.result,
-                leaf_id=evaluator.end_leaf.id,
+                description=result.end_leaf.display_name,
+                result=result.end_leaf.result,
+                leaf_id=result.end_leaf.id,
                 node_missing_sth=None,
                 missing_data=None,
             ),
-            evaluator.criteria,
+            list(result.criteria),
+            dict(
+                request=expert_request,
+                request_date=expert_request.date,
+                description=result.end_leaf.display_name,
+                result=result.end_leaf.result,
+                end_leaf=result.end_leaf,
+                is_preliminary=False,
+                path=path,
+                path_results=path_results,
+            ),
         )
 
 
@@ -218,27 +316,216 @@ def decision_bunch(
     construct it.
     """
     # if no tree_kind is supplied, the default tree (id 1) is used
-    # save request list
-    print(data[0].identifier)
-    saved_requests = []
-    saved_requests_data = []
-    for expert_request in data:
-        saved_request, saved_request_data = save_request_data(expert_request, kind_id)
-        saved_requests.append(saved_request)
-        saved_requests_data.append(saved_request_data)
-    # get tree and evaluator
-    evaluator = get_evaluator_for_version(saved_requests[0].version)
-
-    # save decisions for individual requests in a response list
-    response_list = []
-    for saved_request_data, saved_request in zip(saved_requests_data, saved_requests):
-        decision, criteria = get_decision(evaluator, saved_request_data, saved_request)
-        if fullresult:
-            response_list.append(FullResultOut(decision=decision, criteria=criteria))
+    return 200, decide_bunch(data, get_version(kind_id), fullresult)
+
+
+def decide_bunch(
+    data: List[ExpertRequestIn], version: Version, fullresult: bool
+) -> List[Union[FullResultOut, ShortResultOut]]:
+    """
+    input: the entities of a bunch, the tree version and if full results are wanted
+    save the requests with their data and decisions (or hand them to the audit log)
+    in one transaction
+    output: one result per entity, in the same order
+    """
+    hits = [unlogged_cache_hit(expert_request, version) for expert_request in data]
+    unsaved = [expert_request for expert_request, hit in zip(data, hits) if hit is None]
+    write_behind = write_behind_enabled()
+    with transaction.atomic():
+        if write_behind:
+            # only reserve the ids, everything is written later by the audit log
+            saved_requests, saved_requests_data = build_requests(
+                unsaved, version, allocate_request_ids(len(unsaved))
+            )
+        else:
+            # save request list
+            saved_requests, saved_requests_data = save_requests(unsaved, version)
+        # get tree and evaluator
+        evaluator = get_evaluator_for_version(version)
+
+        # cached results first, large bunches of the rest are evaluated at once by
+        # the vectorized batch engine
+        results = iter(
+            zip(
+                evaluate_many_cached(evaluator, version, saved_requests_data),
+                saved_requests,
+            )
+        )
+
+        # collect decisions for individual requests in a response list
+        response_list = []
+        decisions = []
+        for expert_request, hit in zip(data, hits):
+            if hit is None:
+                result, saved_request = next(results)
+                decision, criteria, decision_fields = evaluate_decision(
+                    result, saved_request
+                )
+                decisions.append(Decision(**decision_fields))
+            else:
+                decision, criteria, _ = evaluate_decision(
+                    hit, unsaved_request(expert_request, version)
+                )
+            if fullresult:
+                response_list.append(
+                    FullResultOut(decision=decision, criteria=criteria)
+                )
+            else:
+                response_list.append(
+                    ShortResultOut(decision=decision, criteria=criteria)
+                )
+        if write_behind:
+            get_audit_log().submit(saved_requests, saved_requests_data, decisions)
         else:
-            response_list.append(ShortResultOut(decision=decision, criteria=criteria))
+            save_decisions(decisions)
+
+    return response_list
+
+
+def result_json(
+    result: Union[
+        FullResultOut, ShortResultOut, List[Union[FullResultOut, ShortResultOut]]
+    ]
+) -> str:
+    """
+    output: the result (or list of results) as json, like the endpoints return it
+    """
+    if isinstance(result, list):
+        return "[" + ",".join(result_json(item) for item in result) + "]"
+    return result.model_dump_json(exclude_unset=True, exclude_none=True)
 
-    return 200, response_list
+
+def parse_entities(
+    lines: Iterable[bytes], first_line: int = 1
+) -> Iterator[Tuple[int, Union[ExpertRequestIn, dict]]]:
+    """
+    input: NDJSON lines, one entity (like an item of the bunch) per line, and the
+    number of the first line
+    output: (line number, entity) of each non empty line or, if the line isn't a
+    valid entity, (line number, the error for it), see entity_error
+    """
+    for number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            yield number, ExpertRequestIn.model_validate_json(line)
+        except ValidationError as error:
+            yield number, entity_error(
+                number, json.loads(error.json(include_url=False, include_input=False))
+            )
+
+
+def entity_error(line: int, errors: List[dict]) -> dict:
+    """
+    output: the NDJSON error line of an entity: {"line": line number, "errors": [...]}
+    """
+    return {"line": line, "errors": errors}
+
+
+def stream_decisions(
+    lines: Iterable[bytes], version: Version, fullresult: bool, chunk_size: int
+) -> Iterator[bytes]:
+    """
+    input: NDJSON lines with one entity each, the tree version, if full results are
+    wanted and how many entities are decided at once
+    read the lines lazily and decide them chunk by chunk like a bunch (see
+    decide_bunch), so only one chunk is held in memory
+    output: one NDJSON line per entity in input order, the result or the error
+    """
+    entities = parse_entities(lines)
+    while True:
+        chunk = list(islice(entities, chunk_size))
+        if not chunk:
+            return
+        yield decide_chunk(chunk, version, fullresult).encode()
+
+
+def decide_chunk(
+    entities: List[Tuple[int, Union[ExpertRequestIn, dict]]],
+    version: Version,
+    fullresult: bool,
+) -> str:
+    """
+    input: parsed entities and errors (see parse_entities), the tree version and if
+    full results are wanted
+    decide the entities as one bunch (see decide_bunch). if the evaluator fails for
+    the bunch, nothing of it is saved and the entities are decided one by one, so
+    only the entities it fails for get an error line
+    output: NDJSON with one line per entity in input order, the result or the error
+    """
+    valid = [entity for _, entity in entities if not isinstance(entity, dict)]
+    try:
+        results = iter(decide_bunch(valid, version, fullresult))
+    except EvaluatorException:
+        results = iter(decide_each(valid, version, fullresult))
+    lines = []
+    for number, entity in entities:
+        if not isinstance(entity, dict):
+            entity = next(results)
+        if isinstance(entity, EvaluatorException):
+            entity = entity_error(
+                number, [{"type": "evaluation_error", "msg": entity.message}]
+            )
+        lines.append(
+            (json.dumps(entity) if isinstance(entity, dict) else result_json(entity))
+            + "\n"
+        )
+    return "".join(lines)
+
+
+def decide_each(
+    entities: List[ExpertRequestIn], version: Version, fullresult: bool
+) -> Iterator[Union[FullResultOut, ShortResultOut, EvaluatorException]]:
+    """
+    output: the result of each entity decided as a bunch of its own, or the
+    EvaluatorException the evaluator raised for it
+    """
+    for entity in entities:
+        try:
+            yield decide_bunch([entity], version, fullresult)[0]
+        except EvaluatorException as error:
+            yield error
+
+
+# === /bunch/stream === decisions for a stream of entities ====================
+@router.post("/bunch/stream/{fullresult}")
+def decision_stream(request, fullresult: bool, kind_id: int = None):
+    """
+    Get recommendations for any number of entities, sent as **NDJSON** (one entity
+    per line, each like an item of **/decision/bunch/{fullresult}**). The body is read
+    while the response is written: the entities are decided and saved in chunks of
+    TREEXPERT_DECISION_STREAM_CHUNK_SIZE and the results are streamed back as NDJSON,
+    one line per entity in input order. A line that isn't a valid entity (or that
+    can't be evaluated, e.g. with a data type given twice) gets a line with its
+    **line** number and the **errors** instead of a result.
+    """
+    chunk_size = getattr(settings, "TREEXPERT_DECISION_STREAM_CHUNK_SIZE", 500)
+    return StreamingHttpResponse(
+        stream_decisions(request, get_version(kind_id), fullresult, chunk_size),
+        content_type="application/x-ndjson",
+    )
+
+
+def unsaved_request(expert_request: ExpertRequestIn, version: Version) -> ExpertRequest:
+    """
+    output: the request information for the response of a request that is not saved
+    """
+    return ExpertRequest(
+        identifier=expert_request.identifier,
+        sec_identifier=expert_request.sec_identifier,
+        version=version,
+    )
+
+
+# === /cache === statistics of the caches of this process ====================
+@router.get("/cache", response={200: dict})
+def cache_statistics(request):
+    """
+    Returns size, hits, misses and evictions of the caches of the worker process that
+    answers this request: **evaluators** (one per tree version) and **decisions**
+    (results of recently evaluated inputs, per tree version).
+    """
+    return {"evaluators": evaluator_cache.stats(), "decisions": decision_cache.stats()}
 
 
 DecisionLogOut = create_schema(
@@ -257,8 +544,75 @@ def decision_for_request(request, request_id: int):
     If you don't know your request id, get it using the endpoint
     /decision/requests/{identifier}/{secIdentifier} and choose the request that matches
     your time frame.
+    Decisions of old requests may have been compacted into the archive, they are
+    looked up there.
     """
-    return get_object_or_404(Decision, request__id=request_id)
+    try:
+        return Decision.objects.get(request__id=request_id)
+    except Decision.DoesNotExist:
+        decision = archived_decision(request_id)
+    if decision is None:
+        raise Http404("No Decision matches the given query.")
+    return decision
+
+
+def archived_decision(request_id: int) -> Optional[Decision]:
+    """
+    output: the unsaved decision of an archived request with its request, None if
+    the request isn't archived or has no decision
+    """
+    record = get_archive().get(request_id)
+    if record is None or record["decision"] is None:
+        return None
+    return Decision(
+        id=record["decision"]["id"],
+        request=ExpertRequest(
+            id=record["id"],
+            date=datetime.fromisoformat(record["date"]),
+            identifier=record["identifier"],
+            sec_identifier=record["sec_identifier"],
+            version_id=record["version"],
+        ),
+        description=record["decision"]["description"],
+        result=record["decision"]["result"],
+        end_leaf_id=record["decision"]["end_leaf"],
+        is_preliminary=record["decision"]["is_preliminary"],
+    )
+
+
+# === /explain/request_id === criteria of a logged decision ==========================
+@router.get(
+    "/explain/{int:request_id}", response={200: List[FullCriteriaOut], 404: str}
+)
+def explain_decision(request, request_id: int):
+    """
+    Returns the criteria of the saved decision for a previously made request, the
+    same list as **criteria** of /decision/true when the request was made. They are
+    rebuilt from the path through the tree that was saved with the decision and the
+    input data of the request, the tree is not run again.
+    Decisions saved before paths were saved have no criteria (404).
+    """
+    try:
+        decision = Decision.objects.select_related("request__version").get(
+            request__id=request_id
+        )
+    except Decision.DoesNotExist:
+        record = get_archive().get(request_id)
+        if record is None or record["decision"] is None:
+            raise Http404("No Decision matches the given query.")
+        path = record["decision"]["path"]
+        version = Version.objects.get(id=record["version"])
+        data = [
+            RequestData(type_id=type_id, value=value)
+            for _, type_id, value in record["data"]
+        ]
+    else:
+        path = saved_path(decision)
+        version = decision.request.version
+        data = load_request_data(request_id)
+    if path is None:
+        raise Http404("No path is saved for this decision.")
+    return list(get_evaluator_for_version(version).explain(path, data))
 
 
 class ExpertRequestOut(ModelSchema):
@@ -273,20 +627,100 @@ class ExpertRequestOut(ModelSchema):
     "/requests/{str:identifier}/{str:secIdentifier}",
     response={200: List[ExpertRequestOut], 404: str},
 )
-def requests_for_entity(request, identifier: str, secIdentifier: str):
+def requests_for_entity(
+    request, identifier: str, secIdentifier: str, page: Page = Query(...)
+):
     """
     Return all requests that are associated with this entity specified by the
-    identifier and second identifier as a list.
+    identifier and second identifier as a list, oldest first.
     This includes the date the request was made and the version id of the tree that
     was used.
 
+    For entities with a long history use **limit** to get at most this many requests
+    and **after** (the id of the last request of the previous page) for the next
+    page, or **stream**=true to get all of them as NDJSON (one request per line).
+
     To then get the decision/recommendation that was made use the endpoint
     /decision/result/{request_id}. To see the data that was given in this request use
     /decision/data/{request_id}.
+
+    Requests compacted into the archive are included, in the same order.
     """
-    return get_list_or_404(
-        ExpertRequest, identifier=identifier, sec_identifier=secIdentifier
+    requests = ExpertRequest.objects.filter(
+        identifier=identifier, sec_identifier=secIdentifier
     )
+    archived = archived_requests(identifier, secIdentifier)
+    if archived:
+        requests = merged_requests(requests, archived, page)
+        if page.stream:
+            return stream_ndjson(requests, ExpertRequestOut)
+        requests = list(requests)
+    else:
+        requests = paginated_response(
+            requests, ExpertRequestOut, page, order=("date", "id")
+        )
+    if not page.stream and page.after is None and not requests:
+        raise Http404("No ExpertRequest matches the given query.")
+    return requests
+
+
+def archived_requests(identifier: str, sec_identifier: str) -> List[ExpertRequest]:
+    """
+    output: the unsaved archived requests of this entity, oldest first
+    """
+    archive = get_archive()
+    requests = []
+    for request_id in archive.requests_for_entity(identifier, sec_identifier):
+        record = archive.get(request_id)
+        requests.append(
+            ExpertRequest(
+                id=record["id"],
+                date=datetime.fromisoformat(record["date"]),
+                identifier=record["identifier"],
+                sec_identifier=record["sec_identifier"],
+                version_id=record["version"],
+            )
+        )
+    return sorted(requests, key=lambda request: (request.date, request.id))
+
+
+def merged_requests(
+    queryset: QuerySet, archived: List[ExpertRequest], page: Page
+) -> Iterator[ExpertRequest]:
+    """
+    input: the saved and the archived requests of an entity and the page parameters
+    output: the requested page of both, ordered by date and id like paginate
+    """
+    if page.after is not None:
+        archived_by_id = {request.id: request for request in archived}
+        if page.after in archived_by_id:
+            anchor = (archived_by_id[page.after].date, page.after)
+        else:
+            anchor = (
+                ExpertRequest.objects.filter(id=page.after)
+                .values_list("date", "id")
+                .first()
+            )
+        if anchor is None:
+            # the request is gone, continue with the ids after it
+            archived = [request for request in archived if request.id > page.after]
+            queryset = queryset.filter(id__gt=page.after)
+        else:
+            archived = [
+                request for request in archived if (request.date, request.id) > anchor
+            ]
+            queryset = queryset.filter(
+                Q(date__gt=anchor[0]) | Q(date=anchor[0], id__gt=anchor[1])
+            )
+    queryset = queryset.order_by("date", "id")
+    if page.limit is not None:
+        queryset = queryset[: page.limit]
+    requests = heapq.merge(
+        archived,
+        queryset.iterator(),
+        key=lambda request: (request.date, request.id),
+    )
+    return islice(requests, page.limit)
 
 
 class RequestDataOut(ModelSchema):
@@ -304,8 +738,62 @@ def input_data_for_request(request, request_id: int):
     * **id**: the primary key to save this data object in the database.
     * **type**: the id of the datatype that this data object belongs to.
     * **value**: the value that was given, this can be an int, boolean or string
+
+    If the data of a request is saved as one document (TREEXPERT_REQUEST_DATA_STORAGE
+    "document" or "blob") the data objects have no id (null).
+
+    The data of old requests may have been compacted into the archive, it is looked
+    up there.
+    """
+    data_list = load_request_data(request_id) or archived_data(request_id)
+    if not data_list:
+        raise Http404("No RequestData matches the given query.")
+    return data_list
+
+
+def archived_data(request_id: int) -> List[RequestData]:
     """
-    return get_list_or_404(RequestData, request__id=request_id)
+    output: the unsaved data of an archived request, [] if it isn't archived
+    """
+    record = get_archive().get(request_id)
+    if record is None:
+        return []
+    return [
+        RequestData(id=data_id, type_id=type_id, value=value)
+        for data_id, type_id, value in record["data"]
+    ]
+
+
+class ExportQuery(Schema):
+    kind_id: int = None
+    start: datetime = None
+    end: datetime = None
+    compress: bool = False
+
+
+# === /export === all logged decisions of a tree kind and time range =============
+@router.get("/export")
+def export_decisions(request, query: ExportQuery = Query(...)):
+    """
+    Streams all requests that got a decision as NDJSON, one line per request with
+    its **id**, **date**, **identifier**, **sec_identifier**, **version** (id), the
+    input **data** as [data type id, value] pairs and the **decision** (description,
+    result, end_leaf, is_preliminary), ordered by request id.
+    Filter by tree kind (**kind_id**) and the time range from **start** (inclusive)
+    to **end** (exclusive). With **compress**=true the stream is gzip compressed.
+    The same export is available as management command export_decisions.
+    """
+    lines = ndjson(export_requests(query.kind_id, query.start, query.end))
+    if query.compress:
+        response = StreamingHttpResponse(
+            gzipped(lines), content_type="application/gzip"
+        )
+        filename = "decisions.ndjson.gz"
+    else:
+        response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+        filename = "decisions.ndjson"
+    response["Content-Disposition"] = 'attachment; filename="' + filename + '"'
+    return response
 
 
 # === /fullresult === get decision for one entity ============================
@@ -373,12 +861,37 @@ def decision_one_entity(
     * **explanation**: the explanation for this node and the successor
     """
     # if no tree_kind_id is supplied, the default tree (id 1) is used
-    # save request
-    saved_request, saved_request_data = save_request_data(expert_request, kind_id)
-    # build tree and get evaluator
-    evaluator = get_evaluator_for_version(version=saved_request.version)
-    # evaluate data given the tree and return decision response
-    decision, criteria = get_decision(evaluator, saved_request_data, saved_request)
+    version = get_version(kind_id)
+    hit = unlogged_cache_hit(expert_request, version)
+    if hit is not None:
+        # same input as a previous request, answered without saving anything
+        decision, criteria, _ = evaluate_decision(
+            hit, unsaved_request(expert_request, version)
+        )
+    elif write_behind_enabled():
+        # evaluate right away, the request is written later by the audit log
+        [saved_request], [saved_request_data] = build_requests(
+            [expert_request], version, allocate_request_ids(1)
+        )
+        evaluator = get_evaluator_for_version(version=version)
+        decision, criteria, decision_fields = evaluate_decision(
+            evaluate_cached(evaluator, version, saved_request_data), saved_request
+        )
+        get_audit_log().submit(
+            [saved_request], [saved_request_data], [Decision(**decision_fields)]
+        )
+    else:
+        with transaction.atomic():
+            # save request
+            saved_request, saved_request_data = save_request_data(
+                expert_request, version=version
+            )
+            # build tree and get evaluator
+            evaluator = get_evaluator_for_version(version=version)
+            # evaluate data given the tree and return decision response
+            decision, criteria = get_decision(
+                evaluator, saved_request_data, saved_request
+            )
     if fullresult:
         return 200, FullResultOut(decision=decision, criteria=criteria)
     else:
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DecisionConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "decision"
+
+    def ready(self):
+        # connect the signal receivers of the evaluator and data type caches
+        from . import cache, persistence  # noqa: F401
@@ -0,0 +1,351 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from core.cache import LRUCache
+from .evaluator import saved_path
+from .export import with_data
+from .models import Decision, ExpertRequest, RequestData
+from .partitions import bound, month_of, next_month
+
+# closed months of the decision log are compacted into segments in the archive
+# directory, one segment per month and run, named logs_<yyyymm>_<last request id>:
+#   .blocks    zlib compressed blocks of requests, each block a json object with one
+#              list per column (see COLUMNS)
+#   .idx       fixed size entries (request id, block offset, block length, row in
+#              block) sorted by request id, searched through a memory map
+#   .entities  zlib compressed json list of [identifier, sec_identifier, request ids]
+COLUMNS = (
+    "id",
+    "date",
+    "identifier",
+    "sec_identifier",
+    "version",
+    "data",
+    "decision_id",
+    "description",
+    "result",
+    "end_leaf",
+    "is_preliminary",
+    "path",
+)
+
+ENTRY = struct.Struct("<qQII")
+
+
+def archive_dir() -> Path:
+    return Path(
+        getattr(settings, "TREEXPERT_ARCHIVE_DIR", settings.BASE_DIR.parent / "archive")
+    )
+
+
+class SegmentWriter:
+    """
+    writes one segment, the files get their final names in close() so readers never
+    see a partly written segment
+    """
+
+    def __init__(self, path: Path, block_size: int):
+        self.path = path
+        self.block_size = block_size
+        self.rows = []
+        self.entries = []
+        self.entities = {}
+        self.blocks = open(self.temporary(".blocks"), "wb")
+        self.offset = 0
+
+    def temporary(self, suffix: str) -> Path:
+        return self.path.with_name(self.path.name + suffix + ".tmp")
+
+    def add(self, request: ExpertRequest, data_list: List[RequestData]):
+        try:
+            decision = request.decision
+        except Decision.DoesNotExist:
+            decision = None
+        self.rows.append(
+            (
+                request.id,
+                request.date.isoformat(),
+                request.identifier,
+                request.sec_identifier,
+                request.version_id,
+                [[data.id, data.type_id, data.value] for data in data_list],
+                decision and decision.id,
+                decision and decision.description,
+                decision and decision.result,
+                decision and decision.end_leaf_id,
+                decision and decision.is_preliminary,
+                decision and saved_path(decision),
+            )
+        )
+        self.entities.setdefault(
+            (request.identifier, request.sec_identifier), []
+        ).append(request.id)
+        if len(self.rows) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        block = zlib.compress(
+            json.dumps(dict(zip(COLUMNS, map(list, zip(*self.rows))))).encode(), 9
+        )
+        self.blocks.write(block)
+        for row, values in enumerate(self.rows):
+            self.entries.append(ENTRY.pack(values[0], self.offset, len(block), row))
+        self.offset += len(block)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        with open(self.temporary(".entities"), "wb") as file:
+            file.write(
+                zlib.compress(
+                    json.dumps(
+                        [
+                            [identifier, sec_identifier, ids]
+                            for (
+                                identifier,
+                                sec_identifier,
+                            ), ids in self.entities.items()
+                        ]
+                    ).encode(),
+                    9,
+                )
+            )
+            os.fsync(file.fileno())
+        with open(self.temporary(".idx"), "wb") as file:
+            file.write(b"".join(self.entries))
+            os.fsync(file.fileno())
+        os.fsync(self.blocks.fileno())
+        self.blocks.close()
+        # the index last, a segment is found by its index
+        for suffix in (".blocks", ".entities", ".idx"):
+            os.replace(self.temporary(suffix), self.path.with_suffix(suffix))
+
+    def remove(self):
+        for suffix in (".idx", ".entities", ".blocks"):
+            self.path.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def compact_month(
+    month: date,
+    directory: Path = None,
+    block_size: int = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> int:
+    """
+    input: the month to compact
+    write all requests of this month with their data and decision to a new archive
+    segment and delete them from the database
+    output: number of archived requests
+    """
+    directory = Path(directory or archive_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    if block_size is None:
+        block_size = getattr(settings, "TREEXPERT_ARCHIVE_BLOCK_SIZE", 1000)
+    chunk_size = getattr(settings, "TREEXPERT_STREAM_CHUNK_SIZE", 2000)
+    start, end = bound(month), bound(next_month(month))
+    requests = ExpertRequest.objects.using(using).filter(date__gte=start, date__lt=end)
+    last_id = requests.order_by("-id").values_list("id", flat=True).first()
+    if last_id is None:
+        return 0
+    requests = requests.filter(id__lte=last_id)
+    data = RequestData.objects.using(using).filter(
+        request_date__gte=start, request_date__lt=end, request_id__lte=last_id
+    )
+
+    writer = SegmentWriter(
+        directory / ("logs_" + month.strftime("%Y%m") + "_" + str(last_id)),
+        block_size,
+    )
+    archived = 0
+    with transaction.atomic(using=using):
+        for request, data_list in with_data(
+            requests.select_related("decision", "input_blob")
+            .order_by("id")
+            .iterator(chunk_size=chunk_size),
+            data.order_by("request_id", "id").iterator(chunk_size=chunk_size),
+        ):
+            writer.add(request, data_list)
+            archived += 1
+        writer.close()
+        try:
+            with connections[using].cursor() as cursor:
+                for model, key, column in (
+                    (RequestData, "request_date", "request_id"),
+                    (Decision, "request_date", "request_id"),
+                    (ExpertRequest, "date", "id"),
+                ):
+                    cursor.execute(
+                        "DELETE FROM %s WHERE %s >= %%s AND %s < %%s AND %s <= %%s"
+                        % (model._meta.db_table, key, key, column),
+                        [start, end, last_id],
+                    )
+        except Exception:
+            writer.remove()
+            raise
+    return archived
+
+
+def compact_logs(
+    before: date, directory: Path = None, using: str = DEFAULT_DB_ALIAS
+) -> Dict[date, int]:
+    """
+    input: the first month to keep in the database
+    compact every month before it that has requests
+    output: number of archived requests per compacted month
+    """
+    first = (
+        ExpertRequest.objects.using(using)
+        .filter(date__lt=bound(before))
+        .order_by("date")
+        .values_list("date", flat=True)
+        .first()
+    )
+    compacted = {}
+    if first is None:
+        return compacted
+    month = month_of(first)
+    while month < before:
+        archived = compact_month(month, directory, using=using)
+        if archived:
+            compacted[month] = archived
+        month = next_month(month)
+    return compacted
+
+
+class Segment:
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path.with_suffix(".idx"), "rb") as file:
+            self.index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(path.with_suffix(".blocks"), "rb") as file:
+            self.blocks = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.index) // ENTRY.size
+        self.first = self.entry(0)[0]
+        self.last = self.entry(self.size - 1)[0]
+        self._entities = None
+
+    def entry(self, position: int) -> Tuple[int, int, int, int]:
+        return ENTRY.unpack_from(self.index, position * ENTRY.size)
+
+    def find(self, request_id: int) -> Optional[Tuple[int, int, int]]:
+        """
+        output: (block offset, block length, row) of this request or None
+        """
+        if not self.first <= request_id <= self.last:
+            return None
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < request_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size:
+            entry = self.entry(low)
+            if entry[0] == request_id:
+                return entry[1:]
+        return None
+
+    def block(self, offset: int, length: int) -> dict:
+        return json.loads(zlib.decompress(self.blocks[offset : offset + length]))
+
+    def entities(self) -> Dict[Tuple[str, str], List[int]]:
+        if self._entities is None:
+            entities = json.loads(
+                zlib.decompress(self.path.with_suffix(".entities").read_bytes())
+            )
+            self._entities = {
+                (identifier, sec_identifier): ids
+                for identifier, sec_identifier, ids in entities
+            }
+        return self._entities
+
+
+class Archive:
+    """
+    read only view of the segments in an archive directory, segments written by
+    compaction after it was created are found on the next lookup
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.segments = []
+        self.blocks = LRUCache(getattr(settings, "TREEXPERT_ARCHIVE_BLOCK_CACHE", 16))
+        self._modified = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> List[Segment]:
+        try:
+            modified = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if modified != self._modified:
+                self.segments = [
+                    Segment(path.with_suffix(""))
+                    for path in sorted(self.directory.glob("logs_*.idx"))
+                ]
+                self._modified = modified
+            return self.segments
+
+    def get(self, request_id: int) -> Optional[dict]:
+        """
+        output: the archived request with its data (list of [id, type, value]) and
+        decision (None if the request has none), None if it isn't archived
+        """
+        for segment in self.refresh():
+            location = segment.find(request_id)
+            if location is None:
+                continue
+            offset, length, row = location
+            block = self.blocks.get_or_load(
+                (segment.path, offset), lambda: segment.block(offset, length)
+            )
+            record = {column: block[column][row] for column in COLUMNS}
+            if record["decision_id"] is None:
+                record["decision"] = None
+            else:
+                record["decision"] = {
+                    "id": record["decision_id"],
+                    "description": record["description"],
+                    "result": record["result"],
+                    "end_leaf": record["end_leaf"],
+                    "is_preliminary": record["is_preliminary"],
+                    "path": record["path"],
+                }
+            for column in COLUMNS[6:]:
+                del record[column]
+            return record
+        return None
+
+    def requests_for_entity(self, identifier: str, sec_identifier: str) -> List[int]:
+        """
+        output: ids of the archived requests of this entity
+        """
+        ids = []
+        for segment in self.refresh():
+            ids.extend(segment.entities().get((identifier, sec_identifier), []))
+        return sorted(ids)
+
+
+_archives = {}
+
+
+def get_archive() -> Archive:
+    directory = archive_dir()
+    archive = _archives.get(directory)
+    if archive is None:
+        archive = _archives.setdefault(directory, Archive(directory))
+    return archive
@@ -0,0 +1,222 @@
+import asyncio
+from typing import List, Union
+
+from asgiref.sync import sync_to_async
+from ninja import Router
+
+from django.http import Http404, HttpResponse
+
+from tree.cache import aget_current_version
+from tree.models import TreeLeaf, Version
+from .api import (
+    DecisionLogOut,
+    ExpertRequestIn,
+    FullResultOut,
+    RequestDataOut,
+    ShortResultOut,
+    archived_data,
+    archived_decision,
+    evaluate_decision,
+    result_json,
+    unlogged_cache_hit,
+    unsaved_request,
+)
+from .audit import get_audit_log, write_behind_enabled
+from .cache import aget_cached_evaluator, evaluate_cached, evaluate_many_cached
+from .models import Decision, ExpertRequest, RequestData
+from .persistence import (
+    aknown_data_types,
+    aload_request_data,
+    allocate_request_ids,
+    build_requests,
+    write_requests,
+)
+
+# the decision endpoints as async views for ASGI servers (see README), mounted at
+# /decision/async/. they read with the async ORM and take the current version and
+# the evaluator from the caches without blocking, only cache misses and the writes
+# (one transaction) run in a thread. evaluating is CPU bound and runs inline.
+
+router = Router(tags=["decision (async)"])
+
+
+async def build(expert_requests: List[ExpertRequestIn], version: Version):
+    """
+    output: the unsaved requests and their data (see persistence.build_requests),
+    with preallocated ids if they are written by the audit log
+    """
+    known = await aknown_data_types(
+        {
+            data.data_type
+            for expert_request in expert_requests
+            for data in expert_request.data or []
+        }
+    )
+    ids = None
+    if write_behind_enabled() and expert_requests:
+        ids = await sync_to_async(allocate_request_ids)(len(expert_requests))
+    return build_requests(expert_requests, version, ids, known)
+
+
+async def save(
+    requests: List[ExpertRequest],
+    data_lists: List[List[RequestData]],
+    decisions: List[Decision],
+):
+    """
+    hand everything about these requests to the audit log or write it in one
+    transaction
+    """
+    if not requests:
+        return
+    if write_behind_enabled():
+        # submit writes the spool file and waits while the queue is full
+        await sync_to_async(get_audit_log().submit)(requests, data_lists, decisions)
+    else:
+        await sync_to_async(write_requests)(requests, data_lists, decisions)
+
+
+async def start(coroutine) -> asyncio.Future:
+    """
+    output: the running task of this coroutine, it runs until it waits for the first
+    time (e.g. for the thread that writes) before this returns
+    """
+    task = asyncio.ensure_future(coroutine)
+    await asyncio.sleep(0)
+    return task
+
+
+# === /async/fullresult === get decision for one entity ======================
+@router.post(
+    "/{fullresult}",
+    response={200: Union[FullResultOut, ShortResultOut], 400: str, 500: str},
+    exclude_unset=True,
+    exclude_none=True,
+)
+async def decision_one_entity(
+    request, expert_request: ExpertRequestIn, fullresult: bool, kind_id: int = None
+):
+    """
+    Get a recommendation for one entity, same input and output as
+    **/decision/{fullresult}**. The request is saved while the response is built.
+    """
+    version = await aget_current_version(kind_id)
+    hit = unlogged_cache_hit(
+        expert_request,
+        version,
+        await aknown_data_types({data.data_type for data in expert_request.data or []}),
+    )
+    saving = None
+    if hit is not None:
+        # same input as a previous request, answered without saving anything
+        decision, criteria, _ = evaluate_decision(
+            hit, unsaved_request(expert_request, version)
+        )
+    else:
+        [saved_request], [saved_request_data] = await build([expert_request], version)
+        evaluator = await aget_cached_evaluator(version)
+        decision, criteria, decision_fields = evaluate_decision(
+            evaluate_cached(evaluator, version, saved_request_data), saved_request
+        )
+        saving = await start(
+            save([saved_request], [saved_request_data], [Decision(**decision_fields)])
+        )
+    if fullresult:
+        content = result_json(FullResultOut(decision=decision, criteria=criteria))
+    else:
+        content = result_json(ShortResultOut(decision=decision, criteria=criteria))
+    if saving is not None:
+        await saving
+    return HttpResponse(content, content_type="application/json")
+
+
+# === /async/bunch === get decisions for a bunch of entities =================
+@router.post(
+    "/bunch/{fullresult}",
+    response={200: List[Union[FullResultOut, ShortResultOut]]},
+    exclude_unset=True,
+    exclude_none=True,
+)
+async def decision_bunch(
+    request, data: List[ExpertRequestIn], fullresult: bool, kind_id: int = None
+):
+    """
+    Get recommendations for a number of entities, same input and output as
+    **/decision/bunch/{fullresult}**. The requests are saved while the response is
+    built.
+    """
+    version = await aget_current_version(kind_id)
+    known = await aknown_data_types(
+        {
+            value.data_type
+            for expert_request in data
+            for value in expert_request.data or []
+        }
+    )
+    hits = [
+        unlogged_cache_hit(expert_request, version, known) for expert_request in data
+    ]
+    unsaved = [expert_request for expert_request, hit in zip(data, hits) if hit is None]
+    saved_requests, saved_requests_data = await build(unsaved, version)
+    evaluator = await aget_cached_evaluator(version)
+    results = iter(
+        zip(
+            evaluate_many_cached(evaluator, version, saved_requests_data),
+            saved_requests,
+        )
+    )
+
+    response_list = []
+    decisions = []
+    for expert_request, hit in zip(data, hits):
+        if hit is None:
+            result, saved_request = next(results)
+            decision, criteria, decision_fields = evaluate_decision(
+                result, saved_request
+            )
+            decisions.append(Decision(**decision_fields))
+        else:
+            decision, criteria, _ = evaluate_decision(
+                hit, unsaved_request(expert_request, version)
+            )
+        if fullresult:
+            response_list.append(FullResultOut(decision=decision, criteria=criteria))
+        else:
+            response_list.append(ShortResultOut(decision=decision, criteria=criteria))
+    saving = await start(save(saved_requests, saved_requests_data, decisions))
+    content = result_json(response_list)
+    await saving
+    return HttpResponse(content, content_type="application/json")
+
+
+# === /async/result/request_id === get logged decision for a request =========
+@router.get("/result/{int:request_id}", response={200: DecisionLogOut, 404: str})
+async def decision_for_request(request, request_id: int):
+    """
+    Same as **/decision/result/{request_id}**.
+    """
+    try:
+        return await Decision.objects.select_related("request", "end_leaf").aget(
+            request__id=request_id
+        )
+    except Decision.DoesNotExist:
+        decision = await sync_to_async(archived_decision)(request_id)
+    if decision is None:
+        raise Http404("No Decision matches the given query.")
+    if decision.end_leaf_id is not None:
+        decision.end_leaf = await TreeLeaf.objects.aget(id=decision.end_leaf_id)
+    return decision
+
+
+# === /async/data/request_id === retrieve all data from a specific request ===
+@router.get("/data/{int:request_id}", response={200: List[RequestDataOut], 418: str})
+async def input_data_for_request(request, request_id: int):
+    """
+    Same as **/decision/data/{request_id}**.
+    """
+    data_list = await aload_request_data(request_id)
+    if not data_list:
+        data_list = await sync_to_async(archived_data)(request_id)
+    if not data_list:
+        raise Http404("No RequestData matches the given query.")
+    return data_list
@@ -0,0 +1,316 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection
+
+from .evaluator import pack_path, saved_path
+from .models import Decision, ExpertRequest, RequestData
+from .persistence import write_requests
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled() -> bool:
+    """
+    output: True if requests, their data and decisions are written by the audit log
+    after the response instead of before it
+    """
+    return getattr(settings, "TREEXPERT_AUDIT_WRITE_BEHIND", False)
+
+
+def to_record(
+    request: ExpertRequest, data_list: List[RequestData], decision: Decision
+) -> dict:
+    """
+    output: everything that is saved about one request as a json serializable dict
+    """
+    return {
+        "id": request.id,
+        "date": request.date.isoformat(),
+        "identifier": request.identifier,
+        "sec_identifier": request.sec_identifier,
+        "version": request.version_id,
+        "data": [[data.type_id, data.value] for data in data_list],
+        "decision": {
+            "description": decision.description,
+            "result": decision.result,
+            "end_leaf": decision.end_leaf_id,
+            "is_preliminary": decision.is_preliminary,
+            "path": saved_path(decision),
+        },
+    }
+
+
+def from_record(record: dict) -> Tuple[ExpertRequest, List[RequestData], Decision]:
+    """
+    output: the unsaved request, data and decision of a record (see to_record)
+    """
+    request = ExpertRequest(
+        id=record["id"],
+        date=datetime.fromisoformat(record["date"]),
+        identifier=record["identifier"],
+        sec_identifier=record["sec_identifier"],
+        version_id=record["version"],
+    )
+    data_list = [
+        RequestData(
+            request=request, request_date=request.date, type_id=type_id, value=value
+        )
+        for type_id, value in record["data"]
+    ]
+    decision = Decision(
+        request=request,
+        request_date=request.date,
+        description=record["decision"]["description"],
+        result=record["decision"]["result"],
+        end_leaf_id=record["decision"]["end_leaf"],
+        is_preliminary=record["decision"]["is_preliminary"],
+    )
+    # records written before paths were saved have none
+    if record["decision"].get("path") is not None:
+        decision.path, decision.path_results = pack_path(record["decision"]["path"])
+    return request, data_list, decision
+
+
+class AuditLog:
+    """
+    write-behind log for ExpertRequest, RequestData and Decision rows.
+    submitted records are appended to a spool file of this process and put on a
+    bounded queue (submit waits while it is full), a background thread writes them in
+    batches. the spool file is emptied whenever everything in it has been written, so
+    it only holds records that may not be in the database yet. spool files of
+    processes that are gone are taken over when the log is opened. writing a record
+    twice is harmless: records whose request id already exists are skipped.
+    """
+
+    def __init__(
+        self,
+        spool_dir,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        self.spool_dir = Path(spool_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=queue_size)
+        # records to write before the queue: taken over or failed to be written
+        self.backlog = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spool = None
+        self._pending = 0  # records in the spool file that may not be written yet
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def open(self):
+        """
+        open the spool file of this process and take over the spool files that were
+        left behind by other processes
+        """
+        with self._lock:
+            if self._spool is not None:
+                return
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            spool = open(
+                self.spool_dir / ("audit-" + str(self.pid) + ".jsonl"),
+                "a+",
+                encoding="utf-8",
+            )
+            # the lock tells other processes that this spool file is in use
+            fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            spool.seek(0)
+            self.backlog.extend(json.loads(line) for line in spool if line.strip())
+            self._pending = len(self.backlog)
+            self._spool = spool
+            for path in self.spool_dir.glob("audit-*.jsonl"):
+                if path.name != Path(spool.name).name:
+                    self._take_over(path)
+
+    def _take_over(self, path: Path):
+        """
+        copy the records of the spool file of another process into the own spool
+        file and backlog, if the process is gone (call with self._lock held)
+        """
+        with open(path, "r", encoding="utf-8") as other:
+            try:
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # still in use
+            lines = [line for line in other if line.strip()]
+            if lines:
+                self._spool.write("".join(lines))
+                self._spool.flush()
+                os.fsync(self._spool.fileno())
+                self.backlog.extend(json.loads(line) for line in lines)
+                self._pending += len(lines)
+                logger.info("audit log: took over %d records of %s", len(lines), path)
+            path.unlink()
+
+    def start(self):
+        """
+        open the log and start the background thread that writes the records
+        """
+        self.open()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="treexpert-audit-log", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """
+        stop the background thread after a last flush, records that could not be
+        written stay in the spool file
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+
+    def submit(
+        self,
+        requests: List[ExpertRequest],
+        data_lists: List[List[RequestData]],
+        decisions: List[Decision],
+    ):
+        """
+        input: requests with preallocated ids, their data and their decisions
+        spool the records and queue them to be written
+        """
+        self.open()
+        records = [
+            to_record(request, data_list, decision)
+            for request, data_list, decision in zip(requests, data_lists, decisions)
+        ]
+        with self._lock:
+            self._spool.write("".join(json.dumps(record) + "\n" for record in records))
+            self._spool.flush()
+            self._pending += len(records)
+        for record in records:
+            self.queue.put(record)
+        if self.queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def waiting(self) -> int:
+        """
+        output: number of submitted records that have not been written yet
+        """
+        return self._pending
+
+    def flush(self) -> int:
+        """
+        write all records that are waiting in batches
+        output: number of written records, stops at the first batch that fails
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self.backlog[: self.batch_size]
+                del self.backlog[: self.batch_size]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return written
+                if not self._write(batch):
+                    self.backlog[:0] = batch
+                    return written
+                written += len(batch)
+
+    def _write(self, batch: List[dict]) -> bool:
+        """
+        write one batch, if a single record violates a constraint (e.g. its data type
+        was deleted in the meantime) it is logged and dropped
+        output: False if the batch has to be written again later
+        """
+        try:
+            self._write_records(batch)
+        except IntegrityError:
+            for record in batch:
+                try:
+                    self._write_records([record])
+                except IntegrityError:
+                    logger.exception("audit log: dropped record %s", json.dumps(record))
+                except DatabaseError:
+                    logger.exception("audit log: writing records failed")
+                    return False
+        except DatabaseError:
+            logger.exception("audit log: writing %d records failed", len(batch))
+            return False
+        with self._lock:
+            self._pending -= len(batch)
+            if self._pending == 0 and self._spool is not None:
+                self._spool.seek(0)
+                self._spool.truncate()
+        return True
+
+    def _write_records(self, records: List[dict]):
+        existing = set(
+            ExpertRequest.objects.filter(
+                id__in=[record["id"] for record in records]
+            ).values_list("id", flat=True)
+        )
+        requests, data_lists, decisions = [], [], []
+        for record in records:
+            if record["id"] not in existing:
+                request, data_list, decision = from_record(record)
+                requests.append(request)
+                data_lists.append(data_list)
+                decisions.append(decision)
+        write_requests(requests, data_lists, decisions)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self.backlog:
+                # the database may be gone, reconnect for the next try
+                connection.close()
+        self.flush()
+        connection.close()
+
+
+_audit_log = None
+_audit_log_lock = threading.Lock()
+
+
+def get_audit_log() -> AuditLog:
+    """
+    output: the started audit log of this process (a forked worker gets its own)
+    """
+    global _audit_log
+    with _audit_log_lock:
+        if _audit_log is None or _audit_log.pid != os.getpid():
+            _audit_log = AuditLog(
+                getattr(
+                    settings,
+                    "TREEXPERT_AUDIT_SPOOL_DIR",
+                    Path(settings.BASE_DIR).parent / "spool",
+                ),
+                queue_size=getattr(settings, "TREEXPERT_AUDIT_QUEUE_SIZE", 10000),
+                batch_size=getattr(settings, "TREEXPERT_AUDIT_BATCH_SIZE", 500),
+                flush_interval=getattr(settings, "TREEXPERT_AUDIT_FLUSH_INTERVAL", 1.0),
+            )
+            _audit_log.start()
+        return _audit_log
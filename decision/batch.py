@@ -0,0 +1,211 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from .compiled import (
+    EQUAL,
+    GREATERTHAN,
+    MISSING,
+    NOTEQUAL,
+    SMALLERTHAN,
+    CompiledTree,
+    compare,
+)
+
+# integers beyond this can't be compared exactly as float64 and are compared in
+# python instead
+EXACT_FLOAT_LIMIT = 2**53
+
+
+class EncodedBatch:
+    """
+    column matrix of the inputs of many entities for one compiled tree. there is one
+    column per data type of the tree (see CompiledTree.data_types):
+    - values: numeric value of every single int/bool/float input
+    - missing: True if the entity has no input for this column
+    - numeric: True if values holds the input, everything else (strings, lists, ...)
+    is compared in python using the original rows
+    """
+
+    def __init__(self, compiled: CompiledTree, rows: List[List[any]]):
+        size = (len(rows), len(compiled.data_types))
+        self.rows = rows
+        self.values = np.zeros(size, dtype=np.float64)
+        self.missing = np.zeros(size, dtype=bool)
+        self.numeric = np.zeros(size, dtype=bool)
+        for i, row in enumerate(rows):
+            for column, value in enumerate(row):
+                if value is MISSING:
+                    self.missing[i, column] = True
+                elif type(value) in (int, bool, float) and (
+                    -EXACT_FLOAT_LIMIT <= value <= EXACT_FLOAT_LIMIT
+                ):
+                    self.values[i, column] = value
+                    self.numeric[i, column] = True
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class BatchResult:
+    """
+    outcome of a batch run, one entry per entity:
+    - leaf: index of the end leaf or -1 if data is missing
+    - missing: index of the node that is missing data or -1
+    - path: (steps x entities) matrix of the visited node indices, -1 after the end
+    - results: (steps x entities) matrix of the comparison results along the path
+    """
+
+    def __init__(self, leaf, missing, path, results):
+        self.leaf = leaf
+        self.missing = missing
+        self.path = path
+        self.results = results
+
+    def walk(self, entity: int) -> Tuple[List[int], List[bool], int, int]:
+        """
+        output: the same tuple CompiledTree.walk returns for this entity
+        """
+        steps = self.path[:, entity]
+        length = int(np.count_nonzero(steps >= 0))
+        return (
+            steps[:length].tolist(),
+            self.results[:length, entity].tolist(),
+            int(self.leaf[entity]),
+            int(self.missing[entity]),
+        )
+
+    def walks(self) -> List[Tuple[List[int], List[bool], int, int]]:
+        """
+        output: walk(entity) for all entities, converted at once
+        """
+        lengths = np.count_nonzero(self.path >= 0, axis=0).tolist()
+        return [
+            (path[:length], results[:length], leaf, missing)
+            for path, results, leaf, missing, length in zip(
+                self.path.T.tolist(),
+                self.results.T.tolist(),
+                self.leaf.tolist(),
+                self.missing.tolist(),
+                lengths,
+            )
+        ]
+
+    def __len__(self):
+        return len(self.leaf)
+
+
+class BatchEngine:
+    """
+    evaluates many entities at once by advancing all of them one tree level at a
+    time. single numeric inputs are compared vectorized with numpy, all other inputs
+    (strings, lists) fall back to the python comparison of the compiled tree, so the
+    results are the same as running CompiledTree.walk for every entity.
+    """
+
+    def __init__(self, compiled: CompiledTree):
+        self.compiled = compiled
+        self.column = np.frombuffer(compiled.column, dtype=np.int64)
+        self.opcode = np.frombuffer(compiled.opcode, dtype=np.int8)
+        self.true_child = np.frombuffer(compiled.true_child, dtype=np.int64)
+        self.false_child = np.frombuffer(compiled.false_child, dtype=np.int64)
+        self.threshold = np.zeros(len(compiled.node_ids), dtype=np.float64)
+        # nodes that can be compared vectorized: known opcode and numeric threshold
+        self.vectorized = np.zeros(len(compiled.node_ids), dtype=bool)
+        for node, threshold in enumerate(compiled.threshold):
+            if (
+                self.opcode[node] >= 0
+                and type(threshold) in (int, bool, float)
+                and -EXACT_FLOAT_LIMIT <= threshold <= EXACT_FLOAT_LIMIT
+            ):
+                self.threshold[node] = threshold
+                self.vectorized[node] = True
+
+    def encode(self, rows: List[List[any]]) -> EncodedBatch:
+        return EncodedBatch(self.compiled, rows)
+
+    def run(self, batch: EncodedBatch) -> BatchResult:
+        count = len(batch)
+        current = np.zeros(count, dtype=np.int64)
+        active = np.ones(count, dtype=bool)
+        leaf = np.full(count, -1, dtype=np.int64)
+        missing = np.full(count, -1, dtype=np.int64)
+        path = []
+        results = []
+
+        while count and active.any():
+            entities = np.flatnonzero(active)
+            nodes = current[entities]
+            columns = self.column[nodes]
+
+            # entities without input for their current node stop here
+            absent = batch.missing[entities, columns]
+            if absent.any():
+                missing[entities[absent]] = nodes[absent]
+                active[entities[absent]] = False
+                entities = entities[~absent]
+                nodes = nodes[~absent]
+                columns = columns[~absent]
+            if not entities.size:
+                break
+
+            # compare all numeric inputs at once
+            values = batch.values[entities, columns]
+            thresholds = self.threshold[nodes]
+            opcodes = self.opcode[nodes]
+            result = np.select(
+                [
+                    opcodes == GREATERTHAN,
+                    opcodes == SMALLERTHAN,
+                    opcodes == EQUAL,
+                    opcodes == NOTEQUAL,
+                ],
+                [
+                    values > thresholds,
+                    values < thresholds,
+                    values == thresholds,
+                    values != thresholds,
+                ],
+                default=False,
+            )
+            # and everything else one by one
+            fallback = np.flatnonzero(
+                ~(batch.numeric[entities, columns] & self.vectorized[nodes])
+            )
+            compiled = self.compiled
+            for position, node, entity, column in zip(
+                fallback.tolist(),
+                nodes[fallback].tolist(),
+                entities[fallback].tolist(),
+                columns[fallback].tolist(),
+            ):
+                result[position] = compare(
+                    compiled.opcode[node],
+                    compiled.list_opcode[node],
+                    compiled.threshold[node],
+                    batch.rows[entity][column],
+                )
+
+            step = np.full(count, -1, dtype=np.int64)
+            step[entities] = nodes
+            step_results = np.zeros(count, dtype=bool)
+            step_results[entities] = result
+            path.append(step)
+            results.append(step_results)
+
+            successors = np.where(
+                result, self.true_child[nodes], self.false_child[nodes]
+            )
+            current[entities] = successors
+            ended = successors < 0
+            leaf[entities[ended]] = ~successors[ended]
+            active[entities[ended]] = False
+
+        if path:
+            return BatchResult(leaf, missing, np.stack(path), np.stack(results))
+        return BatchResult(
+            leaf,
+            missing,
+            np.empty((0, count), dtype=np.int64),
+            np.empty((0, count), dtype=bool),
+        )
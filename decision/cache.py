@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.cache import LRUCache
+from core.models import DataType
+from tree.models import Tree, Version
+from tree.signals import tree_published
+from .evaluator import EvaluationResult, Evaluator
+from .models import RequestData
+from .pool import evaluate_in_pool, pool_workers
+from .treefile import read_tree_file, remove_tree_file, tree_file_dir, write_tree_file
+
+logger = logging.getLogger(__name__)
+
+# ready to run evaluators by Version.id. a published version never changes, so an
+# entry only has to go when its version is saved again (valid flag) or deleted.
+# the signals below only reach this process, other worker processes drop their
+# entries by size or age (TREEXPERT_EVALUATOR_CACHE_MAX_AGE).
+evaluator_cache = LRUCache(
+    max_size=getattr(settings, "TREEXPERT_EVALUATOR_CACHE_SIZE", 32),
+    max_age=getattr(settings, "TREEXPERT_EVALUATOR_CACHE_MAX_AGE", None),
+)
+
+# evaluation results by (Version.id, canonical input). the tree of a version never
+# changes, so the same input always has the same result and entries only leave the
+# cache by size or age. a size of 0 turns it off.
+decision_cache = LRUCache(
+    max_size=getattr(settings, "TREEXPERT_DECISION_CACHE_SIZE", 10000),
+    max_age=getattr(settings, "TREEXPERT_DECISION_CACHE_MAX_AGE", None),
+)
+
+
+def load_evaluator_from_database(version: Version) -> Evaluator:
+    """
+    load the complete tree of this version from the database and build an evaluator
+    """
+    tree = Tree.objects.get_complete_tree(version)
+    return Evaluator(tree=tree[0], nodes=tree[1], leafs=tree[2])
+
+
+def load_evaluator(version: Version) -> Evaluator:
+    """
+    build the evaluator of this version from its tree file (see treefile). without
+    a file it is loaded from the database and the file is written for the next
+    process.
+    """
+    evaluator = read_tree_file(version)
+    if evaluator is None:
+        evaluator = load_evaluator_from_database(version)
+        try:
+            write_tree_file(version, evaluator)
+        except OSError as error:
+            logger.warning("tree file of version %s not written: %s", version.id, error)
+    return evaluator
+
+
+def get_cached_evaluator(version: Version) -> Evaluator:
+    """
+    output: an evaluator for this version, loaded from the database only on a cache
+    miss. the cached evaluator is shared between requests and threads, so use its
+    evaluate methods which keep no state in the evaluator.
+    """
+    return evaluator_cache.get_or_load(version.id, lambda: load_evaluator(version))
+
+
+async def aget_cached_evaluator(version: Version) -> Evaluator:
+    """
+    like get_cached_evaluator for async views, an evaluator that is not cached is
+    loaded in a thread
+    """
+    evaluator = evaluator_cache.get(version.id)
+    if evaluator is None:
+        evaluator = await sync_to_async(get_cached_evaluator)(version)
+    return evaluator
+
+
+def canonical_input(data: Iterable[Tuple[int, any]]) -> Optional[str]:
+    """
+    input: (data type id, value) pairs of one entity in any order
+    output: hash of the data map that is the same for the same input, None if a data
+    type is given twice (the evaluator rejects this input)
+    """
+    data = sorted(data, key=lambda pair: pair[0])
+    if any(first[0] == second[0] for first, second in zip(data, data[1:])):
+        return None
+    encoded = json.dumps(data, separators=(",", ":"), sort_keys=True)
+    return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+
+
+def decision_key(version: Version, data: Iterable[Tuple[int, any]]) -> Optional[tuple]:
+    """
+    output: key of this input in the decision cache, None if it is not cached
+    """
+    if decision_cache.max_size <= 0:
+        return None
+    digest = canonical_input(data)
+    return None if digest is None else (version.id, digest)
+
+
+def cached_result(
+    version: Version, data: Iterable[Tuple[int, any]]
+) -> Optional[EvaluationResult]:
+    """
+    output: the cached result for this input or None
+    """
+    key = decision_key(version, data)
+    return None if key is None else decision_cache.get(key)
+
+
+def evaluate_cached(
+    evaluator: Evaluator, version: Version, data: List[RequestData]
+) -> EvaluationResult:
+    """
+    input: the evaluator of this version and the data of one entity
+    output: the cached result for this input or the result of the evaluator
+    """
+    key = decision_key(version, ((value.type_id, value.value) for value in data))
+    if key is None:
+        return evaluator.evaluate(data)
+    return decision_cache.get_or_load(key, lambda: evaluator.evaluate(data))
+
+
+def evaluate_many_cached(
+    evaluator: Evaluator, version: Version, data_lists: List[List[RequestData]]
+) -> List[EvaluationResult]:
+    """
+    input: the evaluator of this version and the data of many entities
+    output: one result per entity, inputs that are not cached are evaluated together
+    by the batch engine if there are enough of them, by the process pool if there are
+    even more (see pool)
+    """
+    keys = [
+        decision_key(version, ((value.type_id, value.value) for value in data))
+        for data in data_lists
+    ]
+    results = [None if key is None else decision_cache.get(key) for key in keys]
+    todo = [index for index, result in enumerate(results) if result is None]
+    if pool_workers() and len(todo) >= getattr(
+        settings, "TREEXPERT_PROCESS_POOL_MIN_SIZE", 10000
+    ):
+        evaluated = evaluate_in_pool(
+            evaluator, version, [data_lists[index] for index in todo]
+        )
+    elif len(todo) >= getattr(settings, "TREEXPERT_BATCH_ENGINE_MIN_SIZE", 1000):
+        evaluated = evaluator.evaluate_batch([data_lists[index] for index in todo])
+    else:
+        evaluated = [evaluator.evaluate(data_lists[index]) for index in todo]
+    for index, result in zip(todo, evaluated):
+        results[index] = result
+        if keys[index] is not None:
+            decision_cache.put(keys[index], result)
+    return results
+
+
+@receiver(tree_published)
+def cache_published_tree(sender, tree: Tree, version: Version, **kwargs):
+    evaluator_cache.put(version.id, load_evaluator(version))
+
+
+@receiver(post_save, sender=Version)
+@receiver(post_delete, sender=Version)
+def invalidate_version(sender, instance: Version, **kwargs):
+    evaluator_cache.invalidate(instance.id)
+
+
+@receiver(post_delete, sender=Version)
+def remove_version_file(sender, instance: Version, **kwargs):
+    remove_tree_file(instance)
+
+
+@receiver(post_save, sender=DataType)
+@receiver(pre_delete, sender=DataType)
+def remove_data_type_files(sender, instance: DataType, **kwargs):
+    # the files include the names of the data types, the files of the versions whose
+    # trees use this data type are written again from the database when needed
+    if tree_file_dir() is None:
+        return
+    for version in (
+        Version.objects.filter(treenode__data_type=instance).distinct().only("id")
+    ):
+        remove_tree_file(version)
@@ -0,0 +1,144 @@
+import math
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+from .compiled import MISSING, UNKNOWN, CompiledTree, compare
+
+# nested ifs deeper than this continue in a helper function, python limits the
+# indentation of source code to 100 levels
+MAX_INLINE_DEPTH = 40
+
+# python operators of the comparison opcodes
+OPERATORS = {0: ">", 1: "<", 2: "==", 3: "!="}
+
+
+def literal(value: any) -> bool:
+    """
+    output: True if repr(value) is a python literal that evaluates to an equal value
+    """
+    if type(value) is float:
+        return math.isfinite(value)
+    return type(value) in (int, bool, str) or value is None
+
+
+class SourceBuilder:
+    """
+    generates the source of one function per helper node: the root, every node
+    with more than one parent (shared subtree) and every node where the nesting gets
+    too deep. inside such a function the subtree is written out as nested ifs, each
+    return statement returns the constant (leaf, missing, bits, depth) of the path
+    that leads there, relative to the root of the function.
+    """
+
+    def __init__(self, compiled: CompiledTree):
+        self.compiled = compiled
+        parents = [0] * len(compiled.node_ids)
+        for child in list(compiled.true_child) + list(compiled.false_child):
+            if child >= 0:
+                parents[child] += 1
+        self.shared = [count > 1 for count in parents]
+        # values that are no literals are passed in as K[index]
+        self.constants = []
+        self.helpers = set()
+        self.pending = [0]
+
+    def build(self) -> str:
+        functions = []
+        while self.pending:
+            node = self.pending.pop()
+            if node in self.helpers:
+                continue
+            self.helpers.add(node)
+            lines = ["def f" + str(node) + "(row):"]
+            self.node(lines, node, 0, 0, 1)
+            functions.append("\n".join(lines))
+        return "\n\n".join(functions) + "\n"
+
+    def threshold(self, node: int) -> str:
+        value = self.compiled.threshold[node]
+        if literal(value):
+            return repr(value)
+        self.constants.append(value)
+        return "K[" + str(len(self.constants) - 1) + "]"
+
+    def node(self, lines: List[str], node: int, depth: int, bits: int, indent: int):
+        """
+        write the code of this node, depth and bits describe the path from the root
+        of the function to this node (bit i = result of the i-th comparison)
+        """
+        compiled = self.compiled
+        pad = "    " * indent
+        opcode = compiled.opcode[node]
+        threshold = self.threshold(node)
+        lines.append(pad + "v = row[" + str(compiled.column[node]) + "]")
+        lines.append(pad + "if v is M:")
+        lines.append(pad + "    return (-1, %d, %d, %d)" % (node, bits, depth))
+        arguments = "(%d, %d, %s, v)" % (opcode, compiled.list_opcode[node], threshold)
+        if opcode == UNKNOWN:
+            condition = "C" + arguments
+        else:
+            condition = "(C%s if I(v, L) else v %s %s)" % (
+                arguments,
+                OPERATORS[opcode],
+                threshold,
+            )
+        lines.append(pad + "if " + condition + ":")
+        true_bits = bits | 1 << depth
+        self.child(lines, compiled.true_child[node], depth + 1, true_bits, indent + 1)
+        lines.append(pad + "else:")
+        self.child(lines, compiled.false_child[node], depth + 1, bits, indent + 1)
+
+    def child(self, lines: List[str], child: int, depth: int, bits: int, indent: int):
+        pad = "    " * indent
+        if child < 0:
+            lines.append(pad + "return (%d, -1, %d, %d)" % (~child, bits, depth))
+        elif self.shared[child] or depth >= MAX_INLINE_DEPTH:
+            # continue in the function of the child and shift its bits behind ours
+            self.pending.append(child)
+            lines.append(pad + "r = f%d(row)" % child)
+            lines.append(
+                pad
+                + "return (r[0], r[1], %d | r[2] << %d, r[3] + %d)"
+                % (bits, depth, depth)
+            )
+        else:
+            self.node(lines, child, depth, bits, indent)
+
+
+def generate_source(compiled: CompiledTree) -> Tuple[str, list]:
+    """
+    input: a compiled tree
+    output: python source of the functions f<node index>(row) -> (leaf, missing,
+    bits, depth) with f0 for the root, and the constants (K) they use
+    """
+    builder = SourceBuilder(compiled)
+    return builder.build(), builder.constants
+
+
+def compile_walk(
+    compiled: CompiledTree,
+) -> Callable[[List[any]], Tuple[List[int], List[bool], int, int]]:
+    """
+    input: a compiled tree
+    output: a function with the same input and result as compiled.walk that runs
+    generated python code instead of walking the arrays. the bits of the path are
+    expanded to node indices (cached, there is one path per return statement).
+    """
+    source, constants = generate_source(compiled)
+    namespace = {"M": MISSING, "C": compare, "I": isinstance, "L": list, "K": constants}
+    exec(compile(source, "<treexpert tree>", "exec"), namespace)
+    run = namespace["f0"]
+
+    @lru_cache(maxsize=4096)
+    def expand(bits: int, depth: int) -> Tuple[Tuple[int], Tuple[bool]]:
+        path, results = compiled.expand(bits, depth)
+        return tuple(path), tuple(results)
+
+    def walk(row: List[any]) -> Tuple[List[int], List[bool], int, int]:
+        leaf, missing, bits, depth = run(row)
+        path, results = expand(bits, depth)
+        # the cached walk is shared, every caller gets lists of its own
+        return list(path), list(results), leaf, missing
+
+    walk.source = source
+    return walk
@@ -0,0 +1,271 @@
+from array import array
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+from tree.models import TreeLeaf, TreeNode
+
+
+class Missing:
+    """
+    type of MISSING, pickled by reference so it is the same object in other processes
+    (see pool)
+    """
+
+    def __reduce__(self):
+        return "MISSING"
+
+    def __repr__(self):
+        return "MISSING"
+
+
+# marks a column that has no value for the current entity
+MISSING = Missing()
+
+# opcodes for the comparison of a node, UNKNOWN raises while evaluating
+GREATERTHAN = 0
+SMALLERTHAN = 1
+EQUAL = 2
+NOTEQUAL = 3
+UNKNOWN = -1
+COMPARISON_OPCODES = {
+    TreeNode.GREATERTHAN: GREATERTHAN,
+    TreeNode.SMALLERTHAN: SMALLERTHAN,
+    TreeNode.EQUAL: EQUAL,
+    TreeNode.NOTEQUAL: NOTEQUAL,
+}
+
+# opcodes for the list comparison of a node, anything that is not known counts as
+# "at least one" like in Evaluator.evaluate_node
+LIST_ALL = 0
+LIST_ONE = 1
+LIST_TWO = 2
+LIST_ANY = 3
+LIST_OPCODES = {
+    TreeNode.ALL: LIST_ALL,
+    None: LIST_ALL,
+    TreeNode.ONE: LIST_ONE,
+    TreeNode.TWO: LIST_TWO,
+}
+
+
+def fail(message: str):
+    # imported here, since the evaluator module imports this one
+    from .evaluator import EvaluatorException
+
+    raise EvaluatorException(message)
+
+
+def compare(opcode: int, list_opcode: int, threshold: any, data: any) -> bool:
+    """
+    same semantics as Evaluator.evaluate_node, but working on opcodes instead of a
+    TreeNode instance
+    """
+    if isinstance(data, list):
+        hits = sum(compare(opcode, list_opcode, threshold, value) for value in data)
+        if list_opcode == LIST_ONE:
+            return hits == 1
+        elif list_opcode == LIST_TWO:
+            return hits == 2
+        elif list_opcode == LIST_ALL:
+            return hits == len(data)
+        else:
+            return hits != 0
+    if opcode == GREATERTHAN:
+        return data > threshold
+    elif opcode == SMALLERTHAN:
+        return data < threshold
+    elif opcode == EQUAL:
+        return data == threshold
+    elif opcode == NOTEQUAL:
+        return data != threshold
+    else:
+        fail("error while evaluating")
+
+
+class CompiledTree:
+    """
+    array-backed form of one tree version that can be walked without any ORM objects.
+    nodes and leaves are addressed by their index in the parallel arrays, the root
+    node always has the index 0. a successor index >= 0 points to a node, a negative
+    successor index i points to the leaf with the index ~i (-1 -> 0, -2 -> 1, ...).
+    the input of one entity is encoded as a row with one column per data type, see
+    data_types for the data type id of each column.
+    """
+
+    # (path, version) of the tree file the arrays are mapped from (see treefile)
+    tree_file = None
+
+    def __init__(
+        self,
+        root_id: str,
+        nodes: Iterable[TreeNode],
+        leafs: Iterable[TreeLeaf],
+    ):
+        nodes = list(nodes)
+        leafs = list(leafs)
+        # root first, the rest in the order they were given
+        nodes.sort(key=lambda node: node.id != root_id)
+        if not nodes or nodes[0].id != root_id:
+            fail("error parsing current tree, root is missing")
+
+        self.node_ids: List[str] = [node.id for node in nodes]
+        self.leaf_ids: List[str] = [leaf.id for leaf in leafs]
+        self.node_index: Dict[str, int] = {
+            node_id: index for index, node_id in enumerate(self.node_ids)
+        }
+        self.leaf_index: Dict[str, int] = {
+            leaf_id: index for index, leaf_id in enumerate(self.leaf_ids)
+        }
+        if len(self.node_index) + len(self.leaf_index) != len(nodes) + len(leafs) or (
+            self.node_index.keys() & self.leaf_index.keys()
+        ):
+            fail("error parsing current tree, duplicate elements")
+
+        self.data_types: List[int] = []
+        columns = dict()
+        for node in nodes:
+            if node.data_type_id not in columns:
+                columns[node.data_type_id] = len(self.data_types)
+                self.data_types.append(node.data_type_id)
+
+        self.column = array("q", (columns[node.data_type_id] for node in nodes))
+        self.opcode = array(
+            "b", (COMPARISON_OPCODES.get(node.comparison, UNKNOWN) for node in nodes)
+        )
+        self.list_opcode = array(
+            "b", (LIST_OPCODES.get(node.list_comparison, LIST_ANY) for node in nodes)
+        )
+        self.threshold: List[any] = [node.data_value for node in nodes]
+        self.true_child = array("q", (self.successor(node.true_id) for node in nodes))
+        self.false_child = array("q", (self.successor(node.false_id) for node in nodes))
+        self.leaf_result = array("b", (leaf.result for leaf in leafs))
+
+    @classmethod
+    def from_arrays(
+        cls,
+        node_ids: List[str],
+        leaf_ids: List[str],
+        data_types: List[int],
+        column: Sequence[int],
+        opcode: Sequence[int],
+        list_opcode: Sequence[int],
+        threshold: List[any],
+        true_child: Sequence[int],
+        false_child: Sequence[int],
+        leaf_result: Sequence[int],
+    ) -> "CompiledTree":
+        """
+        input: the arrays of a compiled tree, e.g. memory views of a tree file (see
+        treefile)
+        output: the compiled tree made of them, they are not checked again
+        """
+        compiled = cls.__new__(cls)
+        compiled.node_ids = node_ids
+        compiled.leaf_ids = leaf_ids
+        compiled.node_index = {node_id: index for index, node_id in enumerate(node_ids)}
+        compiled.leaf_index = {leaf_id: index for index, leaf_id in enumerate(leaf_ids)}
+        compiled.data_types = data_types
+        compiled.column = column
+        compiled.opcode = opcode
+        compiled.list_opcode = list_opcode
+        compiled.threshold = threshold
+        compiled.true_child = true_child
+        compiled.false_child = false_child
+        compiled.leaf_result = leaf_result
+        return compiled
+
+    def __reduce_ex__(self, protocol):
+        # a tree mapped from a tree file is pickled as its file, the other process
+        # (e.g. a pool worker) maps the same file and shares its pages
+        if self.tree_file is not None:
+            from .treefile import compiled_tree_of_file
+
+            return compiled_tree_of_file, self.tree_file
+        return super().__reduce_ex__(protocol)
+
+    def successor(self, element_id: str) -> int:
+        if element_id in self.node_index:
+            return self.node_index[element_id]
+        if element_id in self.leaf_index:
+            return ~self.leaf_index[element_id]
+        fail("error parsing current tree, unknown successor " + str(element_id))
+
+    def encode(self, decoded_data: Dict[int, any]) -> List[any]:
+        """
+        input: a map of data type id -> input value for one entity
+        output: the row of input values in column order, MISSING for absent values
+        """
+        return [decoded_data.get(data_type, MISSING) for data_type in self.data_types]
+
+    def walk(self, row: List[any]) -> Tuple[List[int], List[bool], int, int]:
+        """
+        input: an encoded row (see encode)
+        run from the root until a leaf is reached or a value is missing
+        output:
+            path: indices of all evaluated nodes in the order they were visited
+            results: the comparison result of each node in path
+            leaf: index of the end leaf or -1 if data is missing
+            missing: index of the node that is missing data or -1
+        """
+        column = self.column
+        opcode = self.opcode
+        list_opcode = self.list_opcode
+        threshold = self.threshold
+        true_child = self.true_child
+        false_child = self.false_child
+
+        path = []
+        results = []
+        current = 0
+        while current >= 0:
+            value = row[column[current]]
+            if value is MISSING:
+                return path, results, -1, current
+            op = opcode[current]
+            if isinstance(value, list) or op == UNKNOWN:
+                result = compare(op, list_opcode[current], threshold[current], value)
+            elif op == GREATERTHAN:
+                result = value > threshold[current]
+            elif op == SMALLERTHAN:
+                result = value < threshold[current]
+            elif op == EQUAL:
+                result = value == threshold[current]
+            else:
+                result = value != threshold[current]
+            path.append(current)
+            results.append(result)
+            current = true_child[current] if result else false_child[current]
+        return path, results, ~current, -1
+
+    def expand(self, bits: int, depth: int) -> Tuple[List[int], List[bool]]:
+        """
+        input: the number of comparisons of a walk and its results as bits (bit i is
+        the result of the i-th comparison)
+        output: the path and results of this walk (see walk)
+        """
+        path = []
+        results = []
+        current = 0
+        for step in range(depth):
+            result = bool(bits >> step & 1)
+            path.append(current)
+            results.append(result)
+            current = self.true_child[current] if result else self.false_child[current]
+        return path, results
+
+    def input_of(self, row: List[any], node: int) -> any:
+        return row[self.column[node]]
+
+    def __len__(self):
+        return len(self.node_ids) + len(self.leaf_ids)
+
+
+def compile_tree(
+    complete_tree: Tuple[any, Iterable[TreeNode], Iterable[TreeLeaf], any]
+) -> Union[CompiledTree, None]:
+    """
+    input: the result of Tree.objects.get_complete_tree
+    output: the compiled tree or None if there is no tree
+    """
+    if complete_tree is None or complete_tree[0] is None:
+        return None
+    return CompiledTree(complete_tree[0].root_id, complete_tree[1], complete_tree[2])
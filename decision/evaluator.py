@@ -1,11 +1,17 @@
 import logging
-from typing import List, Union
+import struct
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
 
 from core.models import DataType
 from tree.models import Tree, TreeLeaf, TreeNode
-from .models import RequestData
+from .batch import BatchEngine
+from .codegen import compile_walk
+from .compiled import CompiledTree
+from .models import Decision, RequestData
 
 logger = logging.getLogger(__name__)
 
@@ -15,52 +21,158 @@ class EvaluatorException(BaseException):
         self.message = message
 
 
-class FullCriteria:
-    id: str  # id of the node
-    number: int  # number of the node
-    name: str
-    description: str
-    color: int = 0
-    data_type: int
-    comparison_value: any
-    comparison_method: str
-    list_comparison_method: str
-    explanation: str
-    input_value: any
-    result: bool
-    based_on: str
-
-    def __init__(self, node: TreeNode, result: bool, input: any):
+class NodeInfo:
+    """
+    everything the criteria of a node show, resolved once per tree version: ids
+    instead of related objects and the explanation, color and based_on of both
+    branches (index 0 = false, 1 = true)
+    """
+
+    __slots__ = (
+        "id",
+        "number",
+        "name",
+        "description",
+        "data_type",
+        "comparison_value",
+        "comparison_method",
+        "list_comparison_method",
+        "explanations",
+        "colors",
+        "based_on",
+    )
+
+    def __init__(
+        self, node: TreeNode, true_is_node: bool = None, false_is_node: bool = None
+    ):
+        # successor kinds are known after compiling, otherwise ask the content type
+        if true_is_node is None or false_is_node is None:
+            node_type = ContentType.objects.get_for_model(TreeNode).id
+            true_is_node = node.true_type_id == node_type
+            false_is_node = node.false_type_id == node_type
         self.id = node.id
         self.number = node.number
         self.name = node.display_name
         self.description = node.description
-        self.data_type = node.data_type.id
+        self.data_type = node.data_type_id
         self.comparison_value = node.data_value
         self.comparison_method = node.comparison
         self.list_comparison_method = node.list_comparison
-        self.result = result
-        # set values that are specific to result
+        self.explanations = (
+            node.explanation + node.false_explanation,
+            node.explanation + node.true_explanation,
+        )
+        self.colors = (node.false_color_id or 0, node.true_color_id or 0)
         # based_on only is set for nodes that end in another node
-        # the last node with a leaf as the successor gets a 0
-        if result:
-            self.color = node.true_color.id if node.true_color is not None else 0
-            self.explanation = node.explanation + node.true_explanation
-            self.based_on = (
-                node.true_id
-                if node.true_type.id == ContentType.objects.get(model="treenode").id
-                else ""
-            )
-        else:
-            self.color = node.false_color.id if node.false_color is not None else 0
-            self.explanation = node.explanation + node.false_explanation
-            self.based_on = (
-                node.false_id
-                if node.false_type.id == ContentType.objects.get(model="treenode").id
-                else ""
-            )
+        self.based_on = (
+            node.false_id if false_is_node else "",
+            node.true_id if true_is_node else "",
+        )
+
+
+class FullCriteria:
+    """
+    one visited node: only the node info, the result of the comparison and the
+    input are stored, all other values are looked up when they are read
+    """
+
+    __slots__ = ("info", "result", "input_value")
+
+    def __init__(self, node: Union[NodeInfo, TreeNode], result: bool, input: any):
+        self.info = node if isinstance(node, NodeInfo) else NodeInfo(node)
+        self.result = result
         self.input_value = input
 
+    @property
+    def id(self) -> str:
+        return self.info.id
+
+    @property
+    def number(self) -> int:
+        return self.info.number
+
+    @property
+    def name(self) -> str:
+        return self.info.name
+
+    @property
+    def description(self) -> str:
+        return self.info.description
+
+    @property
+    def data_type(self) -> int:
+        return self.info.data_type
+
+    @property
+    def comparison_value(self) -> any:
+        return self.info.comparison_value
+
+    @property
+    def comparison_method(self) -> str:
+        return self.info.comparison_method
+
+    @property
+    def list_comparison_method(self) -> str:
+        return self.info.list_comparison_method
+
+    @property
+    def color(self) -> int:
+        return self.info.colors[self.result]
+
+    @property
+    def explanation(self) -> str:
+        return self.info.explanations[self.result]
+
+    @property
+    def based_on(self) -> str:
+        return self.info.based_on[self.result]
+
+
+class EvaluationResult(NamedTuple):
+    """
+    outcome of running the tree for one entity: the criteria of all visited nodes
+    and either the end leaf or the missing data type and the node that needs it
+    """
+
+    criteria: Tuple[FullCriteria, ...] = ()
+    end_leaf: TreeLeaf = None
+    missing_data: DataType = None
+    node_missing_sth: TreeNode = None
+
+
+def pack_path(steps: Iterable[Tuple[int, bool]]) -> Tuple[bytes, bytes]:
+    """
+    input: (node number, result) of each visited node in the order they were visited
+    output: the node numbers as little endian int32 and the results as bitset (bit i
+    is the result of the i-th node), see Decision.path
+    """
+    steps = list(steps)
+    numbers = struct.pack("<%di" % len(steps), *(number for number, _ in steps))
+    bits = sum(1 << step for step, (_, result) in enumerate(steps) if result)
+    return numbers, bits.to_bytes((len(steps) + 7) // 8, "little")
+
+
+def unpack_path(numbers: bytes, results: bytes) -> List[Tuple[int, bool]]:
+    """
+    output: the (node number, result) steps of a packed path (see pack_path)
+    """
+    bits = int.from_bytes(results, "little")
+    return [
+        (number, bool(bits >> step & 1))
+        for step, number in enumerate(
+            struct.unpack("<%di" % (len(numbers) // 4), numbers)
+        )
+    ]
+
+
+def saved_path(decision: Decision) -> Optional[List[Tuple[int, bool]]]:
+    """
+    output: the steps of the path saved with this decision, None if it has none
+    """
+    if decision.path is None:
+        return None
+    return unpack_path(bytes(decision.path), bytes(decision.path_results))
+
 
 def add_list_to_dict(mylist: List[Union[TreeNode, TreeLeaf]], mydict: dict) -> dict:
     for element in mylist:
@@ -73,16 +185,58 @@ def add_list_to_dict(mylist: List[Union[TreeNode, TreeLeaf]], mydict: dict) -> d
 class Evaluator:
     root: str
     tree_dict: dict
-    criteria: List[FullCriteria] = []
-    end_leaf: TreeLeaf = None
-    missing_data: DataType = None
-    node_missing_sth: TreeNode = None
+    compiled: CompiledTree
+    walk: Callable[[list], tuple]  # compiled.walk or its generated code
+    _batch_engine: BatchEngine = None  # built on the first evaluate_batch
+    # results of the last run_tree, evaluate keeps no state
+    criteria: List[FullCriteria]
+    end_leaf: TreeLeaf
+    missing_data: DataType
+    node_missing_sth: TreeNode
 
-    def __init__(self, tree: Tree, nodes: List[TreeNode], leafs: List[TreeLeaf]):
-        self.root = tree.root.id
+    def __init__(
+        self,
+        tree: Tree,
+        nodes: List[TreeNode],
+        leafs: List[TreeLeaf],
+        compiled: CompiledTree = None,
+        data_types: Dict[int, DataType] = None,
+    ):
+        """
+        input: the tree with its nodes and leaves, optionally already compiled and
+        with its data types (see treefile), else they are compiled and queried
+        """
+        self.root = tree.root_id
+        nodes = list(nodes)
+        leafs = list(leafs)
         tree_dict = dict()
-        tree_dict = add_list_to_dict(list(nodes) + list(leafs), tree_dict)
+        tree_dict = add_list_to_dict(nodes + leafs, tree_dict)
         self.tree_dict = tree_dict
+        self.compiled = compiled or CompiledTree(self.root, nodes, leafs)
+        compiled = self.compiled
+        # criteria data and data types are looked up by node index while running
+        self.node_info = [
+            NodeInfo(
+                tree_dict[node_id],
+                true_is_node=compiled.true_child[index] >= 0,
+                false_is_node=compiled.false_child[index] >= 0,
+            )
+            for index, node_id in enumerate(compiled.node_ids)
+        ]
+        self.node_by_number = {
+            info.number: index for index, info in enumerate(self.node_info)
+        }
+        if data_types is None:
+            data_types = DataType.objects.in_bulk(compiled.data_types)
+        self.data_types = data_types
+        backend = getattr(settings, "TREEXPERT_EVALUATOR_BACKEND", "interpreter")
+        if backend == "codegen":
+            self.walk = compile_walk(compiled)
+        elif backend == "interpreter":
+            self.walk = compiled.walk
+        else:
+            raise ImproperlyConfigured("unknown evaluator backend " + str(backend))
+        self.reset_evaluator()
 
     def evaluate_node(self, node: TreeNode, data):
         # handle nodes with a list as data
@@ -118,48 +272,106 @@ class Evaluator:
         self.missing_data = None
         self.node_missing_sth = None
 
-    def run_tree(self, data: List[RequestData]):
+    def decode(self, data: List[RequestData]) -> dict:
         """
-        input: data = the list of available information about one entity
-        run the tree for one specific entity
+        input: the list of available information about one entity
+        output: map of data type id -> input value
         """
-        self.reset_evaluator()
-
-        current_node = self.tree_dict[self.root]
         decoded_data = dict()
-
-        # get all the decoded data
         for value in data:
-            if decoded_data.get(value.type.id) is not None:
+            if value.type_id in decoded_data:
                 raise EvaluatorException("error evaluating with this data")
-            decoded_data[value.type.id] = value
-
-        # run from node to node until a leaf is reached or no data is available
-        while isinstance(current_node, TreeNode) and self.missing_data is None:
-            # logger.debug(str(current_node.id) + ": " + current_node.display_name)
-            # check if necessary data for this node is available
-            necessary_data = decoded_data.get(current_node.data_type.id)
-            if necessary_data is None:
-                self.missing_data = current_node.data_type
-                self.node_missing_sth = current_node
-            else:
-                # evaluate node and add it + result to criteria list
-                evaluation = self.evaluate_node(
-                    current_node, decoded_data[current_node.data_type.id].value
-                )
-                self.criteria.append(
-                    FullCriteria(
-                        node=current_node,
-                        result=evaluation,
-                        input=decoded_data[current_node.data_type.id].value,
-                    )
-                )
-                # determine next node or leaf
-                if evaluation:
-                    current_node = self.tree_dict[current_node.true_id]
-                else:
-                    current_node = self.tree_dict[current_node.false_id]
+            decoded_data[value.type_id] = value.value
+        return decoded_data
+
+    def result_of(self, row: list, walk: tuple) -> EvaluationResult:
+        """
+        input: an encoded row and the result of walking the compiled tree with it
+        output: criteria and end leaf or missing data of this walk
+        """
+        compiled = self.compiled
+        path, results, leaf, missing = walk
+
+        # map the path back to the nodes to record the criteria
+        node_info = self.node_info
+        criteria = tuple(
+            FullCriteria(node_info[index], evaluation, row[compiled.column[index]])
+            for index, evaluation in zip(path, results)
+        )
 
         # concluding with the result
-        if self.missing_data is None:
-            self.end_leaf = current_node
+        if missing >= 0:
+            node = self.tree_dict[compiled.node_ids[missing]]
+            return EvaluationResult(
+                criteria,
+                missing_data=self.data_types[node.data_type_id],
+                node_missing_sth=node,
+            )
+        return EvaluationResult(
+            criteria, end_leaf=self.tree_dict[compiled.leaf_ids[leaf]]
+        )
+
+    def evaluate(self, data: List[RequestData]) -> EvaluationResult:
+        """
+        input: data = the list of available information about one entity
+        run the tree for one specific entity without changing the evaluator, so one
+        evaluator can be used by many threads at the same time
+        output: the result of this entity
+        """
+        row = self.compiled.encode(self.decode(data))
+        return self.result_of(row, self.walk(row))
+
+    def explain(
+        self, path: Iterable[Tuple[int, bool]], data: List[RequestData]
+    ) -> Tuple[FullCriteria, ...]:
+        """
+        input: the steps of a saved path (see unpack_path) and the data of its request
+        output: the criteria of this path, looked up by node number without running
+        the tree
+        """
+        row = self.compiled.encode(self.decode(data))
+        column = self.compiled.column
+        node_info = self.node_info
+        criteria = []
+        for number, result in path:
+            index = self.node_by_number.get(number)
+            if index is None:
+                raise EvaluatorException("node " + str(number) + " is not in this tree")
+            criteria.append(FullCriteria(node_info[index], result, row[column[index]]))
+        return tuple(criteria)
+
+    @property
+    def batch_engine(self) -> BatchEngine:
+        """
+        output: the batch engine of this tree, built once and shared like the
+        evaluator since running it keeps no state in the engine
+        """
+        if self._batch_engine is None:
+            self._batch_engine = BatchEngine(self.compiled)
+        return self._batch_engine
+
+    def evaluate_batch(
+        self, data_lists: List[List[RequestData]]
+    ) -> List[EvaluationResult]:
+        """
+        input: the lists of available information about many entities
+        run the tree for all entities at once with the vectorized BatchEngine, like
+        evaluate without changing the evaluator
+        output: one result per entity
+        """
+        rows = [self.compiled.encode(self.decode(data)) for data in data_lists]
+        engine = self.batch_engine
+        result = engine.run(engine.encode(rows))
+        return [self.result_of(row, walk) for row, walk in zip(rows, result.walks())]
+
+    def run_tree(self, data: List[RequestData]):
+        """
+        input: data = the list of available information about one entity
+        run the tree for one specific entity and keep the result in the evaluator,
+        use evaluate for evaluators that are shared
+        """
+        result = self.evaluate(data)
+        self.criteria = list(result.criteria)
+        self.end_leaf = result.end_leaf
+        self.missing_data = result.missing_data
+        self.node_missing_sth = result.node_missing_sth
@@ -0,0 +1,84 @@
+import json
+import zlib
+from datetime import datetime
+from itertools import groupby
+from typing import Iterable, Iterator, List, Tuple
+
+from django.conf import settings
+
+from .audit import to_record
+from .models import ExpertRequest, RequestData
+from .persistence import from_document, request_document
+
+
+def with_data(
+    requests: Iterable[ExpertRequest], data: Iterable[RequestData]
+) -> Iterator[Tuple[ExpertRequest, List[RequestData]]]:
+    """
+    input: requests and request data, both ordered by request id
+    output: each request with its data (from its data document or input blob if it
+    has one), data of requests that are not in requests is skipped
+    """
+    data_by_request = groupby(data, key=lambda request_data: request_data.request_id)
+    request_id, data_list = next(data_by_request, (None, []))
+    for request in requests:
+        while request_id is not None and request_id < request.id:
+            request_id, data_list = next(data_by_request, (None, []))
+        document = request_document(request)
+        if document is not None:
+            yield request, from_document(document, request)
+        elif request_id == request.id:
+            yield request, list(data_list)
+        else:
+            yield request, []
+
+
+def export_requests(
+    kind_id: int = None, start: datetime = None, end: datetime = None
+) -> Iterator[dict]:
+    """
+    input: optionally a tree kind and the time range [start, end) of the requests
+    output: one record (see audit.to_record) per request with a decision, ordered by
+    request id. requests and data are read by two server side cursors in request id
+    order and merged, so only one chunk of each is held in memory.
+    """
+    chunk_size = getattr(settings, "TREEXPERT_STREAM_CHUNK_SIZE", 2000)
+    filters = {}
+    if kind_id is not None:
+        filters["version__kind_of_tree_id"] = kind_id
+    if start is not None:
+        filters["date__gte"] = start
+    if end is not None:
+        filters["date__lt"] = end
+    requests = (
+        ExpertRequest.objects.filter(decision__isnull=False, **filters)
+        .select_related("decision", "input_blob")
+        .order_by("id")
+        .iterator(chunk_size=chunk_size)
+    )
+    data = (
+        RequestData.objects.filter(
+            **{"request__" + key: value for key, value in filters.items()}
+        )
+        .order_by("request_id", "id")
+        .iterator(chunk_size=chunk_size)
+    )
+    for request, data_list in with_data(requests, data):
+        yield to_record(request, data_list, request.decision)
+
+
+def ndjson(records: Iterable[dict]) -> Iterator[bytes]:
+    for record in records:
+        yield (json.dumps(record) + "\n").encode()
+
+
+def gzipped(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    output: the chunks compressed as one gzip stream
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
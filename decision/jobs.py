@@ -0,0 +1,232 @@
+from datetime import timedelta
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from tree.models import Version
+from .api import decide_chunk, parse_entities
+from .evaluator import EvaluatorException
+from .models import DecisionJob, DecisionJobChunk
+
+# jobs decide large batches of entities in the background. a job is saved with its
+# NDJSON input split into chunks, decision_worker processes claim one chunk at a time
+# with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers take different
+# chunks without waiting for each other or a broker. a chunk's results are saved in
+# the same transaction as its requests and decisions. a chunk whose worker died is
+# claimed again after TREEXPERT_JOB_CLAIM_TIMEOUT seconds.
+
+
+class ChunkLost(Exception):
+    """
+    the chunk was claimed by another worker while this one decided it
+    """
+
+
+def split_lines(
+    lines: Iterable[bytes], chunk_size: int
+) -> Iterator[Tuple[int, int, str]]:
+    """
+    input: NDJSON lines and the number of entities per chunk
+    output: (number of the first line, number of entities, lines) of each chunk,
+    empty lines are kept so line numbers stay the same
+    """
+    first_line, entities, chunk = 1, 0, []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode()
+        chunk.append(line.rstrip("\r\n"))
+        if line.strip():
+            entities += 1
+            if entities == chunk_size:
+                yield first_line, entities, "\n".join(chunk)
+                first_line, entities, chunk = number + 1, 0, []
+    if entities:
+        yield first_line, entities, "\n".join(chunk)
+
+
+def submit_job(
+    lines: Iterable[bytes],
+    version: Version,
+    fullresult: bool = False,
+    chunk_size: int = None,
+) -> DecisionJob:
+    """
+    input: NDJSON lines with one entity each (like an item of /decision/bunch), the
+    tree version and if full results are wanted
+    save the job and its chunks in one transaction, the lines are read once and only
+    a few chunks are held in memory
+    output: the saved job
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "TREEXPERT_JOB_CHUNK_SIZE", 1000)
+    with transaction.atomic():
+        job = DecisionJob.objects.create(version=version, fullresult=fullresult)
+        chunks = []
+        for number, (first_line, entities, text) in enumerate(
+            split_lines(lines, chunk_size)
+        ):
+            chunks.append(
+                DecisionJobChunk(
+                    job=job,
+                    number=number,
+                    first_line=first_line,
+                    input=text,
+                    entities=entities,
+                )
+            )
+            job.entities += entities
+            if len(chunks) == 10:
+                DecisionJobChunk.objects.bulk_create(chunks)
+                chunks = []
+        DecisionJobChunk.objects.bulk_create(chunks)
+        job.save(update_fields=["entities"])
+    return job
+
+
+def claim_chunk(worker: str) -> Optional[DecisionJobChunk]:
+    """
+    input: name of the worker
+    claim the next pending chunk (or one whose worker didn't finish it in time),
+    chunks claimed too often fail
+    output: the claimed chunk with its job, None if there is nothing to do
+    """
+    timeout = getattr(settings, "TREEXPERT_JOB_CLAIM_TIMEOUT", 600)
+    max_attempts = getattr(settings, "TREEXPERT_JOB_MAX_ATTEMPTS", 3)
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            chunk = (
+                DecisionJobChunk.objects.select_for_update(
+                    skip_locked=True, of=("self",)
+                )
+                .select_related("job__version__kind_of_tree")
+                .filter(
+                    Q(status=DecisionJobChunk.PENDING)
+                    | Q(
+                        status=DecisionJobChunk.RUNNING,
+                        claimed__lt=now - timedelta(seconds=timeout),
+                    )
+                )
+                .order_by("id")
+                .first()
+            )
+            if chunk is None:
+                return None
+            if chunk.attempts >= max_attempts:
+                chunk.status = DecisionJobChunk.FAILED
+                chunk.error = "not finished after " + str(chunk.attempts) + " attempts"
+                chunk.save(update_fields=["status", "error"])
+                continue
+            chunk.status = DecisionJobChunk.RUNNING
+            chunk.worker = worker
+            chunk.claimed = now
+            chunk.attempts += 1
+            chunk.save(update_fields=["status", "worker", "claimed", "attempts"])
+            return chunk
+
+
+def run_chunk(chunk: DecisionJobChunk) -> bool:
+    """
+    input: a chunk claimed by claim_chunk
+    decide its entities and save the requests, decisions and results in one
+    transaction. if deciding fails the chunk is pending again (or failed after
+    TREEXPERT_JOB_MAX_ATTEMPTS), if it was claimed by another worker in the meantime
+    nothing is saved
+    output: True if the results were saved
+    """
+    max_attempts = getattr(settings, "TREEXPERT_JOB_MAX_ATTEMPTS", 3)
+    # the claim is identified by the worker and the number of claims
+    claim = DecisionJobChunk.objects.filter(
+        id=chunk.id,
+        status=DecisionJobChunk.RUNNING,
+        worker=chunk.worker,
+        attempts=chunk.attempts,
+    )
+    try:
+        with transaction.atomic():
+            output = decide_chunk(
+                list(parse_entities(chunk.input.split("\n"), chunk.first_line)),
+                chunk.job.version,
+                chunk.job.fullresult,
+            )
+            if not claim.update(status=DecisionJobChunk.DONE, output=output, error=""):
+                raise ChunkLost()
+    except ChunkLost:
+        return False
+    except (Exception, EvaluatorException) as error:
+        # EvaluatorException is no Exception, entities it is raised for get an error
+        # line from decide_chunk, anything else that raises it must not stop the
+        # worker with the chunk still running
+        if chunk.attempts >= max_attempts:
+            status = DecisionJobChunk.FAILED
+        else:
+            status = DecisionJobChunk.PENDING
+        claim.update(status=status, error=repr(error))
+        return False
+    return True
+
+
+def job_progress(job: DecisionJob) -> dict:
+    """
+    output: status of the job (pending, running, done or failed) with the number of
+    its chunks and entities that are done or failed and the errors of failed chunks
+    """
+    counts = {
+        row["status"]: row
+        for row in job.chunks.values("status").annotate(
+            chunks=Count("id"), entities=Sum("entities")
+        )
+    }
+
+    def count(status: str, key: str = "chunks") -> int:
+        return counts.get(status, {}).get(key, 0)
+
+    chunks = sum(row["chunks"] for row in counts.values())
+    open_chunks = count(DecisionJobChunk.PENDING) + count(DecisionJobChunk.RUNNING)
+    if chunks == count(DecisionJobChunk.DONE):
+        status = "done"
+    elif not open_chunks:
+        status = "failed"
+    elif open_chunks < chunks or count(DecisionJobChunk.RUNNING):
+        status = "running"
+    else:
+        status = "pending"
+    errors = []
+    if count(DecisionJobChunk.FAILED):
+        errors = list(
+            job.chunks.filter(status=DecisionJobChunk.FAILED)
+            .order_by("number")
+            .values_list("error", flat=True)
+        )
+    return {
+        "id": job.id,
+        "created": job.created,
+        "version": str(job.version),
+        "fullresult": job.fullresult,
+        "status": status,
+        "entities": job.entities,
+        "done_entities": count(DecisionJobChunk.DONE, "entities"),
+        "failed_entities": count(DecisionJobChunk.FAILED, "entities"),
+        "chunks": chunks,
+        "done_chunks": count(DecisionJobChunk.DONE),
+        "failed_chunks": count(DecisionJobChunk.FAILED),
+        "errors": errors,
+    }
+
+
+def job_results(job: DecisionJob) -> Iterator[bytes]:
+    """
+    output: the NDJSON results of the done chunks of this job in input order, read a
+    few chunks at a time
+    """
+    outputs = (
+        job.chunks.filter(status=DecisionJobChunk.DONE)
+        .order_by("number")
+        .values_list("output", flat=True)
+        .iterator(chunk_size=10)
+    )
+    for output in outputs:
+        yield output.encode()
@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import List
+
+from ninja import Router, Schema
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from .api import get_version
+from .export import gzipped
+from .jobs import job_progress, job_results, submit_job
+from .models import DecisionJob
+
+# background decision jobs (see jobs), mounted at /decision/jobs/. the jobs are
+# decided by `python manage.py decision_worker` processes.
+
+router = Router(tags=["decision jobs"])
+
+
+class JobOut(Schema):
+    id: int
+    created: datetime
+    version: str
+    fullresult: bool
+    status: str
+    entities: int
+    done_entities: int
+    failed_entities: int
+    chunks: int
+    done_chunks: int
+    failed_chunks: int
+    errors: List[str]
+
+
+# === /jobs/job_id === status and progress of a job ==========================
+@router.get("/{int:job_id}", response={200: JobOut, 404: str})
+def decision_job(request, job_id: int):
+    """
+    Status of a job: **pending** (no worker took it yet), **running**, **done** or
+    **failed** (some chunks failed repeatedly, see **errors**), with the number of
+    entities and chunks that are done or failed.
+    """
+    job = get_object_or_404(DecisionJob.objects.select_related("version"), id=job_id)
+    return job_progress(job)
+
+
+# === /jobs/job_id/results === results of a job ==============================
+@router.get("/{int:job_id}/results", response={200: None, 404: str, 409: str})
+def decision_job_results(request, job_id: int, compress: bool = False):
+    """
+    Streams the results of a done job as NDJSON, one line per entity in input order,
+    like **/decision/bunch/stream/{fullresult}**. With **compress**=true the stream is
+    gzip compressed.
+    """
+    job = get_object_or_404(DecisionJob.objects.select_related("version"), id=job_id)
+    status = job_progress(job)["status"]
+    if status != "done":
+        return 409, "job " + str(job_id) + " is " + status
+    if compress:
+        response = StreamingHttpResponse(
+            gzipped(job_results(job)), content_type="application/gzip"
+        )
+        filename = "job_" + str(job_id) + ".ndjson.gz"
+    else:
+        response = StreamingHttpResponse(
+            job_results(job), content_type="application/x-ndjson"
+        )
+        filename = "job_" + str(job_id) + ".ndjson"
+    response["Content-Disposition"] = 'attachment; filename="' + filename + '"'
+    return response
+
+
+# === /jobs/job_id === delete a job ==========================================
+@router.delete("/{int:job_id}", response={200: str, 404: str})
+def delete_decision_job(request, job_id: int):
+    """
+    Delete a job with its input and results. The requests and decisions it saved stay
+    in the decision log.
+    """
+    get_object_or_404(DecisionJob, id=job_id).delete()
+    return 200, "deleted job " + str(job_id)
+
+
+# === /jobs/fullresult === submit a job ======================================
+# (last, its path would match the paths of the routes above)
+@router.post("/{fullresult}", response={201: JobOut})
+def submit_decision_job(request, fullresult: bool, kind_id: int = None):
+    """
+    Submit a batch of entities to be decided in the background. The body is
+    **NDJSON**, one entity per line like an item of **/decision/bunch/{fullresult}**.
+    The returned job **id** is used to poll the job and to download its results.
+    The same is available as management command submit_decision_job for NDJSON files
+    on the server.
+    """
+    job = submit_job(request, get_version(kind_id), fullresult)
+    return 201, job_progress(job)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from decision.archive import archive_dir, compact_logs
+from decision.partitions import month_of, next_month
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the requests, data and decisions of closed months out of the database "
+        "into the compressed archive that /decision/result and /decision/data fall "
+        "back to"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            required=True,
+            help="months before this month to keep in the database",
+        )
+        parser.add_argument(
+            "--archive",
+            default=None,
+            help="archive directory (default: TREEXPERT_ARCHIVE_DIR)",
+        )
+
+    def handle(self, *args, **options):
+        if options["months"] < 0:
+            raise CommandError("--months can't be negative")
+        before = next_month(month_of(timezone.now()), -options["months"])
+        directory = options["archive"] or archive_dir()
+        compacted = compact_logs(before, directory)
+        for month, archived in compacted.items():
+            self.stdout.write(
+                "archived " + str(archived) + " requests of " + month.strftime("%Y-%m")
+            )
+        self.stdout.write(
+            str(sum(compacted.values()))
+            + " requests before "
+            + str(before)
+            + " archived to "
+            + str(directory)
+        )
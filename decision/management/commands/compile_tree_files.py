@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from decision.cache import load_evaluator_from_database
+from decision.treefile import read_tree_file, tree_file_dir, write_tree_file
+from tree.models import Version
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the tree files of all valid versions that don't have one yet, e.g. "
+        "for versions published before tree files were used"
+    )
+
+    def handle(self, *args, **options):
+        if tree_file_dir() is None:
+            raise CommandError("tree files are off (TREEXPERT_TREE_FILE_DIR)")
+        written = 0
+        for version in Version.objects.filter(valid=True, deleted=False):
+            if read_tree_file(version) is None:
+                write_tree_file(version, load_evaluator_from_database(version))
+                written += 1
+        self.stdout.write(
+            str(written) + " tree files written to " + str(tree_file_dir())
+        )
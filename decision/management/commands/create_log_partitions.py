@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from decision.partitions import create_partitions, month_of, next_month
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the monthly partitions of the decision log tables from this month "
+        "on, run it regularly (e.g. daily) so inserts never go to the default "
+        "partition"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=getattr(settings, "TREEXPERT_PARTITION_MONTHS_AHEAD", 3),
+            help="number of months after this month to create partitions for",
+        )
+
+    def handle(self, *args, **options):
+        month = month_of(timezone.now())
+        created = create_partitions(month, next_month(month, options["ahead"]))
+        for name in created:
+            self.stdout.write("created " + name)
+        self.stdout.write(str(len(created)) + " partitions created")
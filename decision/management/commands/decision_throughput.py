@@ -0,0 +1,151 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from typing import List
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+
+from decision.models import ExpertRequest
+from decision.persistence import load_request_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the sync (/decision/{fullresult}) and the async "
+        "(/decision/async/{fullresult}) decision endpoint in this process. The same "
+        "input (the last saved request or --input) is posted again and again, every "
+        "request is saved like any other request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=1000, help="requests per endpoint"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="requests in flight at the same time (threads for the sync endpoint)",
+        )
+        parser.add_argument("--kind", type=int, help="id of the tree kind")
+        parser.add_argument(
+            "--input", help="json file with the body of one decision request"
+        )
+        parser.add_argument(
+            "--fullresult", action="store_true", help="request full results"
+        )
+
+    def handle(self, *args, **options):
+        body = self.body(options)
+        query = "" if options["kind"] is None else "?kind_id=" + str(options["kind"])
+        fullresult = "true" if options["fullresult"] else "false"
+        count, concurrency = options["requests"], max(options["concurrency"], 1)
+        for name, path, run in (
+            ("sync", "/api/decision/", self.run_sync),
+            ("async", "/api/decision/async/", async_to_sync(self.run_async)),
+        ):
+            started = time.perf_counter()
+            latencies = run(path + fullresult + query, body, count, concurrency)
+            self.report(name, time.perf_counter() - started, latencies)
+
+    def body(self, options) -> dict:
+        if options["input"]:
+            with open(options["input"]) as file:
+                return json.load(file)
+        requests = ExpertRequest.objects.all()
+        if options["kind"] is not None:
+            requests = requests.filter(version__kind_of_tree_id=options["kind"])
+        request = requests.order_by("-id").first()
+        if request is None:
+            raise CommandError("no saved request to repeat, use --input")
+        return {
+            "identifier": request.identifier,
+            "sec_identifier": request.sec_identifier,
+            "data": [
+                {"data_type": data.type_id, "data_value": data.value}
+                for data in load_request_data(request.id)
+            ],
+        }
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise CommandError(
+                "request failed ("
+                + str(response.status_code)
+                + "): "
+                + response.content.decode()
+            )
+
+    def run_sync(
+        self, path: str, body: dict, count: int, concurrency: int
+    ) -> List[float]:
+        latencies = []
+        remaining = iter(range(count))
+        lock = threading.Lock()
+
+        def work():
+            client = Client()
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                started = time.perf_counter()
+                self.check_response(client.post(path, body, "application/json"))
+                latencies.append(time.perf_counter() - started)
+
+        def worker():
+            try:
+                work()
+            finally:
+                connection.close()
+
+        if concurrency == 1:
+            # in this thread and its connection (and transaction)
+            work()
+            return latencies
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(latencies) != count:
+            raise CommandError("sync requests failed")
+        return latencies
+
+    async def run_async(
+        self, path: str, body: dict, count: int, concurrency: int
+    ) -> List[float]:
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def post():
+            async with slots:
+                started = time.perf_counter()
+                self.check_response(
+                    await client.post(path, body, content_type="application/json")
+                )
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(post() for _ in range(count)))
+        return latencies
+
+    def report(self, name: str, seconds: float, latencies: List[float]):
+        latencies = sorted(latencies)
+        self.stdout.write(
+            "%-5s %d requests in %.2f s: %.1f requests/s, latency p50 %.1f ms, "
+            "p95 %.1f ms"
+            % (
+                name,
+                len(latencies),
+                seconds,
+                len(latencies) / seconds,
+                statistics.median(latencies) * 1000,
+                latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            )
+        )
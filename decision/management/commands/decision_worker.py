@@ -0,0 +1,69 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from decision.jobs import claim_chunk, run_chunk
+from decision.pool import use_process_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Decide the chunks of the jobs submitted to /decision/jobs until stopped. "
+        "Start as many workers as needed, each claims one chunk at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--name", help="name of this worker (default: host name and process id)"
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="seconds to wait before looking again when there is nothing to do",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="worker processes that walk chunks with at least "
+            "TREEXPERT_PROCESS_POOL_MIN_SIZE entities (default: "
+            "TREEXPERT_PROCESS_POOL_WORKERS)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="stop when there is nothing to do instead of waiting for new jobs",
+        )
+
+    def handle(self, *args, **options):
+        worker = options["name"] or socket.gethostname() + ":" + str(os.getpid())
+        if options["processes"] is not None:
+            use_process_pool(options["processes"])
+        done, failed, entities = 0, 0, 0
+        try:
+            while True:
+                chunk = claim_chunk(worker)
+                if chunk is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+                if run_chunk(chunk):
+                    done += 1
+                    entities += chunk.entities
+                else:
+                    failed += 1
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(
+            worker
+            + ": "
+            + str(done)
+            + " chunks ("
+            + str(entities)
+            + " entities) decided, "
+            + str(failed)
+            + " not finished"
+        )
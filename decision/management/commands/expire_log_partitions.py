@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from decision.partitions import expire_partitions, month_of, next_month
+
+
+class Command(BaseCommand):
+    help = (
+        "Detach and drop (or archive as compressed csv) the monthly partitions of "
+        "the decision log tables that are older than the retention period"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=getattr(settings, "TREEXPERT_LOG_RETENTION_MONTHS", None),
+            help="months before this month to keep",
+        )
+        parser.add_argument(
+            "--archive",
+            default=getattr(settings, "TREEXPERT_PARTITION_ARCHIVE_DIR", None),
+            help="directory to write the rows of expired partitions to",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="only list the partitions that would be expired",
+        )
+
+    def handle(self, *args, **options):
+        if options["months"] is None or options["months"] < 0:
+            raise CommandError(
+                "set --months or TREEXPERT_LOG_RETENTION_MONTHS to expire partitions"
+            )
+        before = next_month(month_of(timezone.now()), -options["months"])
+        expired = expire_partitions(before, options["archive"], options["dry_run"])
+        for name in expired:
+            self.stdout.write(
+                ("would expire " if options["dry_run"] else "expired ") + name
+            )
+        self.stdout.write(str(len(expired)) + " partitions before " + str(before))
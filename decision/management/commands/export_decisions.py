@@ -0,0 +1,54 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from decision.export import export_requests, gzipped, ndjson
+
+
+def moment(value: str):
+    """
+    output: the aware datetime of an iso date or date and time
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError("not an iso date or date and time: " + value)
+        parsed = timezone.datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Export all requests with a decision as NDJSON (one line per request with "
+        "its input data and decision), see /decision/export"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", type=int, help="id of the tree kind")
+        parser.add_argument("--start", type=moment, help="first date (inclusive)")
+        parser.add_argument("--end", type=moment, help="last date (exclusive)")
+        parser.add_argument("--gzip", action="store_true", help="compress the output")
+        parser.add_argument(
+            "-o", "--output", help="file to write to instead of standard output"
+        )
+
+    def handle(self, *args, **options):
+        chunks = ndjson(
+            export_requests(options["kind"], options["start"], options["end"])
+        )
+        if options["gzip"]:
+            chunks = gzipped(chunks)
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                output.writelines(chunks)
+        elif options["gzip"]:
+            sys.stdout.buffer.writelines(chunks)
+            sys.stdout.buffer.flush()
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending="")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from decision.persistence import pack_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Pack the RequestData rows of every request into one data document on the "
+        "request (see TREEXPERT_REQUEST_DATA_STORAGE)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=10000,
+            help="request ids per transaction",
+        )
+        parser.add_argument(
+            "--delete-rows",
+            action="store_true",
+            help="delete the rows of requests that have a document",
+        )
+
+    def handle(self, *args, **options):
+        packed = pack_documents(options["batch"], options["delete_rows"])
+        self.stdout.write(str(packed) + " requests packed")
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from decision.api import get_version
+from decision.jobs import submit_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Submit an NDJSON file (one entity per line, like an item of /decision/bunch) "
+        "as decision job, decided by decision_worker processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="NDJSON file, - for stdin")
+        parser.add_argument("--kind", type=int, help="id of the tree kind")
+        parser.add_argument(
+            "--fullresult", action="store_true", help="save full results"
+        )
+
+    def handle(self, *args, **options):
+        version = get_version(options["kind"])
+        if options["file"] == "-":
+            job = submit_job(sys.stdin.buffer, version, options["fullresult"])
+        else:
+            with open(options["file"], "rb") as file:
+                job = submit_job(file, version, options["fullresult"])
+        self.stdout.write(
+            "job "
+            + str(job.id)
+            + " submitted with "
+            + str(job.entities)
+            + " entities for "
+            + str(version)
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("decision", "0002_alter_decision_result"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="expertrequest",
+            name="date",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
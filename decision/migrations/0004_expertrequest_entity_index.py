@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("decision", "0003_alter_expertrequest_date"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="expertrequest",
+            index=models.Index(
+                fields=["identifier", "sec_identifier", "date"],
+                name="decision_request_entity_idx",
+            ),
+        ),
+    ]
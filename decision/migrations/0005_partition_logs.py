@@ -0,0 +1,225 @@
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+# the helpers of decision.partitions as they were when this migration was written,
+# copied so later changes to that module don't change what this migration does
+PARTITION_KEYS = {
+    "decision_expertrequest": "date",
+    "decision_requestdata": "request_date",
+    "decision_decision": "request_date",
+}
+
+
+def month_of(moment: datetime) -> date:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(dt_timezone.utc)
+    return date(moment.year, moment.month, 1)
+
+
+def next_month(month: date, months: int = 1) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def bound(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def create_partitions(cursor, first: date, last: date):
+    """
+    create the monthly partitions <table>_p<yyyymm> of the new (empty) tables from
+    the first to the last month (inclusive)
+    """
+    month = first
+    while month <= last:
+        for table in PARTITION_KEYS:
+            cursor.execute(
+                "CREATE TABLE %s_p%s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)"
+                % (table, month.strftime("%Y%m"), table),
+                [bound(month), bound(next_month(month))],
+            )
+        month = next_month(month)
+
+
+# indexes and foreign keys of the partitioned tables, created on the partitioned
+# table they are added to every partition
+INDEXES = {
+    "decision_expertrequest": [
+        "CREATE INDEX decision_expertrequest_version_id "
+        "ON decision_expertrequest (version_id)",
+        "CREATE INDEX decision_request_entity_idx "
+        "ON decision_expertrequest (identifier, sec_identifier, date)",
+        "ALTER TABLE decision_expertrequest ADD CONSTRAINT "
+        "decision_expertrequest_version_id_fk FOREIGN KEY (version_id) "
+        "REFERENCES tree_version (id) DEFERRABLE INITIALLY DEFERRED",
+    ],
+    "decision_requestdata": [
+        "CREATE INDEX decision_requestdata_request_id "
+        "ON decision_requestdata (request_id)",
+        "CREATE INDEX decision_requestdata_type_id ON decision_requestdata (type_id)",
+        "ALTER TABLE decision_requestdata ADD CONSTRAINT "
+        "decision_requestdata_type_id_fk FOREIGN KEY (type_id) "
+        "REFERENCES core_datatype (id) DEFERRABLE INITIALLY DEFERRED",
+    ],
+    "decision_decision": [
+        # a unique index of a partitioned table has to include the partition key.
+        # request_date is always the date of the request, so there is still only
+        # one decision per request, but the database doesn't check that anymore.
+        "CREATE UNIQUE INDEX decision_decision_request_id "
+        "ON decision_decision (request_id, request_date)",
+        "CREATE INDEX decision_decision_end_leaf_id "
+        "ON decision_decision (end_leaf_id)",
+        "ALTER TABLE decision_decision ADD CONSTRAINT "
+        "decision_decision_end_leaf_id_fk FOREIGN KEY (end_leaf_id) "
+        "REFERENCES tree_treeleaf (id) DEFERRABLE INITIALLY DEFERRED",
+    ],
+}
+
+
+def partition_tables(apps, schema_editor):
+    """
+    replace the decision log tables by tables partitioned by month of the request
+    date with the same rows, ids continue with the same sequence numbers
+    """
+    with schema_editor.connection.cursor() as cursor:
+        for table in ("decision_requestdata", "decision_decision"):
+            # foreign keys can't refer to the partitioned request table
+            cursor.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass "
+                "AND confrelid = 'decision_expertrequest'::regclass",
+                [table],
+            )
+            for (constraint,) in cursor.fetchall():
+                cursor.execute(
+                    'ALTER TABLE %s DROP CONSTRAINT "%s"' % (table, constraint)
+                )
+            cursor.execute(
+                "ALTER TABLE %s ADD COLUMN request_date timestamp with time zone"
+                % table
+            )
+            cursor.execute(
+                "UPDATE %s t SET request_date = r.date FROM decision_expertrequest r "
+                "WHERE r.id = t.request_id" % table
+            )
+            cursor.execute(
+                "UPDATE %s SET request_date = now() WHERE request_date IS NULL" % table
+            )
+
+        cursor.execute("SELECT min(date) FROM decision_expertrequest")
+        first = cursor.fetchone()[0] or timezone.now()
+        for table, key in PARTITION_KEYS.items():
+            cursor.execute("ALTER TABLE %s RENAME TO %s_unpartitioned" % (table, table))
+            cursor.execute(
+                "CREATE TABLE %s (LIKE %s_unpartitioned INCLUDING DEFAULTS) "
+                "PARTITION BY RANGE (%s)" % (table, table, key)
+            )
+            cursor.execute("ALTER TABLE %s ALTER COLUMN %s SET NOT NULL" % (table, key))
+            cursor.execute("ALTER TABLE %s ADD PRIMARY KEY (id, %s)" % (table, key))
+            cursor.execute(
+                "CREATE TABLE %s_default PARTITION OF %s DEFAULT" % (table, table)
+            )
+
+        create_partitions(
+            cursor, month_of(first), next_month(month_of(timezone.now()), 3)
+        )
+
+        for table in PARTITION_KEYS:
+            cursor.execute(
+                "INSERT INTO %s SELECT * FROM %s_unpartitioned" % (table, table)
+            )
+            cursor.execute("SELECT max(id) FROM %s_unpartitioned" % table)
+            last_id = cursor.fetchone()[0] or 0
+            cursor.execute("DROP TABLE %s_unpartitioned" % table)
+            cursor.execute("CREATE SEQUENCE %s_id_seq OWNED BY %s.id" % (table, table))
+            cursor.execute(
+                "SELECT setval('%s_id_seq', %%s, false)" % table, [last_id + 1]
+            )
+            cursor.execute(
+                "ALTER TABLE %s ALTER COLUMN id SET DEFAULT nextval('%s_id_seq')"
+                % (table, table)
+            )
+            for statement in INDEXES[table]:
+                cursor.execute(statement)
+
+
+def unpartition_tables(apps, schema_editor):
+    """
+    replace the partitioned tables by plain tables with the same rows, ids (identity
+    columns like before), indexes and the foreign keys to the request table again
+    """
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITION_KEYS:
+            cursor.execute("ALTER TABLE %s RENAME TO %s_partitioned" % (table, table))
+            cursor.execute("CREATE TABLE %s (LIKE %s_partitioned)" % (table, table))
+            cursor.execute(
+                "INSERT INTO %s SELECT * FROM %s_partitioned" % (table, table)
+            )
+            cursor.execute("SELECT nextval('%s_id_seq')" % table)
+            next_id = cursor.fetchone()[0]
+            # drops the partitions, their indexes and the sequence
+            cursor.execute("DROP TABLE %s_partitioned" % table)
+            cursor.execute(
+                "ALTER TABLE %s ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY "
+                "(START WITH %d)" % (table, next_id)
+            )
+            cursor.execute("ALTER TABLE %s ADD PRIMARY KEY (id)" % table)
+            for statement in INDEXES[table]:
+                if table == "decision_decision" and "UNIQUE" in statement:
+                    statement = statement.replace(", request_date", "")
+                cursor.execute(statement)
+        for table in ("decision_requestdata", "decision_decision"):
+            cursor.execute("ALTER TABLE %s DROP COLUMN request_date" % table)
+            cursor.execute(
+                "ALTER TABLE %s ADD CONSTRAINT %s_request_id_fk FOREIGN KEY "
+                "(request_id) REFERENCES decision_expertrequest (id) "
+                "DEFERRABLE INITIALLY DEFERRED" % (table, table)
+            )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0001_initial"),
+        ("tree", "0003_version_indexes"),
+        ("decision", "0004_expertrequest_entity_index"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name="decision",
+                    name="request_date",
+                    field=models.DateTimeField(default=timezone.now),
+                ),
+                migrations.AddField(
+                    model_name="requestdata",
+                    name="request_date",
+                    field=models.DateTimeField(default=timezone.now),
+                ),
+                migrations.AlterField(
+                    model_name="decision",
+                    name="request",
+                    field=models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="decision.expertrequest",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="requestdata",
+                    name="request",
+                    field=models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="decision.expertrequest",
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(partition_tables, unpartition_tables)
+            ],
+        ),
+    ]
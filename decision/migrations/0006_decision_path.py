@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("decision", "0005_partition_logs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="decision",
+            name="path",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="decision",
+            name="path_results",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("decision", "0006_decision_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expertrequest",
+            name="data_document",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("decision", "0007_expertrequest_data_document"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InputBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=32, primary_key=True, serialize=False),
+                ),
+                ("document", models.JSONField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="expertrequest",
+            name="input_blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.RESTRICT,
+                to="decision.inputblob",
+            ),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tree", "0003_version_indexes"),
+        ("decision", "0008_inputblob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DecisionJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                ("fullresult", models.BooleanField(default=False)),
+                ("entities", models.IntegerField(default=0)),
+                (
+                    "version",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.RESTRICT, to="tree.version"
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DecisionJobChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.IntegerField()),
+                ("first_line", models.IntegerField()),
+                ("input", models.TextField()),
+                ("entities", models.IntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("P", "pending"),
+                            ("R", "running"),
+                            ("D", "done"),
+                            ("F", "failed"),
+                        ],
+                        default="P",
+                        max_length=1,
+                    ),
+                ),
+                ("worker", models.CharField(blank=True, max_length=100)),
+                ("claimed", models.DateTimeField(blank=True, null=True)),
+                ("attempts", models.IntegerField(default=0)),
+                ("output", models.TextField(blank=True)),
+                ("error", models.TextField(blank=True)),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="decision.decisionjob",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status__in", ["P", "R"])),
+                        fields=["id"],
+                        name="decision_job_chunk_open_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="decisionjobchunk",
+            constraint=models.UniqueConstraint(
+                fields=("job", "number"), name="decision_job_chunk_number"
+            ),
+        ),
+    ]
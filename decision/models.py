@@ -1,15 +1,46 @@
 from django.db import models
+from django.utils import timezone
 
 from core.models import DataType
 from tree.models import TreeLeaf, Version
 
 
+class InputBlob(models.Model):
+    """
+    input data that is saved once for all requests with the same input (blob
+    storage, see persistence.request_data_storage)
+    """
+
+    # cache.canonical_input of the data
+    digest = models.CharField(max_length=32, primary_key=True)
+    # [data type id, value] pairs ordered by data type id
+    document = models.JSONField()
+
+
 class ExpertRequest(models.Model):
-    date = models.DateTimeField(auto_now_add=True)
+    # set explicitly when the request is written later by the audit log
+    date = models.DateTimeField(default=timezone.now)
     identifier = models.CharField(max_length=50)
     # used to identify the entity the request was made for
     sec_identifier = models.CharField(max_length=50)
     version = models.ForeignKey(Version, on_delete=models.RESTRICT)
+    # the input data as one document of [data type id, value] pairs in the order it
+    # was given, saved instead of RequestData rows in document storage (see
+    # persistence.request_data_storage). None if the data is saved otherwise.
+    data_document = models.JSONField(blank=True, null=True)
+    # the input data in blob storage
+    input_blob = models.ForeignKey(
+        InputBlob, on_delete=models.RESTRICT, blank=True, null=True
+    )
+
+    class Meta:
+        indexes = [
+            # /decision/requests/{identifier}/{secIdentifier}
+            models.Index(
+                fields=["identifier", "sec_identifier", "date"],
+                name="decision_request_entity_idx",
+            )
+        ]
 
     def __str__(self):
         return (
@@ -21,14 +52,26 @@ class ExpertRequest(models.Model):
         )
 
 
+# the tables of requests, their data and decisions are partitioned by month of the
+# request date (see partitions). postgres can't enforce a foreign key to a table that
+# is partitioned by another column, so the relations to ExpertRequest are not
+# constraints in the database and data and decision copy the date of their request.
+
+
 class RequestData(models.Model):
-    request = models.ForeignKey(ExpertRequest, on_delete=models.CASCADE)
+    request = models.ForeignKey(
+        ExpertRequest, on_delete=models.CASCADE, db_constraint=False
+    )
+    request_date = models.DateTimeField(default=timezone.now)
     type = models.ForeignKey(DataType, on_delete=models.RESTRICT)
     value = models.JSONField()
 
 
 class Decision(models.Model):
-    request = models.OneToOneField(ExpertRequest, on_delete=models.CASCADE)
+    request = models.OneToOneField(
+        ExpertRequest, on_delete=models.CASCADE, db_constraint=False
+    )
+    request_date = models.DateTimeField(default=timezone.now)
     description = models.CharField(
         max_length=200
     )  # result of end leaf or missing data text
@@ -37,3 +80,64 @@ class Decision(models.Model):
         TreeLeaf, on_delete=models.RESTRICT, blank=True, null=True
     )
     is_preliminary = models.BooleanField()  # data is missing
+    # the nodes that were visited, packed by evaluator.pack_path: their numbers and
+    # the result of each comparison as bitset. None for decisions saved without it.
+    path = models.BinaryField(blank=True, null=True)
+    path_results = models.BinaryField(blank=True, null=True)
+
+
+class DecisionJob(models.Model):
+    """
+    a batch of entities that is decided in the background by decision_worker
+    processes (see jobs), split into chunks
+    """
+
+    created = models.DateTimeField(default=timezone.now)
+    version = models.ForeignKey(Version, on_delete=models.RESTRICT)
+    fullresult = models.BooleanField(default=False)
+    # number of entities (non empty input lines)
+    entities = models.IntegerField(default=0)
+
+
+class DecisionJobChunk(models.Model):
+    PENDING = "P"
+    RUNNING = "R"
+    DONE = "D"
+    FAILED = "F"
+    STATUS_CHOICES = [
+        (PENDING, "pending"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    ]
+    job = models.ForeignKey(
+        DecisionJob, on_delete=models.CASCADE, related_name="chunks"
+    )
+    number = models.IntegerField()
+    # input line number of the first line and the NDJSON input lines
+    first_line = models.IntegerField()
+    input = models.TextField()
+    entities = models.IntegerField()
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=PENDING)
+    # the worker that claimed the chunk last, when and how often it was claimed
+    worker = models.CharField(max_length=100, blank=True)
+    claimed = models.DateTimeField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    # NDJSON results, one line per entity
+    output = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["job", "number"], name="decision_job_chunk_number"
+            )
+        ]
+        indexes = [
+            # chunks workers can claim
+            models.Index(
+                fields=["id"],
+                condition=models.Q(status__in=["P", "R"]),
+                name="decision_job_chunk_open_idx",
+            )
+        ]
@@ -0,0 +1,150 @@
+import gzip
+import re
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# the decision log tables are partitioned by month of the request date, each table
+# has a default partition for dates without a monthly partition. partitions are
+# named <table>_p<yyyymm>.
+PARTITION_KEYS = {
+    "decision_expertrequest": "date",
+    "decision_requestdata": "request_date",
+    "decision_decision": "request_date",
+}
+
+PARTITION_NAME = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def month_of(moment: datetime) -> date:
+    """
+    output: the first day of the month (UTC) of this point in time
+    """
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return date(moment.year, moment.month, 1)
+
+
+def next_month(month: date, months: int = 1) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def bound(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, month: date) -> str:
+    return table + "_p" + month.strftime("%Y%m")
+
+
+def month_partitions(cursor, table: str) -> Dict[date, str]:
+    """
+    output: the monthly partitions of this table by month
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass",
+        [table],
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.search(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_partition(cursor, table: str, month: date) -> bool:
+    """
+    create the partition of this table for this month, rows of this month that were
+    written to the default partition are moved to it
+    output: False if the partition exists already
+    """
+    name = partition_name(table, month)
+    if month in month_partitions(cursor, table):
+        return False
+    key = PARTITION_KEYS[table]
+    start, end = bound(month), bound(next_month(month))
+    cursor.execute(
+        "CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        % (name, table)
+    )
+    cursor.execute(
+        "WITH moved AS (DELETE FROM %s_default WHERE %s >= %%s AND %s < %%s "
+        "RETURNING *) INSERT INTO %s SELECT * FROM moved" % (table, key, key, name),
+        [start, end],
+    )
+    cursor.execute(
+        "ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM (%%s) TO (%%s)"
+        % (table, name),
+        [start, end],
+    )
+    return True
+
+
+def create_partitions(
+    first: date, last: date, using: str = DEFAULT_DB_ALIAS
+) -> List[str]:
+    """
+    input: first and last month (inclusive)
+    create the missing monthly partitions of all decision log tables
+    output: names of the created partitions
+    """
+    created = []
+    month = first
+    while month <= last:
+        for table in PARTITION_KEYS:
+            with transaction.atomic(using=using):
+                with connections[using].cursor() as cursor:
+                    if create_partition(cursor, table, month):
+                        created.append(partition_name(table, month))
+        month = next_month(month)
+    return created
+
+
+def archive_partition(cursor, name: str, archive_dir: Path) -> Path:
+    """
+    write all rows of a partition to <archive_dir>/<name>.csv.gz (with header)
+    """
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / (name + ".csv.gz")
+    with gzip.open(path, "wb") as archive:
+        with cursor.copy("COPY %s TO STDOUT WITH (FORMAT csv, HEADER)" % name) as copy:
+            for block in copy:
+                archive.write(block)
+    return path
+
+
+def expire_partitions(
+    before: date,
+    archive_dir: Path = None,
+    dry_run: bool = False,
+    using: str = DEFAULT_DB_ALIAS,
+) -> List[str]:
+    """
+    input: the first month to keep, optionally a directory to archive the expired
+    partitions to
+    detach and drop the monthly partitions of all decision log tables of the months
+    before. rows in the default partitions are kept.
+    output: names of the expired partitions
+    """
+    expired = []
+    for table in PARTITION_KEYS:
+        with connections[using].cursor() as cursor:
+            partitions = month_partitions(cursor, table)
+        for month, name in sorted(partitions.items()):
+            if month >= before:
+                continue
+            expired.append(name)
+            if dry_run:
+                continue
+            with transaction.atomic(using=using):
+                with connections[using].cursor() as cursor:
+                    cursor.execute("ALTER TABLE %s DETACH PARTITION %s" % (table, name))
+                    if archive_dir is not None:
+                        archive_partition(cursor.cursor, name, Path(archive_dir))
+                    cursor.execute("DROP TABLE %s" % name)
+    return expired
@@ -0,0 +1,325 @@
+from typing import Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.cache import LRUCache
+from core.models import DataType
+from tree.models import Version
+from .cache import canonical_input
+from .models import Decision, ExpertRequest, InputBlob, RequestData
+
+# ids of all data types, used to drop input data with unknown data types before it
+# is written instead of catching an IntegrityError for every single row
+data_type_cache = LRUCache(
+    max_size=1, max_age=getattr(settings, "TREEXPERT_DATA_TYPE_CACHE_MAX_AGE", 60)
+)
+
+
+def known_data_types(required: Iterable[int] = ()) -> Set[int]:
+    """
+    input: data type ids that are about to be used
+    output: the set of existing data type ids, reloaded if one of the required ids
+    is unknown (it may have been created by another process since)
+    """
+    known = data_type_cache.get("ids")
+    if known is None or not known.issuperset(required):
+        known = frozenset(DataType.objects.values_list("id", flat=True))
+        data_type_cache.put("ids", known)
+    return known
+
+
+async def aknown_data_types(required: Iterable[int] = ()) -> Set[int]:
+    """
+    like known_data_types for async views, with the async ORM
+    """
+    known = data_type_cache.get("ids")
+    if known is None or not known.issuperset(required):
+        known = frozenset(
+            [
+                data_type
+                async for data_type in DataType.objects.values_list("id", flat=True)
+            ]
+        )
+        data_type_cache.put("ids", known)
+    return known
+
+
+@receiver(post_save, sender=DataType)
+@receiver(post_delete, sender=DataType)
+def invalidate_data_types(sender, **kwargs):
+    data_type_cache.clear()
+
+
+STORAGES = ("rows", "document", "blob")
+
+
+def request_data_storage() -> str:
+    """
+    output: how the input data of requests is saved
+        rows: one RequestData row per value
+        document: all values as one document on the request (data_document)
+        blob: all values as one InputBlob per distinct input, shared by all
+        requests with this input (input_blob)
+    """
+    storage = getattr(settings, "TREEXPERT_REQUEST_DATA_STORAGE", "rows")
+    if storage not in STORAGES:
+        raise ImproperlyConfigured("unknown request data storage " + str(storage))
+    return storage
+
+
+def to_document(data_list: List[RequestData]) -> list:
+    return [[data.type_id, data.value] for data in data_list]
+
+
+def from_document(document: list, request: ExpertRequest = None) -> List[RequestData]:
+    """
+    output: the unsaved data of a data document (without ids)
+    """
+    if request is None:
+        return [
+            RequestData(type_id=type_id, value=value) for type_id, value in document
+        ]
+    return [
+        RequestData(
+            request=request, request_date=request.date, type_id=type_id, value=value
+        )
+        for type_id, value in document
+    ]
+
+
+def request_document(request: ExpertRequest) -> Optional[list]:
+    """
+    output: the data document of this request or of its input blob, None if its data
+    is saved as rows
+    """
+    if request.data_document is not None:
+        return request.data_document
+    if request.input_blob_id is not None:
+        return request.input_blob.document
+    return None
+
+
+def store_data(
+    requests: List[ExpertRequest], data_lists: List[List[RequestData]]
+) -> List[RequestData]:
+    """
+    input: unsaved requests and their data
+    prepare saving the data in the configured storage before the requests are
+    inserted: documents are set on the requests, missing input blobs are inserted
+    output: the data rows to insert after the requests (only in rows storage)
+    """
+    storage = request_data_storage()
+    if storage == "rows":
+        return [request_data for data_list in data_lists for request_data in data_list]
+    blobs = {}
+    for request, data_list in zip(requests, data_lists):
+        digest = None
+        if storage == "blob":
+            digest = canonical_input((data.type_id, data.value) for data in data_list)
+        if digest is None:
+            # inputs with a data type given twice have no content address
+            request.data_document = to_document(data_list)
+        else:
+            request.input_blob_id = digest
+            blobs[digest] = InputBlob(
+                digest=digest,
+                document=sorted(to_document(data_list), key=lambda pair: pair[0]),
+            )
+    InputBlob.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+    return []
+
+
+def load_request_data(request_id: int) -> List[RequestData]:
+    """
+    output: the data of this request from its rows or its document, whichever
+    exists (requests may have been saved in any storage), [] if there is none
+    """
+    rows = RequestData.objects.filter(request__id=request_id)
+    storage = request_data_storage()
+    if storage == "rows":
+        data_list = list(rows)
+        if data_list:
+            return data_list
+    documents = ExpertRequest.objects.filter(id=request_id).values_list(
+        "data_document", "input_blob__document"
+    )
+    for document in documents.first() or ():
+        if document is not None:
+            return from_document(document)
+    return [] if storage == "rows" else list(rows)
+
+
+async def aload_request_data(request_id: int) -> List[RequestData]:
+    """
+    like load_request_data for async views, with the async ORM
+    """
+    rows = RequestData.objects.filter(request__id=request_id)
+    storage = request_data_storage()
+    if storage == "rows":
+        data_list = [data async for data in rows]
+        if data_list:
+            return data_list
+    documents = await (
+        ExpertRequest.objects.filter(id=request_id)
+        .values_list("data_document", "input_blob__document")
+        .afirst()
+    )
+    for document in documents or ():
+        if document is not None:
+            return from_document(document)
+    return [] if storage == "rows" else [data async for data in rows]
+
+
+def pack_documents(
+    batch_size: int = 10000, delete_rows: bool = False, using: str = DEFAULT_DB_ALIAS
+) -> int:
+    """
+    write the data rows of every request without a data document into its document,
+    one transaction per batch of request ids. with delete_rows the rows of requests
+    with a document are deleted.
+    output: number of requests that got a document
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT min(request_id), max(request_id) FROM decision_requestdata"
+        )
+        first, last = cursor.fetchone()
+    if first is None:
+        return 0
+    packed = 0
+    for start in range(first, last + 1, batch_size):
+        bounds = [start, start + batch_size]
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    "UPDATE decision_expertrequest r SET data_document = d.document "
+                    "FROM (SELECT request_id, jsonb_agg(jsonb_build_array(type_id, "
+                    "value) ORDER BY id) AS document FROM decision_requestdata "
+                    "WHERE request_id >= %s AND request_id < %s GROUP BY request_id) d "
+                    "WHERE r.id = d.request_id AND r.data_document IS NULL",
+                    bounds,
+                )
+                packed += cursor.rowcount
+                if delete_rows:
+                    cursor.execute(
+                        "DELETE FROM decision_requestdata d "
+                        "USING decision_expertrequest r WHERE r.id = d.request_id "
+                        "AND r.data_document IS NOT NULL "
+                        "AND d.request_id >= %s AND d.request_id < %s",
+                        bounds,
+                    )
+    return packed
+
+
+def allocate_request_ids(count: int) -> List[int]:
+    """
+    input: number of requests that are about to be written
+    output: ids reserved for them in the id sequence of ExpertRequest, the requests
+    can be saved with these ids at any later time
+    """
+    if count <= 0:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [ExpertRequest._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def build_requests(
+    expert_requests: list,
+    version: Version,
+    ids: List[int] = None,
+    known: Set[int] = None,
+) -> Tuple[List[ExpertRequest], List[List[RequestData]]]:
+    """
+    input: expert requests (ExpertRequestIn) with their input data, the version that
+    is used for all of them, optionally their preallocated ids and the known data
+    types (see known_data_types)
+    output: the unsaved requests and the unsaved data of each request, data with
+    unknown data types is dropped
+    """
+    if ids is None:
+        ids = [None] * len(expert_requests)
+    requests = [
+        ExpertRequest(
+            id=request_id,
+            identifier=expert_request.identifier,
+            sec_identifier=expert_request.sec_identifier,
+            version=version,
+        )
+        for request_id, expert_request in zip(ids, expert_requests)
+    ]
+    if known is None:
+        known = known_data_types(
+            {
+                data.data_type
+                for expert_request in expert_requests
+                for data in expert_request.data or []
+            }
+        )
+    data_lists = [
+        [
+            RequestData(
+                request=request,
+                request_date=request.date,
+                type_id=data.data_type,
+                value=data.data_value,
+            )
+            for data in expert_request.data or []
+            if data.data_type in known
+        ]
+        for request, expert_request in zip(requests, expert_requests)
+    ]
+    return requests, data_lists
+
+
+def save_requests(
+    expert_requests: list, version: Version
+) -> Tuple[List[ExpertRequest], List[List[RequestData]]]:
+    """
+    input: expert requests (ExpertRequestIn) with their input data and the version
+    that is used for all of them
+    save all requests and all of their data with one bulk insert each (see
+    store_data for the other storages), data with unknown data types is dropped.
+    call this inside a transaction.
+    output: the saved requests and the saved data of each request
+    """
+    requests, saved_data = build_requests(expert_requests, version)
+    rows = store_data(requests, saved_data)
+    # bulk_create sets the ids on the request objects the data refers to
+    saved_requests = ExpertRequest.objects.bulk_create(requests)
+    RequestData.objects.bulk_create(rows)
+    return saved_requests, saved_data
+
+
+def save_decisions(decisions: List[Decision]) -> List[Decision]:
+    """
+    save all decisions of a bunch with one bulk insert, call inside a transaction
+    """
+    return Decision.objects.bulk_create(decisions)
+
+
+def write_requests(
+    requests: List[ExpertRequest],
+    data_lists: List[List[RequestData]],
+    decisions: List[Decision],
+):
+    """
+    input: requests with preallocated ids, their data and their decisions
+    write all of them with one bulk insert per table in one transaction, so either
+    everything about a request is saved or nothing
+    """
+    with transaction.atomic():
+        rows = store_data(requests, data_lists)
+        ExpertRequest.objects.bulk_create(requests)
+        RequestData.objects.bulk_create(rows)
+        Decision.objects.bulk_create(decisions)
+        # foreign keys are checked on commit, check them here to fail in this block
+        connection.check_constraints()
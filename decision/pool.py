@@ -0,0 +1,147 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Union
+
+from django.conf import settings
+
+from tree.models import Version
+from .batch import BatchEngine, BatchResult
+from .compiled import CompiledTree
+from .evaluator import EvaluationResult, Evaluator, EvaluatorException
+from .models import RequestData
+
+# large bunches can be walked by a pool of worker processes to use more than one
+# core (TREEXPERT_PROCESS_POOL_WORKERS). the workers are forked by a fork server, a
+# fresh process without the threads of this one (e.g. the audit log), and get the
+# compiled trees of the versions they work for once when they start (a tree mapped
+# from a tree file as its file, which they map themselves). a version
+# that the pool doesn't have yet starts a new pool. the parent process decodes and
+# encodes the input rows and sends them in chunks, each worker runs the batch engine
+# for a chunk and sends back only the arrays of its BatchResult. the results are
+# built from them in input order by the parent, like Evaluator.evaluate_batch.
+
+_lock = threading.Lock()
+_pool = None
+# compiled trees by Version.id, in the parent: the trees the pool was forked with
+_trees: Dict[int, CompiledTree] = {}
+# in a worker: its batch engines by Version.id
+_engines: Dict[int, BatchEngine] = {}
+# set by use_process_pool, overrides TREEXPERT_PROCESS_POOL_WORKERS
+_workers = None
+
+
+def pool_workers() -> int:
+    """
+    output: number of worker processes, 0 if the pool is not used
+    """
+    if _workers is not None:
+        return _workers
+    return getattr(settings, "TREEXPERT_PROCESS_POOL_WORKERS", 0)
+
+
+def use_process_pool(workers: int):
+    """
+    input: number of worker processes for this process (0 turns the pool off)
+    """
+    global _workers
+    _workers = workers
+    shutdown_pool()
+
+
+def shutdown_pool():
+    global _pool, _trees
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        # the next pool starts with the trees of the caller only
+        _trees = {}
+
+
+def initialize_worker(trees: Dict[int, CompiledTree]):
+    _engines.clear()
+    for version_id, compiled in trees.items():
+        _engines[version_id] = BatchEngine(compiled)
+
+
+def walk_rows(version_id: int, rows: List[List[any]]) -> Union[BatchResult, str]:
+    """
+    runs in a worker: walk the encoded rows with the tree of this version
+    output: the batch result or the message of the EvaluatorException it raised
+    """
+    engine = _engines[version_id]
+    try:
+        return engine.run(engine.encode(rows))
+    except EvaluatorException as error:
+        return error.message
+
+
+def get_pool(version: Version, compiled: CompiledTree) -> ProcessPoolExecutor:
+    """
+    output: a pool whose workers have the compiled tree of this version, a new pool is
+    started if the current one doesn't have it
+    """
+    global _pool, _trees
+    with _lock:
+        if _pool is None or version.id not in _trees:
+            if _pool is not None:
+                # running chunks finish, new chunks go to the new pool
+                _pool.shutdown(wait=False)
+            # imported here, since the cache module imports this one
+            from .cache import evaluator_cache
+
+            trees = {
+                version_id: tree
+                for version_id, tree in _trees.items()
+                if version_id in evaluator_cache
+            }
+            trees[version.id] = compiled
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["decision.pool_preload"])
+            _pool = ProcessPoolExecutor(
+                max_workers=pool_workers(),
+                mp_context=context,
+                initializer=initialize_worker,
+                initargs=(trees,),
+            )
+            _trees = trees
+        return _pool
+
+
+def evaluate_in_pool(
+    evaluator: Evaluator, version: Version, data_lists: List[List[RequestData]]
+) -> List[EvaluationResult]:
+    """
+    input: the evaluator of this version and the data of many entities
+    output: one result per entity, the same as evaluator.evaluate_batch. the rows are
+    walked by the worker processes in chunks of TREEXPERT_PROCESS_POOL_CHUNK_SIZE.
+    """
+    chunk_size = getattr(settings, "TREEXPERT_PROCESS_POOL_CHUNK_SIZE", 2000)
+    compiled = evaluator.compiled
+    rows = [compiled.encode(evaluator.decode(data)) for data in data_lists]
+    chunks = [
+        rows[start : start + chunk_size] for start in range(0, len(rows), chunk_size)
+    ]
+    try:
+        pool = get_pool(version, compiled)
+        results = list(pool.map(walk_rows, [version.id] * len(chunks), chunks))
+    except BrokenProcessPool:
+        # a worker died, the next call starts a new pool
+        shutdown_pool()
+        engine = evaluator.batch_engine
+        results = [engine.run(engine.encode(rows))]
+    return [
+        evaluator.result_of(row, walk) for row, walk in zip(rows, walks_of(results))
+    ]
+
+
+def walks_of(results: Iterable[Union[BatchResult, str]]) -> Iterable[tuple]:
+    """
+    output: the walks of all batch results in order (see BatchResult.walks)
+    """
+    for result in results:
+        if isinstance(result, str):
+            raise EvaluatorException(result)
+        yield from result.walks()
@@ -0,0 +1,8 @@
+import django
+
+# imported by the fork server of the process pool (see pool) before it starts any
+# worker: the workers are forked from it with django set up and the modules they
+# need to unpickle compiled trees and chunks already imported.
+django.setup()
+
+from . import pool  # noqa: E402, F401
@@ -2,9 +2,13 @@
 
 import json
 import os
+from datetime import timedelta
 from unittest.mock import call, patch
 
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from core.models import DataType
 from tree.models import Tree, TreeKind, TreeLeaf, TreeNode, Version
@@ -16,7 +20,10 @@ from ..api import (
     get_evaluator_for_version,
     save_request_data,
 )
+from ..cache import decision_cache, evaluator_cache
+from ..evaluator import EvaluationResult
 from ..models import RequestData, ExpertRequest, Decision
+from ..pool import shutdown_pool
 
 
 class DecisionApiTests(TestCase):
@@ -25,7 +32,7 @@ class DecisionApiTests(TestCase):
         super().setUpClass()
         cls.tree_kind = TreeKind(name="Test Kind", description="test description")
         cls.tree_kind.save()
-        cls.version = Version(kind_of_tree=cls.tree_kind, major=0, minor=1)
+        cls.version = Version(kind_of_tree=cls.tree_kind, major=0, minor=1, valid=True)
         cls.version.save()
         cls.first_leaf = TreeLeaf(
             tree_version=cls.version,
@@ -72,6 +79,11 @@ class DecisionApiTests(TestCase):
         cls.tree.save()
         cls.client = Client()
 
+    def setUp(self) -> None:
+        # the mocked evaluators return different results for the same input
+        decision_cache.clear()
+        return super().setUp()
+
     @patch("decision.evaluator.Evaluator")
     @patch("tree.models.Tree.objects.get_complete_tree")
     def test_use_tree_get_current_tree(self, mock_tree, MockEvaluator):
@@ -92,14 +104,14 @@ class DecisionApiTests(TestCase):
         assert mock_tree.called
 
     @patch("decision.evaluator.Evaluator", autospec=True)
-    def test_get_decision_call_run_tree(self, MockEvaluator):
+    def test_get_decision_call_evaluate(self, MockEvaluator):
         # arrange
         mock_evaluator = MockEvaluator(
             tree=self.tree, nodes=[self.node], leafs=[self.first_leaf, self.second_leaf]
         )
-        mock_evaluator.missing_data = self.data_type
-        mock_evaluator.node_missing_sth = self.node
-        mock_evaluator.criteria = []
+        mock_evaluator.evaluate.return_value = EvaluationResult(
+            missing_data=self.data_type, node_missing_sth=self.node
+        )
         request = ExpertRequest(
             identifier="test_entity",
             sec_identifier="test_entity_info",
@@ -115,7 +127,7 @@ class DecisionApiTests(TestCase):
             expert_request=request,
         )
         # assert
-        mock_evaluator.run_tree.assert_called_once_with(data=[data])
+        mock_evaluator.evaluate.assert_called_once_with(data=[data])
 
     @patch("decision.evaluator.Evaluator", autospec=True)
     def test_get_decision_return_decisionout_for_complete(self, MockEvaluator):
@@ -123,9 +135,9 @@ class DecisionApiTests(TestCase):
         mock_evaluator = MockEvaluator(
             tree=self.tree, nodes=[self.node], leafs=[self.first_leaf, self.second_leaf]
         )
-        mock_evaluator.missing_data = None
-        mock_evaluator.criteria = []
-        mock_evaluator.end_leaf = self.second_leaf
+        mock_evaluator.evaluate.return_value = EvaluationResult(
+            end_leaf=self.second_leaf
+        )
         request = ExpertRequest(
             identifier="test_entity",
             sec_identifier="test_entity_info",
@@ -155,9 +167,9 @@ class DecisionApiTests(TestCase):
         mock_evaluator = MockEvaluator(
             tree=self.tree, nodes=[self.node], leafs=[self.first_leaf, self.second_leaf]
         )
-        mock_evaluator.missing_data = self.data_type
-        mock_evaluator.criteria = []
-        mock_evaluator.node_missing_sth = self.node
+        mock_evaluator.evaluate.return_value = EvaluationResult(
+            missing_data=self.data_type, node_missing_sth=self.node
+        )
         request = ExpertRequest(
             identifier="test_entity",
             sec_identifier="test_entity_info",
@@ -190,9 +202,9 @@ class DecisionApiTests(TestCase):
         mock_evaluator = MockEvaluator(
             tree=self.tree, nodes=[self.node], leafs=[self.first_leaf, self.second_leaf]
         )
-        mock_evaluator.missing_data = self.data_type
-        mock_evaluator.criteria = []
-        mock_evaluator.node_missing_sth = self.node
+        mock_evaluator.evaluate.return_value = EvaluationResult(
+            missing_data=self.data_type, node_missing_sth=self.node
+        )
         mock_decision_create.create.return_value = True
         request = ExpertRequest(
             identifier="test_entity",
@@ -220,9 +232,9 @@ class DecisionApiTests(TestCase):
         mock_evaluator = MockEvaluator(
             tree=self.tree, nodes=[self.node], leafs=[self.first_leaf, self.second_leaf]
         )
-        mock_evaluator.missing_data = None
-        mock_evaluator.criteria = []
-        mock_evaluator.end_leaf = self.second_leaf
+        mock_evaluator.evaluate.return_value = EvaluationResult(
+            end_leaf=self.second_leaf
+        )
         mock_decision_create.create.return_value = True
         request = ExpertRequest(
             identifier="test_entity",
@@ -241,10 +253,13 @@ class DecisionApiTests(TestCase):
         # assert
         mock_decision_create.create.assert_called_with(
             request=request,
+            request_date=request.date,
             description=self.second_leaf.display_name,
             result=self.second_leaf.result,
             end_leaf=self.second_leaf,
             is_preliminary=False,
+            path=b"",
+            path_results=b"",
         )
 
     @patch("decision.api.get_version")
@@ -283,12 +298,21 @@ class DecisionApiTests(TestCase):
                 RequestDataIn(data_type=self.data_type.id, data_value="test"),
             ],
         )
-        mock_expert_request.create.return_value = "request"
+        saved_request = ExpertRequest(
+            identifier="test_entity",
+            sec_identifier="test_entity_info",
+            version=self.version,
+        )
+        mock_expert_request.create.return_value = saved_request
         mock_request_data.create.return_value = "test"
         expected_calls = [
-            call(request="request", type_id=self.data_type.id, value=5),
-            call(request="request", type_id=self.data_type.id, value=True),
-            call(request="request", type_id=self.data_type.id, value="test"),
+            call(
+                request=saved_request,
+                request_date=saved_request.date,
+                type_id=self.data_type.id,
+                value=value,
+            )
+            for value in (5, True, "test")
         ]
         # act
         result = save_request_data(expert_request=request)
@@ -325,6 +349,35 @@ class DecisionApiTests(TestCase):
         self.assertEqual(request_out["sec_identifier"], "test_entity_info")
         self.assertIsNotNone(request_out["date"])
 
+    def test_client_get_requests_for_entity_pages(self):
+        dates = [timezone.now() - timedelta(days=days) for days in (1, 3, 2, 2)]
+        requests = [
+            ExpertRequest.objects.create(
+                identifier="test_entity",
+                sec_identifier="test_entity_info",
+                version=self.version,
+                date=date,
+            )
+            for date in dates
+        ]
+        # oldest first, the id decides between requests of the same date
+        expected = [requests[1].id, requests[2].id, requests[3].id, requests[0].id]
+        url = "/api/decision/requests/test_entity/test_entity_info"
+        ids = []
+        after = ""
+        while True:
+            response = self.client.get(url + "?limit=3" + after)
+            self.assertEqual(response.status_code, 200)
+            page = [request["id"] for request in response.json()]
+            if not page:
+                break
+            ids.extend(page)
+            after = "&after=" + str(page[-1])
+        self.assertEqual(ids, expected)
+        response = self.client.get(url + "?stream=true")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], expected)
+
     def test_client_get_data_for_request(self):
         # arrange
         request = ExpertRequest(
@@ -401,68 +454,76 @@ def helper_add_treekindid_to_ids(json, treekindid):
     return json
 
 
-class DecisionIntegrationTests(TestCase):
-    @classmethod
-    def setUpClass(cls) -> None:
-        super().setUpClass()
-        # setup client for get and post requests
-        cls.client = Client()
-
-        # setup tree and data types
-        file_core = open(os.path.join(os.path.dirname(__file__), "testinput_core.json"))
-        file_tree = open(os.path.join(os.path.dirname(__file__), "testinput_tree.json"))
-        file_kind = open(os.path.join(os.path.dirname(__file__), "testinput_kind.json"))
-        data_core = json.load(file_core)
-        data_tree = json.load(file_tree)
-        data_kind = json.load(file_kind)
-        file_core.close()
-        file_tree.close()
-        file_kind.close()
-
-        # add tree kind to data base
-        response = cls.client.post("/api/tree/kind/new", data_kind, "application/json")
-        print(response.json())
-        cls.tree_kind_id = response.json()["id"]
-
-        # read data types
-        for data_type in data_core:
-            response = cls.client.post(
-                "/api/core/datatype/new", data_type, "application/json"
-            )
-            print(response.json())
-
-        # build dict of datatype to use later to have the right ids
-        cls.datatype_dict = dict()
-        for datatype in DataType.objects.all():
-            cls.datatype_dict[datatype.name] = datatype.id
-
-        # switch data type strings out for the ids in tree
-        data_tree = helper_replace_datatype_str_with_ids_in_tree(
-            data_tree, cls.datatype_dict
-        )
-
-        # read tree and hope the data type ids match up ...
+def load_test_tree(cls):
+    """
+    post the tree and data types of the test input files and read the decision
+    inputs and expected outputs
+    """
+    # setup client for get and post requests
+    cls.client = Client()
+
+    # setup tree and data types
+    file_core = open(os.path.join(os.path.dirname(__file__), "testinput_core.json"))
+    file_tree = open(os.path.join(os.path.dirname(__file__), "testinput_tree.json"))
+    file_kind = open(os.path.join(os.path.dirname(__file__), "testinput_kind.json"))
+    data_core = json.load(file_core)
+    data_tree = json.load(file_tree)
+    data_kind = json.load(file_kind)
+    file_core.close()
+    file_tree.close()
+    file_kind.close()
+
+    # add tree kind to data base
+    response = cls.client.post("/api/tree/kind/new", data_kind, "application/json")
+    print(response.json())
+    cls.tree_kind_id = response.json()["id"]
+
+    # read data types
+    for data_type in data_core:
         response = cls.client.post(
-            "/api/tree/new/" + str(cls.tree_kind_id), data_tree, "application/json"
+            "/api/core/datatype/new", data_type, "application/json"
         )
         print(response.json())
 
-        # setup decision inputs and outputs
-        file_input = open(
-            os.path.join(os.path.dirname(__file__), "testinput_decision.json")
-        )
-        file_output = open(
-            os.path.join(os.path.dirname(__file__), "testoutput_decision.json")
-        )
-        cls.decision_input = helper_replace_datatype_str_with_ids(
-            json.load(file_input), cls.datatype_dict
-        )
-        cls.decision_output = helper_add_treekindid_to_ids(
-            json.load(file_output), cls.tree_kind_id
-        )
+    # build dict of datatype to use later to have the right ids
+    cls.datatype_dict = dict()
+    for datatype in DataType.objects.all():
+        cls.datatype_dict[datatype.name] = datatype.id
+
+    # switch data type strings out for the ids in tree
+    data_tree = helper_replace_datatype_str_with_ids_in_tree(
+        data_tree, cls.datatype_dict
+    )
+
+    # read tree and hope the data type ids match up ...
+    response = cls.client.post(
+        "/api/tree/new/" + str(cls.tree_kind_id), data_tree, "application/json"
+    )
+    print(response.json())
+
+    # setup decision inputs and outputs
+    file_input = open(
+        os.path.join(os.path.dirname(__file__), "testinput_decision.json")
+    )
+    file_output = open(
+        os.path.join(os.path.dirname(__file__), "testoutput_decision.json")
+    )
+    cls.decision_input = helper_replace_datatype_str_with_ids(
+        json.load(file_input), cls.datatype_dict
+    )
+    cls.decision_output = helper_add_treekindid_to_ids(
+        json.load(file_output), cls.tree_kind_id
+    )
+
+    file_input.close()
+    file_output.close()
 
-        file_input.close()
-        file_output.close()
+
+class DecisionIntegrationTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        load_test_tree(cls)
 
     def test_simple_input(self):
         # arrange
@@ -509,6 +570,78 @@ class DecisionIntegrationTests(TestCase):
         # assert
         self.assertEqual(response_single.json(), response_bunch.json()[0])
 
+    def post_stream(self, entities, fullresult="false"):
+        body = "".join(json.dumps(entity) + "\n" for entity in entities)
+        return self.client.post(
+            "/api/decision/bunch/stream/" + fullresult, body, "application/x-ndjson"
+        )
+
+    def test_stream_yields_same_as_bunch(self):
+        # arrange
+        inputs = list(self.decision_input.values())
+        # act
+        response_bunch = self.client.post(
+            "/api/decision/bunch/true", inputs, "application/json"
+        )
+        response_stream = self.post_stream(inputs, "true")
+        # assert
+        self.assertEqual(response_stream.status_code, 200)
+        self.assertEqual(response_stream["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response_stream.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], response_bunch.json())
+
+    @override_settings(TREEXPERT_DECISION_STREAM_CHUNK_SIZE=2)
+    def test_stream_decides_in_chunks(self):
+        # arrange
+        input = self.decision_input["1-1.0_L.20"]
+        before = ExpertRequest.objects.count()
+        # act
+        response = self.post_stream([input] * 5)
+        content = iter(response.streaming_content)
+        first = next(content)
+        # assert: only the first chunk is read and saved before it is sent
+        self.assertEqual(len(first.splitlines()), 2)
+        self.assertEqual(ExpertRequest.objects.count(), before + 2)
+        rest = b"".join(content).splitlines()
+        self.assertEqual(len(rest), 3)
+        self.assertEqual(ExpertRequest.objects.count(), before + 5)
+        self.assertEqual(json.loads(rest[-1]), self.decision_output["1-1.0_L.20"])
+
+    def test_stream_reports_invalid_lines(self):
+        # arrange
+        input = self.decision_input["1-1.0_L.20"]
+        body = json.dumps(input) + "\n\n" + '{"identifier": 1}\n' + json.dumps(input)
+        # act
+        response = self.client.post(
+            "/api/decision/bunch/stream/false", body, "application/x-ndjson"
+        )
+        lines = b"".join(response.streaming_content).splitlines()
+        # assert
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0]), self.decision_output["1-1.0_L.20"])
+        self.assertEqual(json.loads(lines[1])["line"], 3)
+        self.assertTrue(json.loads(lines[1])["errors"])
+        self.assertEqual(json.loads(lines[2]), self.decision_output["1-1.0_L.20"])
+
+    @override_settings(TREEXPERT_DECISION_STREAM_CHUNK_SIZE=2)
+    def test_stream_reports_evaluator_errors(self):
+        # arrange: the second entity has the same data type twice
+        input = self.decision_input["1-1.0_L.20"]
+        duplicate = dict(input, data=input["data"] + input["data"][:1])
+        before = ExpertRequest.objects.count()
+        # act
+        response = self.post_stream([input, duplicate, input])
+        lines = b"".join(response.streaming_content).splitlines()
+        # assert: one line per entity, only the failing one is not saved
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0]), self.decision_output["1-1.0_L.20"])
+        self.assertEqual(json.loads(lines[1])["line"], 2)
+        self.assertEqual(
+            json.loads(lines[1])["errors"][0]["msg"], "error evaluating with this data"
+        )
+        self.assertEqual(json.loads(lines[2]), self.decision_output["1-1.0_L.20"])
+        self.assertEqual(ExpertRequest.objects.count(), before + 2)
+
     def test_results_for_all_paths_through_tree(self):
         # arrange
         self.maxDiff = None
@@ -524,6 +657,120 @@ class DecisionIntegrationTests(TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.json(), self.decision_output[key])
 
+    def test_explain_matches_full_result(self):
+        for key in self.decision_input:
+            response = self.client.post(
+                "/api/decision/true", self.decision_input[key], "application/json"
+            )
+            request = ExpertRequest.objects.latest("id")
+            # act
+            with CaptureQueriesContext(connection) as queries:
+                explained = self.client.get("/api/decision/explain/" + str(request.id))
+            # assert
+            self.assertEqual(explained.status_code, 200)
+            self.assertEqual(explained.json(), response.json()["criteria"])
+            self.assertLessEqual(len(queries.captured_queries), 2)
+
+    def test_explain_without_path(self):
+        self.client.post(
+            "/api/decision/true", self.decision_input["1-1.0_L.20"], "application/json"
+        )
+        request = ExpertRequest.objects.latest("id")
+        Decision.objects.filter(request__id=request.id).update(
+            path=None, path_results=None
+        )
+        response = self.client.get("/api/decision/explain/" + str(request.id))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/decision/explain/" + str(request.id + 1))
+        self.assertEqual(response.status_code, 404)
+
+    def test_bunch_queries_do_not_grow_with_bunch_size(self):
+        # arrange
+        input = self.decision_input["1-1.0_L.20"]
+        self.client.post("/api/decision/bunch/false", [input], "application/json")
+        # act
+        with CaptureQueriesContext(connection) as single:
+            self.client.post("/api/decision/bunch/false", [input], "application/json")
+        with CaptureQueriesContext(connection) as bunch:
+            self.client.post(
+                "/api/decision/bunch/false", [input] * 25, "application/json"
+            )
+
+        # assert
+        def inserts(context):
+            return [
+                q for q in context.captured_queries if q["sql"].startswith("INSERT")
+            ]
+
+        self.assertEqual(len(inserts(single)), 3)
+        self.assertEqual(len(inserts(bunch)), 3)
+        # evaluating does not query anything per entity or visited node
+        self.assertEqual(len(single.captured_queries), len(bunch.captured_queries))
+
+    @override_settings(TREEXPERT_BATCH_ENGINE_MIN_SIZE=1)
+    def test_results_for_all_paths_through_tree_batch_engine(self):
+        # arrange
+        self.maxDiff = None
+        keys = list(self.decision_input)
+        # act
+        response = self.client.post(
+            "/api/decision/bunch/false",
+            [self.decision_input[key] for key in keys],
+            "application/json",
+        )
+        # assert
+        self.assertEqual(response.status_code, 200)
+        for key, result in zip(keys, response.json()):
+            self.assertEqual(result, self.decision_output[key])
+
+    @override_settings(
+        TREEXPERT_PROCESS_POOL_WORKERS=2,
+        TREEXPERT_PROCESS_POOL_MIN_SIZE=1,
+        TREEXPERT_PROCESS_POOL_CHUNK_SIZE=3,
+    )
+    def test_results_for_all_paths_through_tree_process_pool(self):
+        # arrange
+        self.maxDiff = None
+        keys = list(self.decision_input)
+        decision_cache.clear()
+        # act
+        try:
+            response = self.client.post(
+                "/api/decision/bunch/true",
+                [self.decision_input[key] for key in keys],
+                "application/json",
+            )
+        finally:
+            shutdown_pool()
+        decision_cache.clear()
+        single = [
+            self.client.post(
+                "/api/decision/true", self.decision_input[key], "application/json"
+            ).json()
+            for key in keys
+        ]
+        # assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), single)
+
+    @override_settings(TREEXPERT_EVALUATOR_BACKEND="codegen")
+    def test_results_for_all_paths_through_tree_codegen(self):
+        # arrange
+        self.maxDiff = None
+        evaluator_cache.clear()
+        self.addCleanup(evaluator_cache.clear)
+        keys = list(self.decision_input)
+        # act
+        response = self.client.post(
+            "/api/decision/bunch/false",
+            [self.decision_input[key] for key in keys],
+            "application/json",
+        )
+        # assert
+        self.assertEqual(response.status_code, 200)
+        for key, result in zip(keys, response.json()):
+            self.assertEqual(result, self.decision_output[key])
+
 
 class DecisionLongTests(TestCase):
     @classmethod
@@ -0,0 +1,149 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import json
+import tempfile
+from datetime import date, datetime, timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+
+from core.models import DataType
+from tree.models import TreeKind, TreeLeaf, Version
+
+from ..archive import compact_logs, compact_month, get_archive
+from ..models import Decision, ExpertRequest, RequestData
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        cls.version = Version.objects.create(
+            kind_of_tree=cls.tree_kind, major=0, minor=1, valid=True
+        )
+        cls.leaf = TreeLeaf.objects.create(
+            tree_version=cls.version, number=1, display_name="leaf", result=True
+        )
+        cls.data_type = DataType.objects.create(name="TEST1", display_name="test")
+        cls.client = Client()
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(TREEXPERT_ARCHIVE_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        return super().setUp()
+
+    def log(
+        self, moment: datetime, identifier: str = "old_entity", decided: bool = True
+    ) -> ExpertRequest:
+        request = ExpertRequest.objects.create(
+            identifier=identifier,
+            sec_identifier="info",
+            version=self.version,
+            date=moment,
+        )
+        for value in (1, "two"):
+            RequestData.objects.create(
+                request=request, request_date=moment, type=self.data_type, value=value
+            )
+        if decided:
+            Decision.objects.create(
+                request=request,
+                request_date=moment,
+                description="leaf",
+                result=True,
+                end_leaf=self.leaf,
+                is_preliminary=False,
+            )
+        return request
+
+    def test_compact_month(self):
+        march = [
+            self.log(datetime(2020, 3, day, tzinfo=timezone.utc), "entity_" + str(day))
+            for day in (1, 2, 3)
+        ]
+        undecided = self.log(datetime(2020, 3, 4, tzinfo=timezone.utc), decided=False)
+        april = self.log(datetime(2020, 4, 1, tzinfo=timezone.utc))
+        self.assertEqual(compact_month(date(2020, 3, 1), block_size=2), 4)
+        self.assertEqual(compact_month(date(2020, 3, 1)), 0)
+
+        self.assertFalse(ExpertRequest.objects.filter(date__month=3).exists())
+        self.assertFalse(RequestData.objects.filter(request_id=march[0].id).exists())
+        self.assertFalse(Decision.objects.filter(request_id=march[0].id).exists())
+        self.assertTrue(Decision.objects.filter(request_id=april.id).exists())
+
+        archive = get_archive()
+        record = archive.get(march[2].id)
+        self.assertEqual(record["identifier"], "entity_3")
+        self.assertEqual(datetime.fromisoformat(record["date"]).day, 3)
+        self.assertEqual([value for _, _, value in record["data"]], [1, "two"])
+        self.assertEqual(record["decision"]["end_leaf"], self.leaf.id)
+        self.assertIsNone(archive.get(undecided.id)["decision"])
+        self.assertIsNone(archive.get(april.id))
+        self.assertEqual(
+            archive.requests_for_entity("old_entity", "info"), [undecided.id]
+        )
+
+    def test_fallback_endpoints(self):
+        request = self.log(datetime(2020, 3, 1, tzinfo=timezone.utc))
+        data_ids = list(
+            RequestData.objects.filter(request_id=request.id).values_list(
+                "id", flat=True
+            )
+        )
+        decision = Decision.objects.get(request_id=request.id)
+        undecided = self.log(datetime(2020, 3, 2, tzinfo=timezone.utc), decided=False)
+        self.assertEqual(compact_logs(date(2020, 4, 1)), {date(2020, 3, 1): 2})
+
+        response = self.client.get("/api/decision/result/" + str(request.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], decision.id)
+        self.assertEqual(response.json()["request"]["identifier"], "old_entity")
+        self.assertEqual(response.json()["end_leaf"]["display_name"], "leaf")
+        response = self.client.get("/api/decision/data/" + str(request.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {"id": data_ids[0], "type": self.data_type.id, "value": 1},
+                {"id": data_ids[1], "type": self.data_type.id, "value": "two"},
+            ],
+        )
+        response = self.client.get("/api/decision/result/" + str(undecided.id))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/decision/data/" + str(undecided.id + 1))
+        self.assertEqual(response.status_code, 404)
+
+    def test_requests_for_entity(self):
+        archived = [
+            self.log(datetime(2020, 3, day, tzinfo=timezone.utc)) for day in (1, 2)
+        ]
+        compact_logs(date(2020, 4, 1))
+        saved = self.log(datetime(2020, 4, 1, tzinfo=timezone.utc))
+        ids = [request.id for request in archived] + [saved.id]
+        url = "/api/decision/requests/old_entity/info"
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([request["id"] for request in response.json()], ids)
+        self.assertEqual(response.json()[0]["version"], self.version.id)
+        # pages across the archive and the saved requests
+        response = self.client.get(url, {"limit": 1, "after": ids[0]})
+        self.assertEqual([request["id"] for request in response.json()], ids[1:2])
+        response = self.client.get(url, {"limit": 2, "after": ids[1]})
+        self.assertEqual([request["id"] for request in response.json()], ids[2:])
+        response = self.client.get(url, {"stream": True})
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], ids)
+
+    def test_command(self):
+        request = self.log(datetime(2020, 3, 1, tzinfo=timezone.utc))
+        stdout = StringIO()
+        call_command("compact_logs", "--months", "0", stdout=stdout)
+        self.assertIn("archived 1 requests of 2020-03", stdout.getvalue())
+        self.assertIsNotNone(get_archive().get(request.id))
@@ -0,0 +1,115 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, override_settings
+
+from ..audit import AuditLog
+from ..models import Decision, ExpertRequest
+from .test_api import load_test_tree
+
+
+class DecisionAsyncTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        load_test_tree(cls)
+        cls.async_client = AsyncClient()
+
+    async def test_same_as_sync(self):
+        for key in self.decision_input:
+            # act
+            response = await self.async_client.post(
+                "/api/decision/async/false",
+                self.decision_input[key],
+                content_type="application/json",
+            )
+            # assert
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), self.decision_output[key])
+
+    async def test_full_result_same_as_sync(self):
+        input = self.decision_input["1-1.0_L.20"]
+        response_sync = await sync_to_async(self.client.post)(
+            "/api/decision/true", input, "application/json"
+        )
+        response_async = await self.async_client.post(
+            "/api/decision/async/true", input, content_type="application/json"
+        )
+        self.assertEqual(response_async.json(), response_sync.json())
+
+    async def test_request_is_saved(self):
+        input = self.decision_input["1-1.0_L.20"]
+        await self.async_client.post(
+            "/api/decision/async/true", input, content_type="application/json"
+        )
+        request = await ExpertRequest.objects.alatest("id")
+        self.assertEqual(request.identifier, input["identifier"])
+        decision = await Decision.objects.aget(request__id=request.id)
+        self.assertIsNotNone(decision.path)
+        sync_result = await sync_to_async(self.client.get)(
+            "/api/decision/result/" + str(request.id)
+        )
+        async_result = await self.async_client.get(
+            "/api/decision/async/result/" + str(request.id)
+        )
+        self.assertEqual(async_result.status_code, 200)
+        self.assertEqual(async_result.json(), sync_result.json())
+        sync_data = await sync_to_async(self.client.get)(
+            "/api/decision/data/" + str(request.id)
+        )
+        async_data = await self.async_client.get(
+            "/api/decision/async/data/" + str(request.id)
+        )
+        self.assertEqual(async_data.status_code, 200)
+        self.assertEqual(async_data.json(), sync_data.json())
+        response = await self.async_client.get(
+            "/api/decision/async/result/" + str(request.id + 1)
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_bunch_same_as_sync(self):
+        inputs = list(self.decision_input.values())
+        response = await self.async_client.post(
+            "/api/decision/async/bunch/false", inputs, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), list(self.decision_output.values()))
+        self.assertEqual(await ExpertRequest.objects.acount(), len(inputs))
+
+    async def test_write_behind(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        log = AuditLog(spool_dir.name, batch_size=100)
+        log.open()
+        self.addCleanup(log.stop)
+        input = self.decision_input["1-1.0_L.20"]
+        with override_settings(TREEXPERT_AUDIT_WRITE_BEHIND=True), patch(
+            "decision.async_api.get_audit_log", return_value=log
+        ):
+            response = await self.async_client.post(
+                "/api/decision/async/false", input, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(log.waiting(), 1)
+        self.assertEqual(await ExpertRequest.objects.acount(), 0)
+
+    def test_throughput_command(self):
+        self.client.post(
+            "/api/decision/false", self.decision_input["1-1.0_L.20"], "application/json"
+        )
+        stdout = StringIO()
+        call_command(
+            "decision_throughput",
+            "--requests",
+            "20",
+            "--concurrency",
+            "1",
+            stdout=stdout,
+        )
+        self.assertIn("sync", stdout.getvalue())
+        self.assertIn("async", stdout.getvalue())
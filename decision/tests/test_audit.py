@@ -0,0 +1,209 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from django.db import OperationalError
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from core.models import DataType
+from tree.models import Tree, TreeKind, TreeLeaf, TreeNode, Version
+
+from ..api import ExpertRequestIn, RequestDataIn
+from ..audit import AuditLog, to_record
+from ..models import Decision, ExpertRequest, RequestData
+from ..persistence import allocate_request_ids, build_requests
+
+
+class AuditLogTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        cls.version = Version.objects.create(
+            kind_of_tree=cls.tree_kind, major=0, minor=1, valid=True
+        )
+        cls.first_leaf = TreeLeaf.objects.create(
+            tree_version=cls.version, number=1, display_name="low", result=False
+        )
+        cls.second_leaf = TreeLeaf.objects.create(
+            tree_version=cls.version, number=2, display_name="high", result=True
+        )
+        cls.data_type = DataType.objects.create(name="TEST1", display_name="test")
+        cls.node = TreeNode.objects.create(
+            tree_version=cls.version,
+            number=3,
+            display_name="test_node",
+            data_type=cls.data_type,
+            data_value=10,
+            true_successor=cls.second_leaf,
+            false_successor=cls.first_leaf,
+        )
+        Tree.objects.create(root=cls.node, tree_version=cls.version)
+
+    def setUp(self) -> None:
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        self.log = AuditLog(self.spool_dir.name, batch_size=2)
+        self.log.open()
+        self.addCleanup(self.log.stop)
+        return super().setUp()
+
+    def build(self, count: int):
+        """
+        output: unsaved requests with allocated ids, their data and decisions
+        """
+        requests, data_lists = build_requests(
+            [
+                ExpertRequestIn(
+                    identifier="entity_" + str(number),
+                    sec_identifier="info",
+                    data=[
+                        RequestDataIn(data_type=self.data_type.id, data_value=number)
+                    ],
+                )
+                for number in range(count)
+            ],
+            self.version,
+            allocate_request_ids(count),
+        )
+        decisions = [
+            Decision(
+                request=request,
+                description="high",
+                result=True,
+                end_leaf=self.second_leaf,
+                is_preliminary=False,
+            )
+            for request in requests
+        ]
+        return requests, data_lists, decisions
+
+    def spool_lines(self):
+        return [
+            line
+            for path in Path(self.spool_dir.name).glob("*.jsonl")
+            for line in path.read_text().splitlines()
+        ]
+
+    def test_allocate_request_ids(self):
+        ids = allocate_request_ids(5)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(ids, sorted(ids))
+        request = ExpertRequest.objects.create(
+            identifier="x", sec_identifier="y", version=self.version
+        )
+        self.assertGreater(request.id, ids[-1])
+        self.assertEqual(allocate_request_ids(0), [])
+
+    def test_submit_and_flush(self):
+        requests, data_lists, decisions = self.build(3)
+        requests[0].date = timezone.now() - timedelta(hours=1)
+        self.log.submit(requests, data_lists, decisions)
+        self.assertFalse(ExpertRequest.objects.exists())
+        self.assertEqual(len(self.spool_lines()), 3)
+        self.assertEqual(self.log.waiting(), 3)
+
+        self.assertEqual(self.log.flush(), 3)
+        saved = ExpertRequest.objects.get(id=requests[0].id)
+        self.assertEqual(saved.date, requests[0].date)
+        self.assertEqual(RequestData.objects.get(request=saved).value, 0)
+        self.assertEqual(Decision.objects.get(request=saved).end_leaf, self.second_leaf)
+        self.assertEqual(Decision.objects.count(), 3)
+        # everything is written, the spool is emptied
+        self.assertEqual(self.spool_lines(), [])
+        self.assertEqual(self.log.waiting(), 0)
+
+    def test_failed_write_is_kept(self):
+        self.log.submit(*self.build(3))
+        with patch("decision.audit.write_requests", side_effect=OperationalError):
+            self.assertEqual(self.log.flush(), 0)
+        self.assertEqual(len(self.spool_lines()), 3)
+        self.assertEqual(self.log.waiting(), 3)
+        self.assertEqual(self.log.flush(), 3)
+        self.assertEqual(ExpertRequest.objects.count(), 3)
+        self.assertEqual(self.spool_lines(), [])
+
+    def test_invalid_record_is_dropped(self):
+        requests, data_lists, decisions = self.build(2)
+        data_lists[0][0].type_id = -1
+        self.log.submit(requests, data_lists, decisions)
+        self.assertEqual(self.log.flush(), 2)
+        self.assertEqual(
+            list(ExpertRequest.objects.values_list("id", flat=True)), [requests[1].id]
+        )
+
+    def test_take_over_spool_of_other_process(self):
+        requests, data_lists, decisions = self.build(3)
+        # the first request was written before the other process went away
+        self.log.submit(requests[:1], data_lists[:1], decisions[:1])
+        self.log.flush()
+        orphan = Path(self.spool_dir.name) / "audit-0.jsonl"
+        orphan.write_text(
+            "".join(
+                json.dumps(to_record(*record)) + "\n"
+                for record in zip(requests, data_lists, decisions)
+            )
+        )
+        # a new process, the spool of the running one is left alone
+        log = AuditLog(self.spool_dir.name)
+        log.pid = 1
+        log.open()
+        self.addCleanup(log.stop)
+        self.assertFalse(orphan.exists())
+        self.assertEqual(log.waiting(), 3)
+        self.assertEqual(log.flush(), 3)
+        self.assertEqual(ExpertRequest.objects.count(), 3)
+        self.assertEqual(RequestData.objects.count(), 3)
+
+    def test_spool_in_use_is_not_taken_over(self):
+        self.log.submit(*self.build(1))
+        log = AuditLog(self.spool_dir.name)
+        log.pid = 0
+        log.open()
+        self.addCleanup(log.stop)
+        self.assertEqual(log.waiting(), 0)
+        self.assertEqual(self.log.waiting(), 1)
+
+    def test_write_behind_endpoints(self):
+        client = Client()
+        with override_settings(TREEXPERT_AUDIT_WRITE_BEHIND=True), patch(
+            "decision.api.get_audit_log", return_value=self.log
+        ):
+            response = client.post(
+                "/api/decision/false",
+                {
+                    "identifier": "a",
+                    "sec_identifier": "b",
+                    "data": [{"data_type": self.data_type.id, "data_value": 20}],
+                },
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["decision"]["description"], "high")
+            response = client.post(
+                "/api/decision/bunch/false",
+                [
+                    {
+                        "identifier": "c",
+                        "sec_identifier": "d",
+                        "data": [{"data_type": self.data_type.id, "data_value": 1}],
+                    }
+                ],
+                content_type="application/json",
+            )
+            self.assertEqual(response.json()[0]["decision"]["description"], "low")
+        self.assertFalse(ExpertRequest.objects.exists())
+
+        self.assertEqual(self.log.flush(), 2)
+        request = ExpertRequest.objects.get(identifier="a")
+        response = client.get("/api/decision/result/" + str(request.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["description"], "high")
+        self.assertEqual(
+            Decision.objects.get(request__identifier="c").end_leaf, self.first_leaf
+        )
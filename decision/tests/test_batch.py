@@ -0,0 +1,93 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import random
+
+from django.test import SimpleTestCase
+
+from tree.models import TreeLeaf, TreeNode
+
+from ..batch import BatchEngine
+from ..compiled import CompiledTree
+
+
+def build_tree(rng: random.Random, depth: int):
+    """
+    build a complete binary tree of unsaved nodes and leaves with random comparisons
+    on three columns: 1 = integers, 2 = strings, 3 = booleans
+    """
+    nodes = []
+    leafs = []
+
+    def build(level: int) -> str:
+        if level == depth:
+            leaf = TreeLeaf(
+                id="L." + str(len(leafs)), number=len(leafs), result=rng.random() > 0.5
+            )
+            leafs.append(leaf)
+            return leaf.id
+        node = TreeNode(id="N." + str(len(nodes)), number=len(nodes))
+        nodes.append(node)
+        node.data_type_id = rng.choice([1, 2, 3])
+        if node.data_type_id == 1:
+            node.data_value = rng.choice([rng.randint(-5, 5), 2**60])
+            node.comparison = rng.choice(["GT", "ST", "EQ", "NE"])
+        elif node.data_type_id == 2:
+            node.data_value = rng.choice(["a", "b", "c"])
+            node.comparison = rng.choice(["GT", "ST", "EQ", "NE"])
+        else:
+            node.data_value = rng.choice([True, False])
+            node.comparison = rng.choice(["EQ", "NE"])
+        node.list_comparison = rng.choice(["ALL", "ONE", "TWO", ""])
+        node.true_id = build(level + 1)
+        node.false_id = build(level + 1)
+        return node.id
+
+    root = build(0)
+    return root, nodes, leafs
+
+
+def random_input(rng: random.Random) -> dict:
+    candidates = {
+        1: [
+            rng.randint(-6, 6),
+            2**60 + rng.randint(-1, 1),
+            [rng.randint(-6, 6) for _ in range(rng.randint(0, 3))],
+            rng.random() * 10 - 5,
+        ],
+        2: ["a", "b", "c", ["a", "c"], ["b"]],
+        3: [True, False, 1, 0, [True, False]],
+    }
+    data = dict()
+    for data_type, values in candidates.items():
+        if rng.random() > 0.1:
+            data[data_type] = rng.choice(values)
+    return data
+
+
+class BatchEngineTests(SimpleTestCase):
+    def test_batch_matches_single_walk(self):
+        rng = random.Random(42)
+        for depth in [1, 3, 6]:
+            root, nodes, leafs = build_tree(rng, depth)
+            compiled = CompiledTree(root, nodes, leafs)
+            rows = [compiled.encode(random_input(rng)) for _ in range(500)]
+            engine = BatchEngine(compiled)
+            result = engine.run(engine.encode(rows))
+            self.assertEqual(len(result), len(rows))
+            walks = result.walks()
+            for entity, row in enumerate(rows):
+                self.assertEqual(result.walk(entity), compiled.walk(row))
+                self.assertEqual(walks[entity], compiled.walk(row))
+
+    def test_empty_batch(self):
+        root, nodes, leafs = build_tree(random.Random(1), 2)
+        engine = BatchEngine(CompiledTree(root, nodes, leafs))
+        result = engine.run(engine.encode([]))
+        self.assertEqual(len(result), 0)
+
+    def test_all_missing(self):
+        root, nodes, leafs = build_tree(random.Random(1), 2)
+        compiled = CompiledTree(root, nodes, leafs)
+        engine = BatchEngine(compiled)
+        result = engine.run(engine.encode([compiled.encode({})] * 3))
+        self.assertEqual(result.walk(2), ([], [], -1, 0))
@@ -0,0 +1,198 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+from unittest.mock import patch
+
+from django.test import Client, TestCase, override_settings
+
+from core.models import DataType
+from tree.models import Tree, TreeKind, TreeLeaf, TreeNode, Version
+from tree.signals import tree_published
+
+from ..batch import BatchEngine
+from ..cache import (
+    canonical_input,
+    decision_cache,
+    evaluate_cached,
+    evaluate_many_cached,
+    evaluator_cache,
+    get_cached_evaluator,
+)
+from ..models import ExpertRequest, RequestData
+
+
+class EvaluatorCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind(name="Test Kind", description="test description")
+        cls.tree_kind.save()
+        cls.version = Version(kind_of_tree=cls.tree_kind, major=0, minor=1, valid=True)
+        cls.version.save()
+        cls.first_leaf = TreeLeaf(
+            tree_version=cls.version,
+            number=1,
+            display_name="test_result1",
+            result=False,
+        )
+        cls.first_leaf.save()
+        cls.second_leaf = TreeLeaf(
+            tree_version=cls.version,
+            number=2,
+            display_name="test_result2",
+            result=True,
+        )
+        cls.second_leaf.save()
+        cls.data_type = DataType(name="TEST1", display_name="test type")
+        cls.data_type.save()
+        cls.node = TreeNode(
+            tree_version=cls.version,
+            number=4,
+            display_name="test_node",
+            description="this is a description",
+            data_type=cls.data_type,
+            data_value=700000,
+            explanation="explain this",
+            true_successor=cls.first_leaf,
+            false_successor=cls.second_leaf,
+        )
+        cls.node.save()
+        cls.tree = Tree(root=cls.node, tree_version=cls.version)
+        cls.tree.save()
+
+    def setUp(self) -> None:
+        evaluator_cache.clear()
+        decision_cache.clear()
+        return super().setUp()
+
+    @override_settings(TREEXPERT_TREE_FILE_DIR=None)
+    def test_load_once_per_version(self):
+        with patch(
+            "tree.models.Tree.objects.get_complete_tree",
+            wraps=Tree.objects.get_complete_tree,
+        ) as mock_tree:
+            first = get_cached_evaluator(self.version)
+            second = get_cached_evaluator(self.version)
+        self.assertEqual(mock_tree.call_count, 1)
+        # one shared evaluator, runs keep their state in the results
+        self.assertIs(first, second)
+
+    def test_invalidate_on_version_save(self):
+        get_cached_evaluator(self.version)
+        self.assertIn(self.version.id, evaluator_cache)
+        self.version.valid = True
+        self.version.save()
+        self.assertNotIn(self.version.id, evaluator_cache)
+
+    def test_invalidate_on_version_delete(self):
+        version = Version.objects.create(kind_of_tree=self.tree_kind, major=1, minor=0)
+        evaluator_cache.put(version.id, "evaluator")
+        version_id = version.id
+        version.delete()
+        self.assertNotIn(version_id, evaluator_cache)
+
+    def test_populate_on_publish(self):
+        tree_published.send(sender=Tree, tree=self.tree, version=self.version)
+        self.assertIn(self.version.id, evaluator_cache)
+        self.assertEqual(evaluator_cache.get(self.version.id).root, self.node.id)
+
+
+class DecisionCacheTests(EvaluatorCacheTests):
+    def data(self, value) -> list:
+        return [RequestData(type_id=self.data_type.id, value=value)]
+
+    def post(self, identifier: str, value) -> dict:
+        return (
+            Client()
+            .post(
+                "/api/decision/false",
+                {
+                    "identifier": identifier,
+                    "sec_identifier": "info",
+                    "data": [{"data_type": self.data_type.id, "data_value": value}],
+                },
+                content_type="application/json",
+            )
+            .json()
+        )
+
+    def test_canonical_input(self):
+        self.assertEqual(
+            canonical_input([(1, "a"), (2, [1, 2])]),
+            canonical_input([(2, [1, 2]), (1, "a")]),
+        )
+        self.assertNotEqual(canonical_input([(1, 1)]), canonical_input([(1, True)]))
+        self.assertNotEqual(canonical_input([(1, 1)]), canonical_input([(2, 1)]))
+        self.assertIsNone(canonical_input([(1, 1), (1, 2)]))
+
+    def test_evaluate_cached(self):
+        evaluator = get_cached_evaluator(self.version)
+        hits = decision_cache.stats()["hits"]
+        first = evaluate_cached(evaluator, self.version, self.data(800000))
+        with patch.object(evaluator, "evaluate") as mock_evaluate:
+            second = evaluate_cached(evaluator, self.version, self.data(800000))
+            evaluate_cached(evaluator, self.version, self.data(1))
+        self.assertIs(first, second)
+        self.assertEqual(mock_evaluate.call_count, 1)
+        self.assertEqual(decision_cache.stats()["hits"], hits + 1)
+
+    def test_evaluate_many_cached(self):
+        evaluator = get_cached_evaluator(self.version)
+        evaluate_cached(evaluator, self.version, self.data(1))
+        with override_settings(TREEXPERT_BATCH_ENGINE_MIN_SIZE=2):
+            results = evaluate_many_cached(
+                evaluator,
+                self.version,
+                [self.data(1), self.data(800000), self.data(900000)],
+            )
+        self.assertEqual(
+            [result.end_leaf for result in results],
+            [self.second_leaf, self.first_leaf, self.first_leaf],
+        )
+        self.assertEqual(len(decision_cache), 3)
+
+    def test_batch_engine_built_once(self):
+        evaluator = get_cached_evaluator(self.version)
+        data_lists = [self.data(1), self.data(800000)]
+        with patch("decision.evaluator.BatchEngine", wraps=BatchEngine) as mock_engine:
+            first = evaluator.evaluate_batch(data_lists)
+            second = evaluator.evaluate_batch(data_lists)
+        self.assertEqual(mock_engine.call_count, 1)
+        self.assertEqual(
+            [result.end_leaf for result in first],
+            [result.end_leaf for result in second],
+        )
+
+    def test_duplicate_data_types_are_not_cached(self):
+        evaluator = get_cached_evaluator(self.version)
+        data = self.data(1) + self.data(2)
+        with self.assertRaises(BaseException):
+            evaluate_cached(evaluator, self.version, data)
+        self.assertEqual(len(decision_cache), 0)
+
+    def test_cache_hits_are_logged(self):
+        hits = decision_cache.stats()["hits"]
+        first = self.post("first", 800000)
+        second = self.post("second", 800000)
+        self.assertEqual(second["decision"]["identifier"], "second")
+        self.assertEqual(second["criteria"], first["criteria"])
+        self.assertEqual(ExpertRequest.objects.count(), 2)
+        self.assertEqual(decision_cache.stats()["hits"], hits + 1)
+
+    @override_settings(TREEXPERT_DECISION_CACHE_LOG_HITS=False)
+    def test_cache_hits_without_logging(self):
+        first = self.post("first", 800000)
+        # the current version is cached as well
+        with self.assertNumQueries(0):
+            second = self.post("second", 800000)
+        self.assertEqual(second["decision"]["identifier"], "second")
+        self.assertEqual(second["decision"]["leaf_id"], first["decision"]["leaf_id"])
+        self.assertEqual(ExpertRequest.objects.count(), 1)
+
+    def test_cache_statistics(self):
+        hits = decision_cache.stats()["hits"]
+        self.post("first", 1)
+        self.post("first", 1)
+        response = Client().get("/api/decision/cache")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["decisions"]["hits"], hits + 1)
+        self.assertEqual(response.json()["evaluators"]["size"], 1)
@@ -0,0 +1,137 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import random
+
+from django.test import SimpleTestCase
+
+from tree.models import TreeLeaf, TreeNode
+
+from ..codegen import MAX_INLINE_DEPTH, compile_walk, generate_source
+from ..compiled import CompiledTree
+from ..evaluator import EvaluatorException
+from .test_batch import build_tree, random_input
+
+
+def chain(length: int):
+    """
+    nodes 0..length-1 on data type 1, node i is true if the input is > i and goes
+    on to the next node, false ends in leaf i
+    """
+    nodes = []
+    leafs = []
+    for number in range(length):
+        node = TreeNode(id="N." + str(number), number=number, data_type_id=1)
+        node.data_value = number
+        node.comparison = TreeNode.GREATERTHAN
+        node.list_comparison = TreeNode.ALL
+        node.true_id = "N." + str(number + 1) if number + 1 < length else "L.end"
+        node.false_id = "L." + str(number)
+        nodes.append(node)
+        leafs.append(TreeLeaf(id="L." + str(number), number=number, result=False))
+    leafs.append(TreeLeaf(id="L.end", number=length, result=True))
+    return CompiledTree("N.0", nodes, leafs)
+
+
+class CodegenTests(SimpleTestCase):
+    def test_codegen_matches_walk(self):
+        rng = random.Random(7)
+        for depth in [1, 3, 6, 9]:
+            root, nodes, leafs = build_tree(rng, depth)
+            compiled = CompiledTree(root, nodes, leafs)
+            walk = compile_walk(compiled)
+            for _ in range(500):
+                row = compiled.encode(random_input(rng))
+                self.assertEqual(walk(row), compiled.walk(row))
+
+    def test_list_comparisons(self):
+        for list_comparison, expected in [
+            (TreeNode.ALL, [False, True, False, False]),
+            (TreeNode.ONE, [True, False, False, False]),
+            (TreeNode.TWO, [False, True, True, False]),
+            ("", [True, True, True, False]),
+        ]:
+            node = TreeNode(id="N.0", number=0, data_type_id=1, data_value=2)
+            node.comparison = TreeNode.GREATERTHAN
+            node.list_comparison = list_comparison
+            node.true_id = "L.1"
+            node.false_id = "L.0"
+            compiled = CompiledTree(
+                "N.0",
+                [node],
+                [TreeLeaf(id="L.0", result=False), TreeLeaf(id="L.1", result=True)],
+            )
+            walk = compile_walk(compiled)
+            for value, result in zip([[1, 3], [3, 4], [3, 4, 1], [0]], expected):
+                self.assertEqual(walk([value]), compiled.walk([value]))
+                self.assertEqual(walk([value])[1], [result])
+
+    def test_deep_tree_uses_helpers(self):
+        compiled = chain(5 * MAX_INLINE_DEPTH)
+        walk = compile_walk(compiled)
+        self.assertGreater(walk.source.count("def "), 4)
+        for value in [-1, 0, 17, 100, 199, 1000]:
+            self.assertEqual(walk([value]), compiled.walk([value]))
+
+    def test_shared_subtree_is_generated_once(self):
+        # both branches of the root continue with node 1
+        root = TreeNode(id="N.0", number=0, data_type_id=1, data_value=0)
+        root.comparison = TreeNode.EQUAL
+        root.true_id = root.false_id = "N.1"
+        shared = TreeNode(id="N.1", number=1, data_type_id=2, data_value="x")
+        shared.comparison = TreeNode.NOTEQUAL
+        shared.true_id = "L.1"
+        shared.false_id = "L.0"
+        compiled = CompiledTree(
+            "N.0",
+            [root, shared],
+            [TreeLeaf(id="L.0", result=False), TreeLeaf(id="L.1", result=True)],
+        )
+        source, _ = generate_source(compiled)
+        self.assertEqual(source.count("def f1("), 1)
+        walk = compile_walk(compiled)
+        for row in [[0, "x"], [1, "y"], [[0, 1], ["x"]], [0, compiled.encode({})[0]]]:
+            self.assertEqual(walk(row), compiled.walk(row))
+
+    def test_constants_that_are_no_literals(self):
+        node = TreeNode(id="N.0", number=0, data_type_id=1, data_value=[1, 2])
+        node.comparison = TreeNode.EQUAL
+        node.true_id = "L.1"
+        node.false_id = "L.0"
+        compiled = CompiledTree(
+            "N.0",
+            [node],
+            [TreeLeaf(id="L.0", result=False), TreeLeaf(id="L.1", result=True)],
+        )
+        source, constants = generate_source(compiled)
+        self.assertEqual(constants, [[1, 2]])
+        walk = compile_walk(compiled)
+        self.assertEqual(walk([[1, 2]]), compiled.walk([[1, 2]]))
+
+    def test_unknown_comparison_raises(self):
+        node = TreeNode(id="N.0", number=0, data_type_id=1, data_value=1)
+        node.comparison = "XX"
+        node.true_id = "L.1"
+        node.false_id = "L.0"
+        compiled = CompiledTree(
+            "N.0",
+            [node],
+            [TreeLeaf(id="L.0", result=False), TreeLeaf(id="L.1", result=True)],
+        )
+        with self.assertRaises(EvaluatorException):
+            compile_walk(compiled)([5])
+
+    def test_expand(self):
+        compiled = chain(4)
+        self.assertEqual(compiled.expand(0b011, 3), ([0, 1, 2], [True, True, False]))
+        self.assertEqual(compiled.expand(0, 0), ([], []))
+
+    def test_cached_walk_is_not_shared(self):
+        compiled = chain(4)
+        walk = compile_walk(compiled)
+        row = compiled.encode({1: 2})
+        path, results, _, _ = walk(row)
+        expected = compiled.walk(row)
+        self.assertEqual(path, [0, 1, 2])
+        path.append(99)
+        results.append(None)
+        self.assertEqual(walk(row), expected)
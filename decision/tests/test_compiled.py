@@ -0,0 +1,125 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+from django.test import TestCase
+
+from core.models import DataType
+from tree.models import TreeKind, TreeLeaf, TreeNode, Version
+
+from ..compiled import MISSING, CompiledTree, LIST_ANY, LIST_ONE, compare
+from ..evaluator import EvaluatorException
+
+
+class CompiledTreeTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind(name="Test Kind", description="test description")
+        cls.tree_kind.save()
+        cls.version = Version(kind_of_tree=cls.tree_kind, major=0, minor=1)
+        cls.version.save()
+        cls.int_type = DataType(name="TEST1", display_name="int type")
+        cls.int_type.save()
+        cls.str_type = DataType(name="TEST2", display_name="str type")
+        cls.str_type.save()
+        cls.first_leaf = TreeLeaf(
+            tree_version=cls.version,
+            number=1,
+            display_name="test_result1",
+            result=False,
+        )
+        cls.first_leaf.save()
+        cls.second_leaf = TreeLeaf(
+            tree_version=cls.version,
+            number=2,
+            display_name="test_result2",
+            result=True,
+        )
+        cls.second_leaf.save()
+        cls.third_leaf = TreeLeaf(
+            tree_version=cls.version,
+            number=3,
+            display_name="test_result3",
+            result=True,
+        )
+        cls.third_leaf.save()
+        cls.str_node = TreeNode(
+            tree_version=cls.version,
+            number=5,
+            display_name="str node",
+            description="compares strings",
+            data_type=cls.str_type,
+            data_value="yes",
+            comparison=TreeNode.EQUAL,
+            list_comparison=TreeNode.ONE,
+            true_successor=cls.second_leaf,
+            false_successor=cls.third_leaf,
+        )
+        cls.str_node.save()
+        cls.root = TreeNode(
+            tree_version=cls.version,
+            number=4,
+            display_name="root",
+            description="compares ints",
+            data_type=cls.int_type,
+            data_value=10,
+            comparison=TreeNode.GREATERTHAN,
+            true_successor=cls.str_node,
+            false_successor=cls.first_leaf,
+        )
+        cls.root.save()
+        cls.compiled = CompiledTree(
+            cls.root.id,
+            nodes=[cls.str_node, cls.root],
+            leafs=[cls.first_leaf, cls.second_leaf, cls.third_leaf],
+        )
+
+    def test_compile_root_first(self):
+        self.assertEqual(self.compiled.node_ids, [self.root.id, self.str_node.id])
+        self.assertEqual(self.compiled.data_types, [self.int_type.id, self.str_type.id])
+        self.assertEqual(list(self.compiled.column), [0, 1])
+        self.assertEqual(len(self.compiled), 5)
+
+    def test_compile_successors(self):
+        self.assertEqual(self.compiled.true_child[0], 1)
+        self.assertEqual(self.compiled.false_child[0], ~0)
+        self.assertEqual(self.compiled.true_child[1], ~1)
+        self.assertEqual(self.compiled.false_child[1], ~2)
+        self.assertEqual(list(self.compiled.leaf_result), [0, 1, 1])
+
+    def test_compile_unknown_successor(self):
+        with self.assertRaises(EvaluatorException):
+            CompiledTree(self.root.id, nodes=[self.root], leafs=[self.first_leaf])
+
+    def test_compile_missing_root(self):
+        with self.assertRaises(EvaluatorException):
+            CompiledTree("unknown", nodes=[self.root], leafs=[self.first_leaf])
+
+    def test_encode(self):
+        row = self.compiled.encode({self.int_type.id: 4})
+        self.assertEqual(row[0], 4)
+        self.assertIs(row[1], MISSING)
+
+    def test_walk_to_leaf(self):
+        row = self.compiled.encode({self.int_type.id: 11, self.str_type.id: "yes"})
+        self.assertEqual(self.compiled.walk(row), ([0, 1], [True, True], 1, -1))
+
+    def test_walk_false_branch(self):
+        row = self.compiled.encode({self.int_type.id: 10})
+        self.assertEqual(self.compiled.walk(row), ([0], [False], 0, -1))
+
+    def test_walk_missing_data(self):
+        row = self.compiled.encode({self.int_type.id: 11})
+        self.assertEqual(self.compiled.walk(row), ([0], [True], -1, 1))
+
+    def test_walk_list_input(self):
+        row = self.compiled.encode(
+            {self.int_type.id: [11, 12], self.str_type.id: ["yes", "yes"]}
+        )
+        self.assertEqual(self.compiled.walk(row), ([0, 1], [True, False], 2, -1))
+
+    def test_compare_list_semantics(self):
+        self.assertTrue(compare(0, LIST_ONE, 1, [0, 2]))
+        self.assertFalse(compare(0, LIST_ONE, 1, [2, 2]))
+        self.assertTrue(compare(0, LIST_ANY, 1, [2, 2, 0]))
+        with self.assertRaises(EvaluatorException):
+            compare(-1, LIST_ANY, 1, 2)
@@ -3,9 +3,11 @@
 from django.test import TestCase
 
 from core.models import DataType
-from tree.models import Color, TreeKind, TreeLeaf, TreeNode, Version
+from tree.models import Color, Tree, TreeKind, TreeLeaf, TreeNode, Version
 
-from ..evaluator import FullCriteria
+from ..api import CriteriaOut, FullCriteriaOut
+from ..evaluator import Evaluator, FullCriteria
+from ..models import RequestData
 
 
 class CriteriaTests(TestCase):
@@ -89,3 +91,53 @@ class CriteriaTests(TestCase):
         node.save()
         criteria = FullCriteria(node=node, result=True, input=45)
         self.assertEqual(criteria.based_on, self.node.id)
+
+    def test_criteria_is_a_view(self):
+        criteria = FullCriteria(node=self.node, result=False, input=18)
+        with self.assertRaises(AttributeError):
+            criteria.__dict__
+        self.assertIs(
+            FullCriteria(node=criteria.info, result=True, input=50).info, criteria.info
+        )
+
+    def test_evaluator_criteria_without_queries(self):
+        root = TreeNode(
+            tree_version=self.version,
+            number=6,
+            display_name="root",
+            description="root node",
+            data_type=self.data_type,
+            data_value=10,
+            explanation="root says ",
+            true_explanation="yes",
+            true_color=self.color,
+            true_successor=self.node,
+            false_successor=self.first_leaf,
+        )
+        root.save()
+        tree = Tree.objects.create(root=root, tree_version=self.version)
+        evaluator = Evaluator(
+            tree=tree,
+            nodes=TreeNode.objects.filter(id__in=[root.id, self.node.id]),
+            leafs=TreeLeaf.objects.filter(tree_version=self.version),
+        )
+        with self.assertNumQueries(0):
+            result = evaluator.evaluate(
+                [RequestData(type_id=self.data_type.id, value=15)]
+            )
+            full = [
+                FullCriteriaOut.model_validate(c).model_dump() for c in result.criteria
+            ]
+            short = [
+                CriteriaOut.model_validate(c).model_dump() for c in result.criteria
+            ]
+        self.assertEqual(result.end_leaf, self.second_leaf)
+        self.assertEqual(
+            [(c["id"], c["based_on"], c["result"]) for c in short],
+            [(root.id, self.node.id, True), (self.node.id, "", False)],
+        )
+        self.assertEqual(full[0]["explanation"], "root says yes")
+        self.assertEqual(full[0]["color"], self.color.id)
+        self.assertEqual(full[1]["explanation"], "explain this and this!")
+        self.assertEqual(full[1]["data_type"], self.data_type.id)
+        self.assertEqual(full[1]["input_value"], 15)
@@ -1,11 +1,15 @@
 # Copyright (c) 2022, DFKI GmbH - all rights reserved
 
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
 from django.test import TestCase
 
 from core.models import DataType
 from tree.models import Tree, TreeKind, TreeLeaf, TreeNode, Version
 
-from ..evaluator import Evaluator, EvaluatorException
+from ..evaluator import Evaluator, EvaluatorException, pack_path, unpack_path
+from ..models import RequestData
 
 
 class EvaluatorTests(TestCase):
@@ -199,3 +203,70 @@ class EvaluatorTests(TestCase):
         self.assertFalse(result_false)
         self.assertFalse(result_one_element)
         self.assertTrue(result_two_elements)
+
+    def test_evaluate_keeps_no_state(self):
+        result = self.evaluator.evaluate(
+            [RequestData(type_id=self.data_type.id, value=800000)]
+        )
+        self.assertEqual(result.end_leaf, self.first_leaf)
+        self.assertIsNone(result.missing_data)
+        self.assertEqual([criteria.id for criteria in result.criteria], [self.node.id])
+        self.assertIsNone(self.evaluator.end_leaf)
+        self.assertEqual(self.evaluator.criteria, [])
+        with self.assertRaises(AttributeError):
+            result.end_leaf = self.second_leaf
+
+    def test_evaluate_missing_data(self):
+        result = self.evaluator.evaluate([])
+        self.assertEqual(result.missing_data, self.data_type)
+        self.assertEqual(result.node_missing_sth, self.node)
+        self.assertIsNone(result.end_leaf)
+        self.assertEqual(result.criteria, ())
+
+    def test_evaluate_shared_between_threads(self):
+        values = list(range(699990, 700010)) * 10
+
+        def evaluate(value):
+            try:
+                result = self.evaluator.evaluate(
+                    [RequestData(type_id=self.data_type.id, value=value)]
+                )
+                return result.end_leaf, result.criteria[0].input_value
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(evaluate, values))
+        self.assertEqual(
+            results,
+            [
+                (self.first_leaf if value > 700000 else self.second_leaf, value)
+                for value in values
+            ],
+        )
+
+    def test_run_tree_keeps_result(self):
+        self.evaluator.run_tree([RequestData(type_id=self.data_type.id, value=1)])
+        self.addCleanup(self.evaluator.reset_evaluator)
+        self.assertEqual(self.evaluator.end_leaf, self.second_leaf)
+        self.assertEqual(len(self.evaluator.criteria), 1)
+
+    def test_pack_path(self):
+        steps = [(4, True), (-2, False), (70000, False)] + [(1, True)] * 10
+        numbers, results = pack_path(steps)
+        self.assertEqual(len(numbers), 4 * 13)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(unpack_path(numbers, results), steps)
+        self.assertEqual(pack_path([]), (b"", b""))
+        self.assertEqual(unpack_path(b"", b""), [])
+
+    def test_explain(self):
+        data = [RequestData(type_id=self.data_type.id, value=800000)]
+        result = self.evaluator.evaluate(data)
+        criteria = self.evaluator.explain([(4, True)], data)
+        self.assertEqual(
+            [(c.id, c.result, c.input_value, c.explanation) for c in criteria],
+            [(c.id, c.result, c.input_value, c.explanation) for c in result.criteria],
+        )
+        with self.assertRaises(EvaluatorException):
+            self.evaluator.explain([(10, True)], data)
@@ -0,0 +1,140 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from core.models import DataType
+from tree.models import TreeKind, TreeLeaf, Version
+
+from ..export import export_requests
+from ..models import Decision, ExpertRequest, RequestData
+
+
+@override_settings(TREEXPERT_STREAM_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        cls.other_kind = TreeKind.objects.create(name="Other Kind", description="x")
+        cls.version = Version.objects.create(
+            kind_of_tree=cls.tree_kind, major=0, minor=1
+        )
+        cls.other_version = Version.objects.create(
+            kind_of_tree=cls.other_kind, major=0, minor=1
+        )
+        cls.leaf = TreeLeaf.objects.create(
+            tree_version=cls.version, number=1, display_name="low", result=False
+        )
+        cls.data_type = DataType.objects.create(name="TEST1", display_name="test")
+        cls.now = timezone.now()
+        cls.requests = []
+        for number in range(7):
+            request = ExpertRequest.objects.create(
+                identifier="entity_" + str(number),
+                sec_identifier="info",
+                version=cls.other_version if number == 5 else cls.version,
+                date=cls.now - timedelta(days=number),
+            )
+            cls.requests.append(request)
+            RequestData.objects.bulk_create(
+                [
+                    RequestData(request=request, type=cls.data_type, value=value)
+                    for value in range(number % 3)
+                ]
+            )
+            # request 4 was never decided
+            if number != 4:
+                Decision.objects.create(
+                    request=request,
+                    description="low",
+                    result=False,
+                    end_leaf=cls.leaf,
+                    is_preliminary=False,
+                )
+
+    def test_export_requests(self):
+        records = list(export_requests())
+        self.assertEqual(
+            [record["id"] for record in records],
+            [
+                request.id
+                for request in self.requests
+                if request.identifier != "entity_4"
+            ],
+        )
+        self.assertEqual(
+            [record["data"] for record in records[:3]],
+            [
+                [],
+                [[self.data_type.id, 0]],
+                [[self.data_type.id, 0], [self.data_type.id, 1]],
+            ],
+        )
+        self.assertEqual(
+            records[0]["decision"],
+            {
+                "description": "low",
+                "result": False,
+                "end_leaf": self.leaf.id,
+                "is_preliminary": False,
+                "path": None,
+            },
+        )
+
+    def test_export_filters(self):
+        records = export_requests(
+            kind_id=self.tree_kind.id,
+            start=self.now - timedelta(days=4, hours=1),
+            end=self.now - timedelta(hours=1),
+        )
+        self.assertEqual(
+            [record["identifier"] for record in records],
+            ["entity_1", "entity_2", "entity_3"],
+        )
+        self.assertEqual(list(export_requests(kind_id=-1)), [])
+
+    def test_export_endpoint(self):
+        client = Client()
+        response = client.get("/api/decision/export?kind_id=" + str(self.other_kind.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)["identifier"] for line in lines], ["entity_5"]
+        )
+
+        response = client.get("/api/decision/export?compress=true")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 6)
+
+    def test_export_command(self):
+        stdout = StringIO()
+        call_command(
+            "export_decisions", "--kind", str(self.other_kind.id), stdout=stdout
+        )
+        self.assertEqual(json.loads(stdout.getvalue())["identifier"], "entity_5")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "decisions.ndjson.gz"
+            call_command(
+                "export_decisions",
+                "--start",
+                (self.now - timedelta(days=1, hours=1)).isoformat(),
+                "--gzip",
+                "-o",
+                str(path),
+            )
+            lines = gzip.decompress(path.read_bytes()).splitlines()
+        self.assertEqual(
+            [json.loads(line)["identifier"] for line in lines], ["entity_0", "entity_1"]
+        )
@@ -0,0 +1,135 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+from django.db import connection
+from django.test import TestCase
+
+from core.models import DataType
+from tree.models import Tree, TreeKind, TreeLeaf, TreeNode, Version
+
+from ..models import Decision, ExpertRequest, RequestData
+
+
+class IndexUsageTests(TestCase):
+    """
+    the queries of the lookup endpoints have to use an index. the seeded tables are
+    small, so sequential scans are switched off to see which index the planner would
+    use on a large table. the decision log tables are partitioned, their indexes are
+    found by the names postgres gives the index of each partition (the columns).
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        versions = Version.objects.bulk_create(
+            [
+                Version(kind_of_tree=cls.tree_kind, major=major, minor=minor)
+                for major in range(5)
+                for minor in range(10)
+            ]
+        )
+        cls.version = versions[-1]
+        cls.data_type = DataType.objects.create(name="TEST1", display_name="test")
+        leafs = TreeLeaf.objects.bulk_create(
+            [
+                TreeLeaf(tree_version=version, number=1, display_name="x", result=True)
+                for version in versions
+            ]
+        )
+        nodes = TreeNode.objects.bulk_create(
+            [
+                TreeNode(
+                    tree_version=version,
+                    number=2,
+                    display_name="node",
+                    data_type=cls.data_type,
+                    data_value=1,
+                    true_successor=leaf,
+                    false_successor=leaf,
+                )
+                for version, leaf in zip(versions, leafs)
+            ]
+        )
+        Tree.objects.bulk_create(
+            [Tree(root=node, tree_version=node.tree_version) for node in nodes]
+        )
+        cls.requests = ExpertRequest.objects.bulk_create(
+            [
+                ExpertRequest(
+                    identifier="entity_" + str(number % 50),
+                    sec_identifier="info",
+                    version=cls.version,
+                )
+                for number in range(500)
+            ]
+        )
+        RequestData.objects.bulk_create(
+            [
+                RequestData(request=request, type=cls.data_type, value=1)
+                for request in cls.requests
+            ]
+        )
+        Decision.objects.bulk_create(
+            [
+                Decision(request=request, description="x", is_preliminary=False)
+                for request in cls.requests
+            ]
+        )
+
+    def setUp(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return super().setUp()
+
+    def assertUsesIndex(self, queryset, index: str):
+        plan = queryset.explain()
+        self.assertIn("Index", plan)
+        self.assertIn(index, plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_requests_for_entity(self):
+        self.assertUsesIndex(
+            ExpertRequest.objects.filter(identifier="entity_3", sec_identifier="info"),
+            "_identifier_sec_identifier_",
+        )
+
+    def test_data_for_request(self):
+        self.assertUsesIndex(
+            RequestData.objects.filter(request__id=self.requests[10].id),
+            "_request_id_idx",
+        )
+
+    def test_decision_for_request(self):
+        self.assertUsesIndex(
+            Decision.objects.filter(request__id=self.requests[10].id),
+            "_request_id_request_date_idx",
+        )
+
+    def test_current_version(self):
+        self.assertUsesIndex(
+            Version.objects.filter(kind_of_tree=self.tree_kind).order_by(
+                "-date_created"
+            )[:1],
+            "tree_version_kind_date_idx",
+        )
+
+    def test_version_by_number(self):
+        self.assertUsesIndex(
+            Version.objects.filter(kind_of_tree=self.tree_kind, major=2, minor=3),
+            "tree_version_unique_number",
+        )
+
+    def test_complete_tree(self):
+        self.assertUsesIndex(
+            Tree.objects.filter(tree_version=self.version),
+            "tree_tree_tree_version_id",
+        )
+        self.assertUsesIndex(
+            TreeNode.objects.filter(tree_version=self.version),
+            "tree_treenode_tree_version_id",
+        )
+        self.assertUsesIndex(
+            TreeLeaf.objects.filter(tree_version=self.version),
+            "tree_treeleaf_tree_version_id",
+        )
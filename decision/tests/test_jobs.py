@@ -0,0 +1,167 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..evaluator import EvaluatorException
+from ..jobs import claim_chunk, run_chunk, split_lines
+from ..models import DecisionJobChunk, ExpertRequest
+from .test_api import load_test_tree
+
+
+@override_settings(TREEXPERT_JOB_CHUNK_SIZE=2)
+class DecisionJobTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        load_test_tree(cls)
+
+    def submit(self, lines, fullresult="false"):
+        response = self.client.post(
+            "/api/decision/jobs/" + fullresult,
+            "".join(line + "\n" for line in lines),
+            "application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def work(self) -> str:
+        stdout = StringIO()
+        call_command("decision_worker", "--once", "--name", "test", stdout=stdout)
+        return stdout.getvalue()
+
+    def results(self, job_id: int) -> list:
+        response = self.client.get("/api/decision/jobs/" + str(job_id) + "/results")
+        self.assertEqual(response.status_code, 200)
+        return [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+
+    def test_split_lines(self):
+        lines = [b"a\n", b"\n", b"b\n", b"c\n", b"\n"]
+        self.assertEqual(list(split_lines(lines, 2)), [(1, 2, "a\n\nb"), (4, 1, "c\n")])
+
+    def test_job_same_as_bunch(self):
+        # arrange
+        inputs = list(self.decision_input.values())
+        before = ExpertRequest.objects.count()
+        # act
+        job = self.submit([json.dumps(input) for input in inputs], "true")
+        self.assertEqual(job["status"], "pending")
+        self.assertEqual(job["entities"], len(inputs))
+        self.assertEqual(job["chunks"], (len(inputs) + 1) // 2)
+        output = self.work()
+        # assert
+        self.assertIn(str(len(inputs)) + " entities", output)
+        progress = self.client.get("/api/decision/jobs/" + str(job["id"])).json()
+        self.assertEqual(progress["status"], "done")
+        self.assertEqual(progress["done_entities"], len(inputs))
+        self.assertEqual(ExpertRequest.objects.count(), before + len(inputs))
+        bunch = self.client.post("/api/decision/bunch/true", inputs, "application/json")
+        self.assertEqual(self.results(job["id"]), bunch.json())
+
+    def test_invalid_lines(self):
+        input = json.dumps(self.decision_input["1-1.0_L.20"])
+        job = self.submit([input, input, "", '{"identifier": 1}', input])
+        self.work()
+        results = self.results(job["id"])
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[2]["line"], 4)
+        self.assertEqual(results[3], self.decision_output["1-1.0_L.20"])
+
+    def test_results_of_unfinished_job(self):
+        job = self.submit([json.dumps(self.decision_input["1-1.0_L.20"])])
+        response = self.client.get("/api/decision/jobs/" + str(job["id"]) + "/results")
+        self.assertEqual(response.status_code, 409)
+        response = self.client.get("/api/decision/jobs/" + str(job["id"] + 1))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(TREEXPERT_JOB_MAX_ATTEMPTS=2)
+    def test_failed_chunk_is_retried(self):
+        job = self.submit([json.dumps(self.decision_input["1-1.0_L.20"])])
+        with patch("decision.jobs.decide_chunk", side_effect=ValueError("broken")):
+            self.assertFalse(run_chunk(claim_chunk("a")))
+            chunk = DecisionJobChunk.objects.get(job_id=job["id"])
+            self.assertEqual(chunk.status, DecisionJobChunk.PENDING)
+            self.assertFalse(run_chunk(claim_chunk("a")))
+        progress = self.client.get("/api/decision/jobs/" + str(job["id"])).json()
+        self.assertEqual(progress["status"], "failed")
+        self.assertEqual(progress["failed_entities"], 1)
+        self.assertIn("broken", progress["errors"][0])
+        self.assertIsNone(claim_chunk("a"))
+
+    def test_evaluator_errors(self):
+        # arrange: the second entity has the same data type twice
+        input = self.decision_input["1-1.0_L.20"]
+        duplicate = dict(input, data=input["data"] + input["data"][:1])
+        job = self.submit([json.dumps(input), json.dumps(duplicate)])
+        # act
+        self.work()
+        # assert: the chunk is done with an error line for the failing entity
+        progress = self.client.get("/api/decision/jobs/" + str(job["id"])).json()
+        self.assertEqual(progress["status"], "done")
+        results = self.results(job["id"])
+        self.assertEqual(results[0], self.decision_output["1-1.0_L.20"])
+        self.assertEqual(results[1]["line"], 2)
+        self.assertEqual(
+            results[1]["errors"][0]["msg"], "error evaluating with this data"
+        )
+
+    def test_evaluator_exception_does_not_stop_worker(self):
+        job = self.submit([json.dumps(self.decision_input["1-1.0_L.20"])])
+        with patch(
+            "decision.jobs.decide_chunk", side_effect=EvaluatorException("broken")
+        ):
+            # the worker keeps running, the chunk fails after all its attempts
+            self.assertIn("3 not finished", self.work())
+        chunk = DecisionJobChunk.objects.get(job_id=job["id"])
+        self.assertEqual(chunk.status, DecisionJobChunk.FAILED)
+        self.assertIn("EvaluatorException", chunk.error)
+
+    def test_stale_claim_is_taken_over(self):
+        self.submit([json.dumps(self.decision_input["1-1.0_L.20"])])
+        first = claim_chunk("a")
+        self.assertIsNone(claim_chunk("b"))
+        DecisionJobChunk.objects.filter(id=first.id).update(
+            claimed=timezone.now() - timedelta(hours=1)
+        )
+        second = claim_chunk("b")
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(second.attempts, 2)
+        before = ExpertRequest.objects.count()
+        # the first worker lost its claim, nothing it decided is saved
+        self.assertFalse(run_chunk(first))
+        self.assertEqual(ExpertRequest.objects.count(), before)
+        self.assertTrue(run_chunk(second))
+        self.assertEqual(ExpertRequest.objects.count(), before + 1)
+
+    def test_delete_job(self):
+        job = self.submit([json.dumps(self.decision_input["1-1.0_L.20"])])
+        response = self.client.delete("/api/decision/jobs/" + str(job["id"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(DecisionJobChunk.objects.exists())
+
+    def test_submit_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as file:
+            for input in self.decision_input.values():
+                file.write(json.dumps(input) + "\n")
+            file.flush()
+            stdout = StringIO()
+            call_command("submit_decision_job", file.name, stdout=stdout)
+        self.assertIn(str(len(self.decision_input)) + " entities", stdout.getvalue())
+        self.work()
+        self.assertEqual(
+            [
+                result["decision"]
+                for result in self.results(DecisionJobChunk.objects.first().job_id)
+            ],
+            [output["decision"] for output in self.decision_output.values()],
+        )
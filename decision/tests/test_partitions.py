@@ -0,0 +1,115 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import gzip
+import tempfile
+from datetime import date, datetime, timezone
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from core.models import DataType
+from tree.models import TreeKind, Version
+
+from ..models import Decision, ExpertRequest, RequestData
+from ..partitions import (
+    create_partitions,
+    expire_partitions,
+    month_of,
+    month_partitions,
+    next_month,
+)
+
+
+class PartitionTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        cls.version = Version.objects.create(
+            kind_of_tree=cls.tree_kind, major=0, minor=1
+        )
+        cls.data_type = DataType.objects.create(name="TEST1", display_name="test")
+
+    def log(self, moment: datetime) -> ExpertRequest:
+        request = ExpertRequest.objects.create(
+            identifier="old_entity",
+            sec_identifier="info",
+            version=self.version,
+            date=moment,
+        )
+        RequestData.objects.create(
+            request=request, request_date=moment, type=self.data_type, value=1
+        )
+        Decision.objects.create(
+            request=request, request_date=moment, description="x", is_preliminary=True
+        )
+        return request
+
+    def count(self, table: str) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM " + table)
+            return cursor.fetchone()[0]
+
+    def test_months(self):
+        self.assertEqual(next_month(date(2026, 12, 1)), date(2027, 1, 1))
+        self.assertEqual(next_month(date(2026, 1, 1), -13), date(2024, 12, 1))
+        self.assertEqual(
+            month_of(datetime(2026, 5, 31, 23, 30, tzinfo=timezone.utc)),
+            date(2026, 5, 1),
+        )
+
+    def test_partitions_ahead(self):
+        with connection.cursor() as cursor:
+            months = month_partitions(cursor, "decision_expertrequest")
+        this_month = month_of(datetime.now(timezone.utc))
+        self.assertIn(this_month, months)
+        self.assertIn(next_month(this_month, 3), months)
+
+    def test_create_partition_moves_rows(self):
+        request = self.log(datetime(2020, 3, 15, tzinfo=timezone.utc))
+        self.assertEqual(self.count("decision_expertrequest_default"), 1)
+        created = create_partitions(date(2020, 3, 1), date(2020, 3, 1))
+        self.assertEqual(len(created), 3)
+        self.assertEqual(create_partitions(date(2020, 3, 1), date(2020, 3, 1)), [])
+        self.assertEqual(self.count("decision_expertrequest_default"), 0)
+        self.assertEqual(self.count("decision_expertrequest_p202003"), 1)
+        self.assertEqual(self.count("decision_requestdata_p202003"), 1)
+        self.assertEqual(self.count("decision_decision_p202003"), 1)
+        self.assertEqual(Decision.objects.get(request__id=request.id).description, "x")
+
+    def test_expire_partitions(self):
+        create_partitions(date(2020, 3, 1), date(2020, 4, 1))
+        old = self.log(datetime(2020, 3, 15, tzinfo=timezone.utc))
+        kept = self.log(datetime(2020, 4, 2, tzinfo=timezone.utc))
+        # run the deferred foreign key checks of this test transaction, a table with
+        # pending checks can't be dropped
+        connection.check_constraints()
+        self.assertEqual(
+            expire_partitions(date(2020, 4, 1), dry_run=True),
+            [
+                "decision_expertrequest_p202003",
+                "decision_requestdata_p202003",
+                "decision_decision_p202003",
+            ],
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            expire_partitions(date(2020, 4, 1), archive_dir=directory)
+            archive = Path(directory) / "decision_expertrequest_p202003.csv.gz"
+            lines = gzip.decompress(archive.read_bytes()).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("old_entity", lines[1])
+        self.assertFalse(ExpertRequest.objects.filter(id=old.id).exists())
+        self.assertFalse(RequestData.objects.filter(request__id=old.id).exists())
+        self.assertTrue(Decision.objects.filter(request__id=kept.id).exists())
+
+    def test_commands(self):
+        stdout = StringIO()
+        call_command("create_log_partitions", "--ahead", "5", stdout=stdout)
+        self.assertIn("6 partitions created", stdout.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("expire_log_partitions", stdout=stdout)
+        call_command("expire_log_partitions", "--months", "600", stdout=stdout)
+        self.assertIn("0 partitions before", stdout.getvalue())
@@ -0,0 +1,194 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+
+from core.models import DataType
+from tree.models import TreeKind, Version
+
+from ..api import ExpertRequestIn, RequestDataIn
+from ..api import save_request_data
+from ..models import Decision, ExpertRequest, InputBlob, RequestData
+from ..persistence import (
+    data_type_cache,
+    known_data_types,
+    load_request_data,
+    pack_documents,
+    save_decisions,
+    save_requests,
+    write_requests,
+)
+
+
+class PersistenceTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.tree_kind = TreeKind(name="Test Kind", description="test description")
+        cls.tree_kind.save()
+        cls.version = Version(kind_of_tree=cls.tree_kind, major=0, minor=1)
+        cls.version.save()
+        cls.first_type = DataType(name="TEST1", display_name="test type")
+        cls.first_type.save()
+        cls.second_type = DataType(name="TEST2", display_name="test type")
+        cls.second_type.save()
+
+    def setUp(self) -> None:
+        data_type_cache.clear()
+        return super().setUp()
+
+    def build_requests(self, count: int, data_types: list):
+        return [
+            ExpertRequestIn(
+                identifier="entity_" + str(number),
+                sec_identifier="info",
+                data=[
+                    RequestDataIn(data_type=data_type, data_value=number)
+                    for data_type in data_types
+                ],
+            )
+            for number in range(count)
+        ]
+
+    def test_known_data_types(self):
+        known = known_data_types()
+        self.assertIn(self.first_type.id, known)
+        self.assertIn(self.second_type.id, known)
+
+    def test_known_data_types_reload_for_unknown(self):
+        known_data_types()
+        new_type = DataType.objects.create(name="TEST3", display_name="new")
+        self.assertIn(new_type.id, known_data_types({new_type.id}))
+
+    def test_known_data_types_cached(self):
+        known_data_types()
+        with self.assertNumQueries(0):
+            known_data_types({self.first_type.id})
+
+    def test_save_requests_in_bulk(self):
+        requests = self.build_requests(20, [self.first_type.id, self.second_type.id])
+        known_data_types()
+        # one insert for all requests and one for all data
+        with self.assertNumQueries(2):
+            saved_requests, saved_data = save_requests(requests, self.version)
+        self.assertEqual(len(saved_requests), 20)
+        self.assertTrue(all(request.id is not None for request in saved_requests))
+        self.assertEqual(ExpertRequest.objects.filter(version=self.version).count(), 20)
+        self.assertEqual(RequestData.objects.count(), 40)
+        self.assertEqual(saved_data[3][1].value, 3)
+        self.assertEqual(saved_data[3][1].request, saved_requests[3])
+
+    def test_save_requests_drop_unknown_data_types(self):
+        requests = self.build_requests(2, [self.first_type.id, -1])
+        saved_requests, saved_data = save_requests(requests, self.version)
+        self.assertEqual([len(data) for data in saved_data], [1, 1])
+        self.assertEqual(RequestData.objects.count(), 2)
+
+    def test_save_decisions(self):
+        saved_requests, _ = save_requests(self.build_requests(3, []), self.version)
+        with self.assertNumQueries(1):
+            save_decisions(
+                [
+                    Decision(request=request, description="test", is_preliminary=True)
+                    for request in saved_requests
+                ]
+            )
+        self.assertEqual(Decision.objects.count(), 3)
+
+    def data_out(self, request_id: int) -> list:
+        response = Client().get("/api/decision/data/" + str(request_id))
+        self.assertEqual(response.status_code, 200)
+        return [(data["type"], data["value"]) for data in response.json()]
+
+    @override_settings(TREEXPERT_REQUEST_DATA_STORAGE="document")
+    def test_save_requests_as_documents(self):
+        requests = self.build_requests(20, [self.first_type.id, self.second_type.id])
+        known_data_types()
+        # one insert for all requests with their data
+        with self.assertNumQueries(1):
+            saved_requests, saved_data = save_requests(requests, self.version)
+        self.assertEqual(RequestData.objects.count(), 0)
+        self.assertEqual(
+            ExpertRequest.objects.get(id=saved_requests[3].id).data_document,
+            [[self.first_type.id, 3], [self.second_type.id, 3]],
+        )
+        self.assertEqual(saved_data[3][1].value, 3)
+        self.assertEqual(
+            self.data_out(saved_requests[3].id),
+            [(self.first_type.id, 3), (self.second_type.id, 3)],
+        )
+        self.assertEqual(
+            [data.value for data in load_request_data(saved_requests[4].id)], [4, 4]
+        )
+
+    @override_settings(TREEXPERT_REQUEST_DATA_STORAGE="document")
+    def test_write_requests_as_documents(self):
+        request = ExpertRequest(
+            id=ExpertRequest.objects.count() + 1000,
+            identifier="entity",
+            sec_identifier="info",
+            version=self.version,
+        )
+        data = RequestData(request=request, type=self.first_type, value="x")
+        write_requests([request], [[data]], [])
+        self.assertEqual(
+            ExpertRequest.objects.get(id=request.id).data_document,
+            [[self.first_type.id, "x"]],
+        )
+        self.assertEqual(RequestData.objects.count(), 0)
+
+    def test_pack_documents(self):
+        saved_requests, _ = save_requests(
+            self.build_requests(5, [self.first_type.id, self.second_type.id]),
+            self.version,
+        )
+        before = self.data_out(saved_requests[2].id)
+        self.assertEqual(pack_documents(batch_size=2), 5)
+        self.assertEqual(pack_documents(batch_size=2), 0)
+        self.assertEqual(RequestData.objects.count(), 10)
+        stdout = StringIO()
+        call_command("pack_request_data", "--delete-rows", stdout=stdout)
+        self.assertIn("0 requests packed", stdout.getvalue())
+        self.assertEqual(RequestData.objects.count(), 0)
+        self.assertEqual(self.data_out(saved_requests[2].id), before)
+        with override_settings(TREEXPERT_REQUEST_DATA_STORAGE="document"):
+            self.assertEqual(self.data_out(saved_requests[2].id), before)
+
+    @override_settings(TREEXPERT_REQUEST_DATA_STORAGE="blob")
+    def test_save_requests_as_blobs(self):
+        requests = self.build_requests(3, [self.second_type.id, self.first_type.id])
+        known_data_types()
+        # one insert for the distinct inputs and one for all requests
+        with self.assertNumQueries(2):
+            saved_requests, _ = save_requests(requests * 4, self.version)
+        self.assertEqual(InputBlob.objects.count(), 3)
+        self.assertEqual(RequestData.objects.count(), 0)
+        saved_requests, _ = save_requests(requests[:1], self.version)
+        self.assertEqual(InputBlob.objects.count(), 3)
+        blob = InputBlob.objects.get(digest=saved_requests[0].input_blob_id)
+        self.assertEqual(
+            blob.document, [[self.first_type.id, 0], [self.second_type.id, 0]]
+        )
+        self.assertEqual(ExpertRequest.objects.filter(input_blob=blob).count(), 5)
+        self.assertEqual(
+            self.data_out(saved_requests[0].id),
+            [(self.first_type.id, 0), (self.second_type.id, 0)],
+        )
+
+    @override_settings(TREEXPERT_REQUEST_DATA_STORAGE="blob")
+    def test_save_request_with_twice_given_data_type_as_blob(self):
+        request = self.build_requests(1, [self.first_type.id, self.first_type.id])[0]
+        saved_request, saved_data = save_request_data(request, version=self.version)
+        self.assertEqual(len(saved_data), 2)
+        saved_request.refresh_from_db()
+        self.assertIsNone(saved_request.input_blob_id)
+        self.assertEqual(len(saved_request.data_document), 2)
+        self.assertEqual(InputBlob.objects.count(), 0)
+
+    @override_settings(TREEXPERT_REQUEST_DATA_STORAGE="columns")
+    def test_unknown_storage(self):
+        with self.assertRaises(ImproperlyConfigured):
+            save_requests(self.build_requests(1, []), self.version)
@@ -0,0 +1,75 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import pickle
+import random
+
+from django.test import SimpleTestCase, override_settings
+
+from tree.models import TreeLeaf, TreeNode, Version
+
+from ..compiled import MISSING, CompiledTree
+from ..evaluator import EvaluatorException
+from .. import pool
+from ..cache import evaluator_cache
+from ..pool import get_pool, shutdown_pool, walk_rows, walks_of
+from .test_batch import build_tree, random_input
+
+
+@override_settings(TREEXPERT_PROCESS_POOL_WORKERS=2)
+class ProcessPoolTests(SimpleTestCase):
+    def tearDown(self) -> None:
+        shutdown_pool()
+
+    def test_missing_stays_the_same_object(self):
+        self.assertIs(pickle.loads(pickle.dumps([MISSING]))[0], MISSING)
+
+    def test_pool_matches_single_walk(self):
+        rng = random.Random(7)
+        root, nodes, leafs = build_tree(rng, 5)
+        compiled = CompiledTree(root, nodes, leafs)
+        rows = [compiled.encode(random_input(rng)) for _ in range(300)]
+        chunks = [rows[start : start + 64] for start in range(0, len(rows), 64)]
+        pool = get_pool(Version(id=1), compiled)
+        walks = list(walks_of(pool.map(walk_rows, [1] * len(chunks), chunks)))
+        self.assertEqual(walks, [compiled.walk(row) for row in rows])
+
+    def test_new_version_starts_new_pool(self):
+        rng = random.Random(8)
+        first = CompiledTree(*build_tree(rng, 2))
+        second = CompiledTree(*build_tree(rng, 3))
+        pool = get_pool(Version(id=1), first)
+        self.assertIs(get_pool(Version(id=1), first), pool)
+        new_pool = get_pool(Version(id=2), second)
+        self.assertIsNot(new_pool, pool)
+        row = second.encode(random_input(rng))
+        result = new_pool.submit(walk_rows, 2, [row]).result()
+        self.assertEqual(result.walk(0), second.walk(row))
+
+    def test_shutdown_forgets_trees(self):
+        rng = random.Random(9)
+        first = CompiledTree(*build_tree(rng, 2))
+        second = CompiledTree(*build_tree(rng, 3))
+        get_pool(Version(id=1), first)
+        # still cached, a new pool would start with it
+        evaluator_cache.put(1, first)
+        self.addCleanup(evaluator_cache.invalidate, 1)
+        shutdown_pool()
+        get_pool(Version(id=2), second)
+        self.assertEqual(list(pool._trees), [2])
+
+    def test_evaluator_exception_is_raised_in_parent(self):
+        node = TreeNode(
+            id="N.0",
+            number=0,
+            data_type_id=1,
+            data_value="a",
+            comparison="XX",
+            list_comparison="ALL",
+            true_id="L.0",
+            false_id="L.0",
+        )
+        compiled = CompiledTree("N.0", [node], [TreeLeaf(id="L.0", result=True)])
+        pool = get_pool(Version(id=3), compiled)
+        results = pool.map(walk_rows, [3], [[compiled.encode({1: "a"})]])
+        with self.assertRaises(EvaluatorException):
+            list(walks_of(results))
@@ -0,0 +1,148 @@
+# Copyright (c) 2022, DFKI GmbH - all rights reserved
+
+import pickle
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import DataType
+from tree.cache import get_current_version
+from tree.models import Tree
+
+from ..cache import evaluator_cache, decision_cache, load_evaluator_from_database
+from ..pool import shutdown_pool
+from ..treefile import read_tree_file, tree_file_path, write_tree_file
+from .test_api import load_test_tree
+
+
+class TreeFileTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.tree_files = override_settings(TREEXPERT_TREE_FILE_DIR=cls.directory.name)
+        cls.tree_files.enable()
+        super().setUpClass()
+        load_test_tree(cls)
+        cls.version = get_current_version(cls.tree_kind_id)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        cls.tree_files.disable()
+        cls.directory.cleanup()
+
+    def setUp(self) -> None:
+        evaluator_cache.clear()
+        decision_cache.clear()
+
+    def decide_all(self, fullresult: str = "false"):
+        with patch(
+            "tree.models.Tree.objects.get_complete_tree",
+            wraps=Tree.objects.get_complete_tree,
+        ) as mock_tree:
+            for key in self.decision_input:
+                response = self.client.post(
+                    "/api/decision/" + fullresult,
+                    self.decision_input[key],
+                    "application/json",
+                )
+                self.assertEqual(response.status_code, 200)
+                yield key, response.json()
+        # the evaluator was built from the file
+        self.assertEqual(mock_tree.call_count, 0)
+
+    def test_file_written_at_publish(self):
+        self.assertTrue(tree_file_path(self.version).is_file())
+
+    def test_same_results_without_database(self):
+        for key, result in self.decide_all():
+            self.assertEqual(result, self.decision_output[key])
+
+    def test_same_full_results(self):
+        full = dict(self.decide_all("true"))
+        evaluator_cache.put(self.version.id, load_evaluator_from_database(self.version))
+        for key in self.decision_input:
+            response = self.client.post(
+                "/api/decision/true", self.decision_input[key], "application/json"
+            )
+            self.assertEqual(response.json(), full[key])
+
+    @override_settings(TREEXPERT_EVALUATOR_BACKEND="codegen")
+    def test_codegen_backend(self):
+        for key, result in self.decide_all():
+            self.assertEqual(result, self.decision_output[key])
+
+    def test_arrays_are_mapped(self):
+        evaluator = read_tree_file(self.version)
+        self.assertIsInstance(evaluator.compiled.column, memoryview)
+        database = load_evaluator_from_database(self.version)
+        self.assertEqual(
+            list(evaluator.compiled.true_child), list(database.compiled.true_child)
+        )
+        self.assertEqual(evaluator.compiled.threshold, database.compiled.threshold)
+
+    def test_file_of_other_database_is_ignored(self):
+        version = get_current_version(self.tree_kind_id)
+        version.minor += 1
+        self.assertIsNone(read_tree_file(version))
+
+    def test_damaged_file_is_ignored(self):
+        path = tree_file_path(self.version)
+        content = path.read_bytes()
+        path.write_bytes(content[:100])
+        try:
+            with self.assertLogs("decision.treefile", "WARNING"):
+                self.assertIsNone(read_tree_file(self.version))
+        finally:
+            path.write_bytes(content)
+
+    def test_data_type_change_removes_files(self):
+        # a data type that isn't in the tree doesn't change its file
+        DataType.objects.create(name="unused", display_name="unused").delete()
+        self.assertTrue(tree_file_path(self.version).exists())
+        data_type = DataType.objects.get(
+            id=self.decision_input["1-1.0_L.20"]["data"][0]["data_type"]
+        )
+        data_type.display_name = "renamed"
+        data_type.save()
+        self.assertFalse(tree_file_path(self.version).exists())
+        stdout = StringIO()
+        call_command("compile_tree_files", stdout=stdout)
+        self.assertIn("1 tree files", stdout.getvalue())
+        evaluator = read_tree_file(self.version)
+        self.assertEqual(evaluator.data_types[data_type.id].display_name, "renamed")
+
+    @override_settings(
+        TREEXPERT_PROCESS_POOL_WORKERS=2,
+        TREEXPERT_PROCESS_POOL_MIN_SIZE=1,
+        TREEXPERT_PROCESS_POOL_CHUNK_SIZE=3,
+    )
+    def test_process_pool_maps_tree_file(self):
+        write_tree_file(self.version, load_evaluator_from_database(self.version))
+        evaluator = read_tree_file(self.version)
+        compiled = pickle.loads(pickle.dumps(evaluator.compiled))
+        # the other process maps the file instead of getting a copy of the arrays
+        self.assertIsInstance(compiled.column, memoryview)
+        self.assertEqual(list(compiled.column), list(evaluator.compiled.column))
+        keys = list(self.decision_input)
+        try:
+            response = self.client.post(
+                "/api/decision/bunch/false",
+                [self.decision_input[key] for key in keys],
+                "application/json",
+            )
+        finally:
+            shutdown_pool()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [self.decision_output[key] for key in keys])
+
+    @override_settings(TREEXPERT_TREE_FILE_DIR=None)
+    def test_tree_files_off(self):
+        self.assertIsNone(tree_file_path(self.version))
+        self.assertIsNone(write_tree_file(self.version, None))
+        self.assertIsNone(read_tree_file(self.version))
+        self.assertFalse(list(Path(self.directory.name).glob("*.tmp")))
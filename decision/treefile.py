@@ -0,0 +1,343 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from core.models import DataType
+from tree.models import Tree, TreeLeaf, TreeNode, Version
+from .compiled import CompiledTree
+from .evaluator import Evaluator
+
+logger = logging.getLogger(__name__)
+
+# the compiled tree of a published version is written to one immutable file in the
+# tree file directory (version_<id>.tree). every worker process maps it read only
+# and builds its evaluator from it without querying the database, the arrays of the
+# compiled tree are read straight from the mapping, so all workers share the pages.
+# layout (little endian, arrays aligned to 8 bytes):
+#   HEADER          magic, format, version id, counts, string index of the version
+#                   key (see version_key) and of the root node id
+#   string offsets  (strings + 1) uint32, string i is blob[offset i:offset i + 1]
+#   node arrays     column, true child, false child (int64), opcode, list opcode
+#                   (int8), see CompiledTree
+#   NODE records    the fields of each node, strings as string index
+#   LEAF records    the fields of each leaf
+#   DATA_TYPE       the data types of the columns
+#   string blob     utf-8, thresholds (data_value) are stored as json strings
+MAGIC = b"TXTR"
+FORMAT = 1
+HEADER = struct.Struct("<4sIqIIIIII")
+NODE = struct.Struct("<iqiiIIIIIIIIIIII")
+LEAF = struct.Struct("<ibxxxiII")
+DATA_TYPE = struct.Struct("<qIII")
+
+
+def tree_file_dir() -> Optional[Path]:
+    """
+    output: the tree file directory, None if tree files are not used
+    """
+    directory = getattr(settings, "TREEXPERT_TREE_FILE_DIR", None)
+    return None if directory is None else Path(directory)
+
+
+def tree_file_path(version: Version) -> Optional[Path]:
+    directory = tree_file_dir()
+    if directory is None:
+        return None
+    return directory / ("version_" + str(version.id) + ".tree")
+
+
+def version_key(version: Version) -> str:
+    """
+    output: identifies this version in this database, a file written for another
+    database with the same version id is not used
+    """
+    return ":".join(
+        (
+            str(version.id),
+            str(version.kind_of_tree_id),
+            str(version.major) + "." + str(version.minor),
+            version.date_created.isoformat(),
+        )
+    )
+
+
+def padded(length: int) -> int:
+    return (length + 7) // 8 * 8
+
+
+class StringTable:
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, value: Optional[str]) -> int:
+        value = value or ""
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value.encode())
+        return self.index[value]
+
+
+def write_tree_file(version: Version, evaluator: Evaluator) -> Optional[Path]:
+    """
+    input: a version and its evaluator loaded from the database
+    write the tree file of this version, it gets its final name only when it is
+    complete
+    output: path of the file, None if tree files are not used
+    """
+    path = tree_file_path(version)
+    if path is None:
+        return None
+    compiled = evaluator.compiled
+    strings = StringTable()
+    key = strings.add(version_key(version))
+    root = strings.add(evaluator.root)
+    nodes = b""
+    for node_id in compiled.node_ids:
+        node = evaluator.tree_dict[node_id]
+        nodes += NODE.pack(
+            node.number,
+            node.data_type_id,
+            -1 if node.false_color_id is None else node.false_color_id,
+            -1 if node.true_color_id is None else node.true_color_id,
+            strings.add(node.id),
+            strings.add(node.display_name),
+            strings.add(node.description),
+            strings.add(json.dumps(node.data_value)),
+            strings.add(node.comparison),
+            strings.add(node.list_comparison),
+            strings.add(node.explanation),
+            strings.add(node.false_explanation),
+            strings.add(node.true_explanation),
+            strings.add(node.false_id),
+            strings.add(node.true_id),
+            0,
+        )
+    leafs = b""
+    for leaf_id in compiled.leaf_ids:
+        leaf = evaluator.tree_dict[leaf_id]
+        leafs += LEAF.pack(
+            leaf.number,
+            leaf.result,
+            -1 if leaf.color_id is None else leaf.color_id,
+            strings.add(leaf.id),
+            strings.add(leaf.display_name),
+        )
+    data_types = b""
+    for data_type_id in compiled.data_types:
+        data_type = evaluator.data_types[data_type_id]
+        data_types += DATA_TYPE.pack(
+            data_type.id,
+            strings.add(data_type.name),
+            strings.add(data_type.display_name),
+            strings.add(data_type.kind_of_data),
+        )
+
+    count = len(compiled.node_ids)
+    offsets = [0]
+    for value in strings.strings:
+        offsets.append(offsets[-1] + len(value))
+    sections = [
+        HEADER.pack(
+            MAGIC,
+            FORMAT,
+            version.id,
+            count,
+            len(compiled.leaf_ids),
+            len(compiled.data_types),
+            len(strings.strings),
+            key,
+            root,
+        ),
+        struct.pack("<%dI" % len(offsets), *offsets),
+        struct.pack("<%dq" % count, *compiled.column),
+        struct.pack("<%dq" % count, *compiled.true_child),
+        struct.pack("<%dq" % count, *compiled.false_child),
+        struct.pack("<%db" % count, *compiled.opcode),
+        struct.pack("<%db" % count, *compiled.list_opcode),
+        nodes,
+        leafs,
+        data_types,
+        b"".join(strings.strings),
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(
+        path.name + "." + str(os.getpid()) + "_" + str(threading.get_ident()) + ".tmp"
+    )
+    with open(temporary, "wb") as file:
+        for section in sections:
+            file.write(section)
+            file.write(b"\0" * (padded(len(section)) - len(section)))
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return path
+
+
+def read_tree_file(version: Version) -> Optional[Evaluator]:
+    """
+    input: a version
+    output: its evaluator built from its tree file, None if it has no file (or the
+    file belongs to another database)
+    """
+    path = tree_file_path(version)
+    if path is None:
+        return None
+    return map_tree_file(str(path), version)
+
+
+def map_tree_file(path: str, version: Version) -> Optional[Evaluator]:
+    """
+    input: the path of the tree file of this version
+    output: the evaluator built from the mapped file, see read_tree_file
+    """
+    try:
+        with open(path, "rb") as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        evaluator = evaluator_of(version, memoryview(mapping))
+    except (struct.error, ValueError, IndexError, UnicodeDecodeError):
+        logger.warning("ignoring the damaged tree file " + path)
+        return None
+    if evaluator is not None:
+        evaluator.compiled.tree_file = (path, version)
+    return evaluator
+
+
+def compiled_tree_of_file(path: str, version: Version) -> CompiledTree:
+    """
+    input: the path of a tree file and its version
+    output: the compiled tree mapped from the file, this is how a compiled tree of a
+    tree file is unpickled (see CompiledTree.tree_file)
+    """
+    evaluator = map_tree_file(path, version)
+    if evaluator is None:
+        raise ValueError("tree file " + path + " can't be read")
+    return evaluator.compiled
+
+
+def evaluator_of(version: Version, view: memoryview) -> Optional[Evaluator]:
+    """
+    input: a version and the content of its tree file
+    output: the evaluator, None if the file doesn't belong to this version
+    """
+    (
+        magic,
+        file_format,
+        version_id,
+        count,
+        leaf_count,
+        data_type_count,
+        string_count,
+        key,
+        root,
+    ) = HEADER.unpack_from(view)
+    if magic != MAGIC or file_format != FORMAT or version_id != version.id:
+        return None
+    position = padded(HEADER.size)
+
+    def section(length: int) -> memoryview:
+        nonlocal position
+        start = position
+        position += padded(length)
+        return view[start : start + length]
+
+    offsets = section(4 * (string_count + 1)).cast("I")
+    column = section(8 * count).cast("q")
+    true_child = section(8 * count).cast("q")
+    false_child = section(8 * count).cast("q")
+    opcode = section(count).cast("b")
+    list_opcode = section(count).cast("b")
+    node_records = section(NODE.size * count)
+    leaf_records = section(LEAF.size * leaf_count)
+    data_type_records = section(DATA_TYPE.size * data_type_count)
+    blob = section(offsets[string_count])
+
+    def string(index: int) -> str:
+        return str(blob[offsets[index] : offsets[index + 1]], "utf-8")
+
+    if string(key) != version_key(version):
+        return None
+
+    nodes = []
+    for fields in NODE.iter_unpack(node_records):
+        nodes.append(
+            TreeNode(
+                id=string(fields[4]),
+                number=fields[0],
+                tree_version_id=version.id,
+                display_name=string(fields[5]),
+                description=string(fields[6]),
+                data_type_id=fields[1],
+                data_value=json.loads(string(fields[7])),
+                comparison=string(fields[8]),
+                list_comparison=string(fields[9]),
+                explanation=string(fields[10]),
+                false_explanation=string(fields[11]),
+                true_explanation=string(fields[12]),
+                false_id=string(fields[13]),
+                true_id=string(fields[14]),
+                false_color_id=None if fields[2] < 0 else fields[2],
+                true_color_id=None if fields[3] < 0 else fields[3],
+            )
+        )
+    leafs = [
+        TreeLeaf(
+            id=string(leaf_id),
+            number=number,
+            tree_version_id=version.id,
+            display_name=string(display_name),
+            result=bool(result),
+            color_id=None if color < 0 else color,
+        )
+        for number, result, color, leaf_id, display_name in LEAF.iter_unpack(
+            leaf_records
+        )
+    ]
+    data_types: Dict[int, DataType] = {
+        data_type_id: DataType(
+            id=data_type_id,
+            name=string(name),
+            display_name=string(display_name),
+            kind_of_data=string(kind_of_data),
+        )
+        for data_type_id, name, display_name, kind_of_data in DATA_TYPE.iter_unpack(
+            data_type_records
+        )
+    }
+    compiled = CompiledTree.from_arrays(
+        node_ids=[node.id for node in nodes],
+        leaf_ids=[leaf.id for leaf in leafs],
+        data_types=list(data_types),
+        column=column,
+        opcode=opcode,
+        list_opcode=list_opcode,
+        threshold=[node.data_value for node in nodes],
+        true_child=true_child,
+        false_child=false_child,
+        leaf_result=[leaf.result for leaf in leafs],
+    )
+    return Evaluator(
+        Tree(root_id=string(root), tree_version_id=version.id),
+        nodes,
+        leafs,
+        compiled=compiled,
+        data_types=data_types,
+    )
+
+
+def remove_tree_file(version: Version):
+    """
+    remove the tree file of this version if it has one
+    """
+    path = tree_file_path(version)
+    if path is not None:
+        path.unlink(missing_ok=True)
@@ -4,9 +4,14 @@ from typing import Dict, List, Union
 from ninja import Path, Query, Router, Schema
 from ninja.orm import create_schema
 
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 
-from .models import Color, Tree, TreeKind, TreeLeaf, TreeNode, Version
+from core.pagination import Page, paginated_response
+from .cache import get_current_version
+from .models import Color, Tree, TreeKind, TreeLeaf, TreeNode, Version, element_id
+from .signals import tree_published
 
 router = Router(tags=["tree"])
 
@@ -17,11 +22,12 @@ ColorIn = create_schema(Color, name="ColorIn", fields=["name"])
 
 
 @router.get("/colors", response=List[ColorOut])
-def colors(request):
+def colors(request, page: Page = Query(...)):
     """
     Retrieves all available colors that are saved in the database.
+    Supports **limit**, **after** and **stream** like /core/datatype/all.
     """
-    return Color.objects.all()
+    return paginated_response(Color.objects.all(), ColorOut, page)
 
 
 @router.post("/color/new", response={200: ColorOut})
@@ -49,7 +55,9 @@ def update_color(request, id: int, color: ColorIn):
 
 # === /kind/all === get all kinds of trees ===================================
 TreeKindOut = create_schema(TreeKind, name="TreeKindOut")
-TreeKindIn = create_schema(TreeKind, name="TreeKindIn", exclude=["id"])
+TreeKindIn = create_schema(
+    TreeKind, name="TreeKindIn", exclude=["id", "current_version"]
+)
 
 
 @router.get("/kind/all", response=List[TreeKindOut])
@@ -96,6 +104,21 @@ def update_tree_kind(request, id: int, tree_kind: TreeKindIn):
     )
 
 
+@router.put("/kind/{id}/current/{version_id}", response={200: TreeKindOut, 409: str})
+def set_current_version(request, id: int, version_id: int):
+    """
+    Make another valid version of this tree kind the current one, e.g. to roll back
+    to the tree before the latest one. Decisions use the trees of the current
+    version, the versions and trees themselves are not changed.
+    """
+    tree_kind = get_object_or_404(TreeKind, id=id)
+    version = get_object_or_404(Version, id=version_id, kind_of_tree=tree_kind)
+    if not version.valid or version.deleted:
+        return 409, "version " + str(version) + " is not a valid tree"
+    Version.objects.publish(version)
+    return 200, version.kind_of_tree
+
+
 @router.delete("/kind/{id}", response={200: str, 409: str})
 def delete_tree_kind(request, id: int):
     """
@@ -119,12 +142,15 @@ ShortTreeOut = create_schema(Tree, name="ShortTreeOut", depth=1, exclude=["root"
 
 
 @router.get("/all", response=List[ShortTreeOut])
-def all_trees(request):
+def all_trees(request, page: Page = Query(...)):
     """
     Retrieve all trees that are stored in the database. This includes trees from
     all kinds, current and old trees.
+    Supports **limit**, **after** and **stream** like /core/datatype/all.
     """
-    return Tree.objects.all()
+    return paginated_response(
+        Tree.objects.select_related("tree_version"), ShortTreeOut, page
+    )
 
 
 # === /latest === get current tree ===========================================
@@ -165,7 +191,8 @@ class TreeOut(Schema):
 @router.get("/latest", response={200: TreeOut, 204: None})
 def tree(request, kind_id: int = None):
     """
-    Retrieve the latest tree for a specific tree kind. If no tree kind is given, the
+    Retrieve the current tree for a specific tree kind, the one decisions are made
+    with (see /tree/kind/{id}/current/{version_id}). If no tree kind is given, the
     default kind with id=1 is used. This gives you all the information that there is
     about this specific tree and its nodes and leaves.
 
@@ -177,14 +204,8 @@ def tree(request, kind_id: int = None):
     is 5. This has internal reasons on how Django processes generic properties in the
     database.
     """
-    complete_tree = None
-    tree_kind = (
-        TreeKind.objects.first()
-        if kind_id is None
-        else TreeKind.objects.get(id=kind_id)
-    )
-
-    complete_tree = Tree.objects.get_current_complete_tree(kind_of_tree=tree_kind)
+    # the current version of the tree kind, the one decisions are made with
+    complete_tree = Tree.objects.get_complete_tree(get_current_version(kind_id))
     if complete_tree is None:
         return 204, None
     out = TreeOut(
@@ -287,7 +308,10 @@ def tree_explanation(request, whichversion: QueryVersion = Query(...)):
     )
 
     if whichversion.major is None and whichversion.minor is None:
-        complete_tree = Tree.objects.get_current_complete_tree(kind_of_tree=tree_kind)
+        # the current version of the tree kind, the one decisions are made with
+        complete_tree = Tree.objects.get_complete_tree(
+            get_current_version(whichversion.kind_of_tree)
+        )
     else:
         complete_tree = Tree.objects.get_complete_tree(
             version=Version.objects.get(
@@ -361,45 +385,113 @@ class NewTree(Schema):
     leafs: List[TreeLeafIn]
 
 
+class TreeCycleError(Exception):
+    """
+    raised when the successors of a node lead back to the node itself
+    """
+
+
+def order_elements(
+    root: int, elements: Dict[int, Union[TreeLeafIn, TreeNodeIn]]
+) -> List[int]:
+    """
+    input: number of the root and all elements of a new tree by number
+    walk the tree from the root iteratively (depth first, true before false)
+    output: numbers of all elements that can be reached from the root, every node
+    before its successors and the root first.
+    raises KeyError for a successor that is not defined and TreeCycleError if the
+    tree has a cycle
+    """
+    VISITING, DONE = 1, 2
+    state = dict()
+    order = []
+    stack = [(root, False)]
+    while stack:
+        number, finished = stack.pop()
+        if finished:
+            state[number] = DONE
+            continue
+        if number in state:
+            if state[number] == VISITING:
+                # still on the path from the root to here
+                raise TreeCycleError(number)
+            continue  # shared subtree that is already done
+        element = elements[number]
+        order.append(number)
+        if type(element) is TreeNodeIn:
+            state[number] = VISITING
+            stack.append((number, True))
+            stack.append((element.false_number, False))
+            stack.append((element.true_number, False))
+        else:
+            state[number] = DONE
+    return order
+
+
 def build_nodes(
-    to_create: int,
+    order: List[int],
     elements: Dict[int, Union[TreeLeafIn, TreeNodeIn]],
     version: Version,
-):
-    if type(elements[to_create]) is TreeNodeIn:
-        true = build_nodes(elements[to_create].true_number, elements, version)
-        false = build_nodes(elements[to_create].false_number, elements, version)
-        node_dict = elements[to_create].dict()
-        del node_dict["true_number"]
-        del node_dict["false_number"]
-        node = TreeNode(
-            true_successor=true[0],
-            false_successor=false[0],
-            tree_version=version,
-            **node_dict,
-        )
-        return [node] + true + false
-    elif type(elements[to_create]) is TreeLeafIn:
-        leaf = TreeLeaf(
-            tree_version=version,
-            **elements[to_create].dict(),
-        )
-        return [leaf]
+) -> List[Union[TreeNode, TreeLeaf]]:
+    """
+    input: numbers of the elements in the order of order_elements, all elements by
+    number and the new version
+    output: unsaved nodes and leaves with their ids and successors set
+    """
+    node_type = ContentType.objects.get_for_model(TreeNode).id
+    leaf_type = ContentType.objects.get_for_model(TreeLeaf).id
+    ids = dict()
+    types = dict()
+    for number in order:
+        if type(elements[number]) is TreeNodeIn:
+            ids[number] = element_id(version, TreeNode.ID_KIND, number)
+            types[number] = node_type
+        else:
+            ids[number] = element_id(version, TreeLeaf.ID_KIND, number)
+            types[number] = leaf_type
+
+    built = []
+    for number in order:
+        element = elements[number]
+        if type(element) is TreeNodeIn:
+            node_dict = element.dict()
+            true_number = node_dict.pop("true_number")
+            false_number = node_dict.pop("false_number")
+            built.append(
+                TreeNode(
+                    id=ids[number],
+                    true_type_id=types[true_number],
+                    true_id=ids[true_number],
+                    false_type_id=types[false_number],
+                    false_id=ids[false_number],
+                    tree_version=version,
+                    **node_dict,
+                )
+            )
+        else:
+            built.append(
+                TreeLeaf(id=ids[number], tree_version=version, **element.dict())
+            )
+    return built
 
 
 def save_nodes(nodes):
-    for node in nodes:
-        node.save(force_insert=True)
+    """
+    save all leaves and all nodes with one bulk insert each
+    """
+    TreeLeaf.objects.bulk_create(
+        [node for node in nodes if type(node) is TreeLeaf], batch_size=5000
+    )
+    TreeNode.objects.bulk_create(
+        [node for node in nodes if type(node) is TreeNode], batch_size=5000
+    )
     return None
 
 
 def check_lens(node, payload):
-    same_length = False
-    n_nodes = TreeNode.objects.filter(tree_version=node.tree_version)
-    n_leafs = TreeLeaf.objects.filter(tree_version=node.tree_version)
-    if len(n_nodes) == len(payload.nodes) and len(n_leafs) == len(payload.leafs):
-        same_length = True
-    return same_length
+    n_nodes = TreeNode.objects.filter(tree_version=node.tree_version).count()
+    n_leafs = TreeLeaf.objects.filter(tree_version=node.tree_version).count()
+    return n_nodes == len(payload.nodes) and n_leafs == len(payload.leafs)
 
 
 def delete_nodes(version):
@@ -416,14 +508,21 @@ def validate_tree(tree, payload):
             tree.tree_version.save()
             return True, "All good"
         else:
-            return False, (
-                "number of saved nodes/leafs not like in query.\n"
-                "Probably query has two 'roots'.\n"
-            )
+            return False, TWO_ROOTS
     else:
         return False, "root problem\n"
 
 
+TWO_ROOTS = (
+    "number of saved nodes/leafs not like in query.\n"
+    "Probably query has two 'roots'.\n"
+)
+NOT_SAVED = (
+    "The tree could not be validated and saved correctly.\n"
+    "Change what is wrong and try again!"
+)
+
+
 @router.post("/new/{int:kind_id}", response={200: ShortTreeOut, 400: str})
 def new_tree(request, payload: NewTree, kind_id: int = Path(...)):
     """
@@ -464,9 +563,6 @@ def new_tree(request, payload: NewTree, kind_id: int = Path(...)):
     stating the problem.
     """
     tree_kind = TreeKind.objects.get(id=int(kind_id))
-    version = Version.objects.create_next_version(
-        kind_of_tree=tree_kind, isMajor=payload.new_major_version
-    )
     tree_dict = dict()
     for element in payload.nodes + payload.leafs:
         if element.number in tree_dict:
@@ -477,32 +573,38 @@ def new_tree(request, payload: NewTree, kind_id: int = Path(...)):
             )
         else:
             tree_dict[element.number] = element
+    # check the whole structure before anything is saved
     try:
-        # Save only single occurences list -> fromkeys -> list
-        # case multiple nodes point to the same object
-        nodes = list(dict.fromkeys(build_nodes(payload.root, tree_dict, version)))
+        order = order_elements(payload.root, tree_dict)
     except KeyError as e:
-        version.delete()
         return 400, (
             "You referenced " + str(e) + " as successor of a node, "
             "but you didn't define a Leaf or Node with that number.\n"
             "Change what is wrong and try again!"
         )
-    except RecursionError:
+    except TreeCycleError:
         return 400, (
             "RecursionError: There is a endless recursion loop in your tree.\n"
             "Change what is wrong and try again!"
         )
-    else:
+    if type(tree_dict[payload.root]) is not TreeNodeIn:
+        return 400, "root problem\n" + NOT_SAVED
+    if len(order) != len(tree_dict):
+        # some elements can't be reached from the root
+        return 400, TWO_ROOTS + NOT_SAVED
+
+    with transaction.atomic():
+        # concurrent publishes of this tree kind wait here, so each one numbers its
+        # version after the one before it
+        tree_kind = TreeKind.objects.select_for_update().get(id=tree_kind.id)
+        # the structure was checked above, so the version is valid from the start
+        version = Version.objects.create_next_version(
+            kind_of_tree=tree_kind, isMajor=payload.new_major_version, is_valid=True
+        )
+        nodes = build_nodes(order, tree_dict, version)
         save_nodes(nodes)
         tree = Tree(created_by=payload.created_by, root=nodes[0], tree_version=version)
-        valid, message = validate_tree(tree, payload)
-        if valid:
-            tree.save(force_insert=True)
-            return 200, tree
-        else:
-            delete_nodes(version)
-            return 400, (
-                message + "The tree could not be validated and saved correctly.\n"
-                "Change what is wrong and try again!"
-            )
+        tree.save(force_insert=True)
+        Version.objects.publish(version)
+    tree_published.send(sender=Tree, tree=tree, version=version)
+    return 200, tree
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TreeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tree"
+
+    def ready(self):
+        # connect the signal receivers of the current version cache
+        from . import cache  # noqa: F401
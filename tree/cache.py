@@ -0,0 +1,69 @@
+from typing import Union
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.cache import LRUCache
+from .models import TreeKind, Version
+from .signals import tree_published
+
+# current version by tree kind id (None = the first tree kind). saving or deleting a
+# tree kind or a version clears it in this process, other worker processes follow a
+# moved pointer after TREEXPERT_CURRENT_VERSION_CACHE_MAX_AGE seconds.
+current_version_cache = LRUCache(
+    max_size=getattr(settings, "TREEXPERT_CURRENT_VERSION_CACHE_SIZE", 128),
+    max_age=getattr(settings, "TREEXPERT_CURRENT_VERSION_CACHE_MAX_AGE", 5),
+)
+
+
+def load_current_version(kind_of_tree_id: int = None) -> Union[None, Version]:
+    """
+    output: the version the pointer of the tree kind refers to, the latest valid and
+    not deleted version of the tree kind if nothing was published yet
+    """
+    tree_kinds = TreeKind.objects.select_related("current_version__kind_of_tree")
+    if kind_of_tree_id:
+        tree_kind = tree_kinds.get(id=kind_of_tree_id)
+    else:
+        tree_kind = tree_kinds.order_by("id").first()
+        if tree_kind is None:
+            return None
+    if tree_kind.current_version is not None:
+        return tree_kind.current_version
+    version = Version.objects.get_current_version(tree_kind)
+    if version is not None:
+        version.kind_of_tree = tree_kind
+    return version
+
+
+def get_current_version(kind_of_tree_id: int = None) -> Union[None, Version]:
+    """
+    input: id of a tree kind or None for the first tree kind
+    output: its current version, without a query if it is cached
+    """
+    return current_version_cache.get_or_load(
+        kind_of_tree_id or None, lambda: load_current_version(kind_of_tree_id)
+    )
+
+
+async def aget_current_version(kind_of_tree_id: int = None) -> Union[None, Version]:
+    """
+    like get_current_version for async views, a version that is not cached is
+    loaded in a thread
+    """
+    missing = object()
+    version = current_version_cache.get(kind_of_tree_id or None, missing)
+    if version is missing:
+        version = await sync_to_async(get_current_version)(kind_of_tree_id)
+    return version
+
+
+@receiver(tree_published)
+@receiver(post_save, sender=TreeKind)
+@receiver(post_delete, sender=TreeKind)
+@receiver(post_save, sender=Version)
+@receiver(post_delete, sender=Version)
+def invalidate_current_versions(sender, **kwargs):
+    current_version_cache.clear()
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def point_to_latest_valid_version(apps, schema_editor):
+    TreeKind = apps.get_model("tree", "TreeKind")
+    Version = apps.get_model("tree", "Version")
+    for tree_kind in TreeKind.objects.all():
+        tree_kind.current_version = (
+            Version.objects.filter(kind_of_tree=tree_kind, valid=True, deleted=False)
+            .order_by("-date_created")
+            .first()
+        )
+        tree_kind.save(update_fields=["current_version"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tree", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="treekind",
+            name="current_version",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="tree.version",
+            ),
+        ),
+        migrations.RunPython(point_to_latest_valid_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:19
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def renumber_duplicates(apps, schema_editor):
+    """
+    versions that have the same number as an older version of their tree kind (e.g.
+    created at the same time) get the next free minor number of their major
+    version, so the numbers can be made unique. the ids of their nodes and leafs
+    keep the old number.
+    """
+    Version = apps.get_model("tree", "Version")
+    duplicates = (
+        Version.objects.values_list("kind_of_tree", "major", "minor")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for kind_of_tree, major, minor, _ in list(duplicates):
+        versions = Version.objects.filter(
+            kind_of_tree=kind_of_tree, major=major, minor=minor
+        ).order_by("date_created", "id")
+        for version in list(versions)[1:]:
+            version.minor = (
+                Version.objects.filter(
+                    kind_of_tree=kind_of_tree, major=major
+                ).aggregate(Max("minor"))["minor__max"]
+                + 1
+            )
+            version.save(update_fields=["minor"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tree", "0002_treekind_current_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="version",
+            index=models.Index(
+                fields=["kind_of_tree", "-date_created"],
+                name="tree_version_kind_date_idx",
+            ),
+        ),
+        migrations.RunPython(renumber_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="version",
+            constraint=models.UniqueConstraint(
+                fields=("kind_of_tree", "major", "minor"),
+                name="tree_version_unique_number",
+            ),
+        ),
+    ]
@@ -14,6 +14,15 @@ from core.models import DataType
 class TreeKind(models.Model):
     name = models.CharField(max_length=60, unique=True)
     description = models.CharField(max_length=200)
+    # the published version decisions use, moved when /tree/new saves a valid tree
+    # or by a rollback. None until the first tree of this kind is published.
+    current_version = models.ForeignKey(
+        "Version",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
 
 
 class Color(models.Model):
@@ -31,12 +40,21 @@ class VersionManager(models.Manager):
     """
 
     def get_current_version(self, kind_of_tree: TreeKind) -> "Union[None, Version]":
-        # ordered = self.filter(valid=True, deleted=False).order_by("-date_created")
-        all_of_this_kind = self.filter(kind_of_tree=kind_of_tree)
-        ordered = all_of_this_kind.order_by("-date_created")
-        if not ordered:
-            return None
-        return ordered.first()
+        # the same rule migration 0002 used to set the pointers of existing tree kinds
+        return (
+            self.filter(kind_of_tree=kind_of_tree, valid=True, deleted=False)
+            .order_by("-date_created")
+            .first()
+        )
+
+    def publish(self, version: "Version"):
+        """
+        make this version the current version of its tree kind, only the pointer of
+        the tree kind is moved
+        """
+        tree_kind = version.kind_of_tree
+        tree_kind.current_version = version
+        tree_kind.save(update_fields=["current_version"])
 
     def create_next_version(
         self,
@@ -45,7 +63,10 @@ class VersionManager(models.Manager):
         is_valid: bool = False,
         delete: bool = False,
     ):
-        latest_version = self.get_current_version(kind_of_tree)
+        # the highest number, a version renumbered by migration 0003 can be newer
+        latest_version = (
+            self.filter(kind_of_tree=kind_of_tree).order_by("-major", "-minor").first()
+        )
         major = 0 if latest_version is None else latest_version.major
         minor = 0 if latest_version is None else latest_version.minor
         if isMajor:
@@ -81,6 +102,22 @@ class Version(models.Model):
 
     objects = VersionManager()
 
+    class Meta:
+        indexes = [
+            # latest version of a tree kind (get_current_version)
+            models.Index(
+                fields=["kind_of_tree", "-date_created"],
+                name="tree_version_kind_date_idx",
+            )
+        ]
+        constraints = [
+            # also the index for a version by its number (/tree/explanation)
+            models.UniqueConstraint(
+                fields=["kind_of_tree", "major", "minor"],
+                name="tree_version_unique_number",
+            )
+        ]
+
     def __str__(self):
         return self.kind_of_tree.name + ": " + str(self.major) + "." + str(self.minor)
 
@@ -97,6 +134,8 @@ class LeafManager(models.Manager):
 
 
 class TreeLeaf(models.Model):
+    ID_KIND = "L"
+
     number = models.IntegerField()
     date_created = models.DateTimeField(auto_now_add=True)
     id = models.CharField(
@@ -111,8 +150,12 @@ class TreeLeaf(models.Model):
 
     objects = LeafManager()
 
+    def save(self, *args, **kwargs):
+        id_creator(TreeLeaf, self)
+        super().save(*args, **kwargs)
 
-def id_creator(sender, instance, **kwargs):
+
+def element_id(version: Version, kind: str, number: int) -> str:
     """
     used to create a unique id for the node or leaf that's easily readable for humans.
     for a node this will be sth like 1_1.0_N.1 meaning:
@@ -121,14 +164,21 @@ def id_creator(sender, instance, **kwargs):
     for a leaf this will be nearly the same, just switching the N for Node for a L for
     Leaf.
     """
-    try:
-        instance.id = (
-            f"{instance.tree_version.kind_of_tree.id}"
-            f"_{instance.tree_version.major}.{instance.tree_version.minor}"
-            f"_{str(type(instance))[-6]}.{instance.number}"
-        )
-    except AttributeError:
-        pass
+    return f"{version.kind_of_tree_id}_{version.major}.{version.minor}_{kind}.{number}"
+
+
+def id_creator(sender, instance, **kwargs):
+    """
+    gives new nodes and leafs their id (see element_id) as soon as they know their
+    version, so they can be referenced as successors before they are saved.
+    rows loaded from the database already carry their id as a plain column value,
+    they are left alone and don't trigger any version or tree kind lookups.
+    """
+    if instance.id != sender._meta.pk.get_default():
+        return
+    if instance.tree_version_id is None or instance.number is None:
+        return
+    instance.id = element_id(instance.tree_version, sender.ID_KIND, instance.number)
 
 
 post_init.connect(id_creator, TreeLeaf)
@@ -147,6 +197,8 @@ class NodeManager(models.Manager):
 
 # noinspection SpellCheckingInspection
 class TreeNode(models.Model):
+    ID_KIND = "N"
+
     GREATERTHAN = "GT"
     SMALLERTHAN = "ST"
     EQUAL = "EQ"
@@ -210,6 +262,10 @@ class TreeNode(models.Model):
     def __str__(self):
         return str(self.id) + ": " + self.display_name
 
+    def save(self, *args, **kwargs):
+        id_creator(TreeNode, self)
+        super().save(*args, **kwargs)
+
 
 post_init.connect(id_creator, TreeNode)
 
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# sent by /tree/new after a new tree was validated and saved.
+# sender: the Tree class, kwargs: tree (the saved Tree), version (its Version)
+tree_published = Signal()
@@ -1,16 +1,20 @@
 import json
+import threading
 from unittest.mock import patch
 
-from django.test import Client
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TransactionTestCase
 
 from core.models import DataType
 
 from tree.api import (
     delete_nodes,
     NewTree,
+    order_elements,
     PathDate,
     save_nodes,
     TreeNodeIn,
+    TreeCycleError,
     TreeLeafIn,
     validate_tree,
 )
@@ -109,9 +113,9 @@ class TreeApiTests(BaseModelTreeTests):
         self.assertNotEqual(len(response.json()["nodes"]), 0)
         self.assertNotEqual(len(response.json()["leafs"]), 0)
 
-    @patch("tree.models.Tree.objects.get_current_complete_tree")
-    def test_complete_tree_none(self, mock_tree):
-        mock_tree.return_value = None
+    @patch("tree.api.get_current_version")
+    def test_complete_tree_none(self, mock_version):
+        mock_version.return_value = None
         response = self.client.get("/api/tree/latest")
         self.assertEqual(response.status_code, 204)
 
@@ -140,7 +144,7 @@ class TreeApiTests(BaseModelTreeTests):
     def test_save_nodes(self):
         # arrange
         new_version = Version.objects.create(
-            kind_of_tree=self.tree_kind, major=1, minor=0
+            kind_of_tree=self.tree_kind, major=1, minor=0, valid=True
         )
         leaf_3 = TreeLeaf(
             tree_version=new_version,
@@ -187,7 +191,7 @@ class TreeApiTests(BaseModelTreeTests):
     def test_delete_nodes(self):
         # arrange
         new_version = Version.objects.create(
-            kind_of_tree=self.tree_kind, major=1, minor=0
+            kind_of_tree=self.tree_kind, major=1, minor=0, valid=True
         )
         new_version_str = str(new_version)
         leaf_3 = TreeLeaf(
@@ -237,7 +241,7 @@ class TreeApiTests(BaseModelTreeTests):
     def test_validate_tree(self):
         # assert
         new_version = Version.objects.create(
-            kind_of_tree=self.tree_kind, major=1, minor=0
+            kind_of_tree=self.tree_kind, major=1, minor=0, valid=True
         )
         data_type = DataType(name="test")
         data_type.save()
@@ -636,6 +640,163 @@ class TreeApiTests(BaseModelTreeTests):
         )
         self.assertEqual(response.status_code, 400)
 
+    def chain(self, data_type: DataType, length: int) -> dict:
+        """
+        output: json of a new tree that is a chain of nodes, every node has a leaf
+        as false successor
+        """
+        nodes = [
+            {
+                "number": number,
+                "display_name": "node_" + str(number),
+                "description": "",
+                "data_type_id": data_type.id,
+                "data_value": number,
+                "comparison": "GT",
+                "list_comparison": "ALL",
+                "true_number": number + 1 if number + 1 < length else -1,
+                "false_number": -1 - number - 1,
+            }
+            for number in range(length)
+        ]
+        leafs = [
+            {"number": -1 - number, "display_name": "leaf", "result": number > 0}
+            for number in range(length + 1)
+        ]
+        return {
+            "created_by": "paula",
+            "new_major_version": True,
+            "root": 0,
+            "nodes": nodes,
+            "leafs": leafs,
+        }
+
+    def test_order_elements(self):
+        node = dict(description="", data_type_id=1, data_value=1, comparison="GT")
+        elements = {
+            1: TreeNodeIn(
+                number=1, display_name="a", true_number=2, false_number=3, **node
+            ),
+            2: TreeNodeIn(
+                number=2, display_name="b", true_number=4, false_number=3, **node
+            ),
+            3: TreeLeafIn(number=3, display_name="c", result=True),
+            4: TreeLeafIn(number=4, display_name="d", result=True),
+            5: TreeLeafIn(number=5, display_name="e", result=True),
+        }
+        # the shared leaf 3 is listed once, 5 can't be reached
+        self.assertEqual(order_elements(1, elements), [1, 2, 4, 3])
+        elements[2].false_number = 1
+        with self.assertRaises(TreeCycleError):
+            order_elements(1, elements)
+        elements[2].false_number = 6
+        with self.assertRaises(KeyError):
+            order_elements(1, elements)
+
+    def test_post_deep_tree(self):
+        data_type = DataType.objects.create(name="test")
+        response = self.client.post(
+            "/api/tree/new/" + str(self.tree_kind.id),
+            data=json.dumps(self.chain(data_type, 3000)),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        version = Tree.objects.get(id=response.json()["id"]).tree_version
+        self.assertTrue(version.valid)
+        self.tree_kind.refresh_from_db()
+        self.assertEqual(self.tree_kind.current_version, version)
+        self.assertEqual(TreeNode.objects.filter(tree_version=version).count(), 3000)
+        self.assertEqual(TreeLeaf.objects.filter(tree_version=version).count(), 3001)
+        node = TreeNode.objects.get(tree_version=version, number=2998)
+        self.assertEqual(node.true_successor.number, 2999)
+        self.assertEqual(node.false_successor.number, -3000)
+
+    def test_post_tree_saves_version_once(self):
+        data_type = DataType.objects.create(name="test")
+        with patch.object(
+            Version, "save", autospec=True, side_effect=Version.save
+        ) as mock_save:
+            response = self.client.post(
+                "/api/tree/new/" + str(self.tree_kind.id),
+                data=json.dumps(self.chain(data_type, 3)),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        # created valid, not counted and saved again afterwards
+        self.assertEqual(mock_save.call_count, 1)
+
+    def test_post_tree_shared_subtree(self):
+        data_type = DataType.objects.create(name="test")
+        json_data = self.chain(data_type, 3)
+        # both successors of the root lead to node 1
+        json_data["nodes"][0]["false_number"] = 1
+        del json_data["leafs"][1]
+        response = self.client.post(
+            "/api/tree/new/" + str(self.tree_kind.id),
+            data=json.dumps(json_data),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        root = Tree.objects.get(id=response.json()["id"]).root
+        self.assertEqual(root.true_successor, root.false_successor)
+
+    def test_post_invalid_tree_is_not_saved(self):
+        data_type = DataType.objects.create(name="test")
+        json_data = self.chain(data_type, 3)
+        json_data["leafs"].append(
+            {"number": 99, "display_name": "orphan", "result": True}
+        )
+        versions = Version.objects.count()
+        response = self.client.post(
+            "/api/tree/new/" + str(self.tree_kind.id),
+            data=json.dumps(json_data),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json().startswith("number of saved nodes/leafs"))
+        self.assertEqual(Version.objects.count(), versions)
+
+    def test_post_tree_rolled_back(self):
+        data_type = DataType.objects.create(name="test")
+        versions = Version.objects.count()
+        nodes = TreeNode.objects.count()
+        with patch("tree.api.Tree.save", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post(
+                    "/api/tree/new/" + str(self.tree_kind.id),
+                    data=json.dumps(self.chain(data_type, 10)),
+                    content_type="application/json",
+                )
+        self.assertEqual(Version.objects.count(), versions)
+        self.assertEqual(TreeNode.objects.count(), nodes)
+
+    def test_latest_tree_after_rollback(self):
+        # arrange: publish a newer tree, then roll back to the first one
+        Version.objects.filter(id=self.version.id).update(valid=True)
+        data_type = DataType.objects.create(name="test")
+        response = self.client.post(
+            "/api/tree/new/" + str(self.tree_kind.id),
+            data=json.dumps(self.chain(data_type, 3)),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        new_version = self.client.get("/api/tree/latest").json()["version"]
+        self.assertNotEqual(new_version, str(self.version))
+        # act
+        response = self.client.put(
+            "/api/tree/kind/"
+            + str(self.tree_kind.id)
+            + "/current/"
+            + str(self.version.id)
+        )
+        # assert: both show the tree decisions are made with
+        self.assertEqual(response.status_code, 200)
+        latest = self.client.get("/api/tree/latest").json()
+        self.assertEqual(latest["version"], str(self.version))
+        self.assertEqual(latest["id"], self.tree.id)
+        explanation = self.client.get("/api/tree/explanation").json()
+        self.assertEqual(explanation["version"], str(self.version))
+
     def test_explanation_tree(self):
         # act
         response = self.client.get("/api/tree/explanation")
@@ -666,11 +827,72 @@ class TreeApiTests(BaseModelTreeTests):
         assert mock_tree.called
         self.assertEqual(response.status_code, 204)
 
-    @patch("tree.models.Tree.objects.get_current_complete_tree")
-    def test_explanation_tree_none(self, mock_tree):
+    @patch("tree.api.get_current_version")
+    def test_explanation_tree_none(self, mock_version):
         # arrange
-        mock_tree.return_value = None
+        mock_version.return_value = None
         # act
         response = self.client.get("/api/tree/explanation")
         # assert
         self.assertEqual(response.status_code, 204)
+
+
+class ConcurrentPublishTests(TransactionTestCase):
+    def test_publish_waits_for_other_publish(self):
+        tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        data_type = DataType.objects.create(name="test")
+        json_data = {
+            "created_by": "paula",
+            "new_major_version": False,
+            "root": 0,
+            "nodes": [
+                {
+                    "number": 0,
+                    "display_name": "node",
+                    "description": "",
+                    "data_type_id": data_type.id,
+                    "data_value": 1,
+                    "comparison": "GT",
+                    "true_number": 1,
+                    "false_number": 2,
+                }
+            ],
+            "leafs": [
+                {"number": 1, "display_name": "yes", "result": True},
+                {"number": 2, "display_name": "no", "result": False},
+            ],
+        }
+        responses = []
+
+        def publish():
+            try:
+                responses.append(
+                    Client().post(
+                        "/api/tree/new/" + str(tree_kind.id),
+                        data=json.dumps(json_data),
+                        content_type="application/json",
+                    )
+                )
+            except Exception as error:
+                responses.append(error)
+            finally:
+                connection.close()
+
+        # another publish has numbered its version, but not committed yet
+        with transaction.atomic():
+            TreeKind.objects.select_for_update().get(id=tree_kind.id)
+            Version.objects.create_next_version(kind_of_tree=tree_kind, is_valid=True)
+            thread = threading.Thread(target=publish)
+            thread.start()
+            thread.join(1)
+            self.assertTrue(thread.is_alive())
+        thread.join()
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(
+            sorted(
+                Version.objects.filter(kind_of_tree=tree_kind).values_list(
+                    "minor", flat=True
+                )
+            ),
+            [1, 2],
+        )
@@ -0,0 +1,85 @@
+from django.test import Client, TestCase
+
+from tree.cache import current_version_cache, get_current_version
+from tree.models import TreeKind, Version
+
+
+class CurrentVersionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.client = Client()
+        cls.tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        cls.old_version = Version.objects.create(
+            kind_of_tree=cls.tree_kind, major=1, minor=0, valid=True
+        )
+        cls.new_version = Version.objects.create(
+            kind_of_tree=cls.tree_kind, major=1, minor=1, valid=True
+        )
+
+    def setUp(self):
+        current_version_cache.clear()
+        return super().setUp()
+
+    def test_latest_version_without_pointer(self):
+        self.assertEqual(get_current_version(self.tree_kind.id), self.new_version)
+        self.assertEqual(get_current_version(), self.new_version)
+
+    def test_latest_invalid_or_deleted_version_without_pointer(self):
+        newest = Version.objects.create(
+            kind_of_tree=self.tree_kind, major=1, minor=2, valid=False
+        )
+        self.assertEqual(get_current_version(self.tree_kind.id), self.new_version)
+        newest.valid = True
+        newest.deleted = True
+        newest.save()
+        self.assertEqual(get_current_version(self.tree_kind.id), self.new_version)
+
+    def test_no_tree_kind(self):
+        TreeKind.objects.all().delete()
+        self.assertIsNone(get_current_version())
+
+    def test_publish_moves_pointer(self):
+        Version.objects.publish(self.old_version)
+        self.tree_kind.refresh_from_db()
+        self.assertEqual(self.tree_kind.current_version, self.old_version)
+        self.assertEqual(get_current_version(self.tree_kind.id), self.old_version)
+
+    def test_current_version_cached(self):
+        Version.objects.publish(self.new_version)
+        get_current_version(self.tree_kind.id)
+        with self.assertNumQueries(0):
+            version = get_current_version(self.tree_kind.id)
+            # the tree kind is loaded with it
+            self.assertEqual(str(version), "Test Kind: 1.1")
+
+    def test_publish_invalidates_cache(self):
+        self.assertEqual(get_current_version(self.tree_kind.id), self.new_version)
+        Version.objects.publish(self.old_version)
+        self.assertEqual(get_current_version(self.tree_kind.id), self.old_version)
+
+    def test_rollback_endpoint(self):
+        response = self.client.put(
+            "/api/tree/kind/"
+            + str(self.tree_kind.id)
+            + "/current/"
+            + str(self.old_version.id)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["current_version"], self.old_version.id)
+        self.assertEqual(get_current_version(self.tree_kind.id), self.old_version)
+
+    def test_rollback_to_invalid_version(self):
+        invalid = Version.objects.create(kind_of_tree=self.tree_kind, major=0, minor=1)
+        response = self.client.put(
+            "/api/tree/kind/" + str(self.tree_kind.id) + "/current/" + str(invalid.id)
+        )
+        self.assertEqual(response.status_code, 409)
+        other_kind = TreeKind.objects.create(name="Other Kind", description="test")
+        response = self.client.put(
+            "/api/tree/kind/"
+            + str(other_kind.id)
+            + "/current/"
+            + str(self.old_version.id)
+        )
+        self.assertEqual(response.status_code, 404)
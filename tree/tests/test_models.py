@@ -38,9 +38,11 @@ class VersionModelTests(TestCase):
         self.assertIsNone(result)
 
     def test_get_current_version_latest(self):
-        old_version = Version(kind_of_tree=self.tree_kind, major=0, minor=1)
+        old_version = Version(kind_of_tree=self.tree_kind, major=0, minor=1, valid=True)
         old_version.save(force_insert=True)
-        next_version = Version(kind_of_tree=self.tree_kind, major=1, minor=0)
+        next_version = Version(
+            kind_of_tree=self.tree_kind, major=1, minor=0, valid=True
+        )
         next_version.save(force_insert=True)
         current_version = Version.objects.get_current_version(
             kind_of_tree=self.tree_kind
@@ -70,6 +72,13 @@ class VersionModelTests(TestCase):
         self.assertEquals(second_version.major, 1)
         self.assertEquals(second_version.minor, 0)
 
+    def test_create_next_version_after_highest(self):
+        Version.objects.create(kind_of_tree=self.tree_kind, major=0, minor=3)
+        # newer, but with a lower number
+        Version.objects.create(kind_of_tree=self.tree_kind, major=0, minor=2)
+        next_version = Version.objects.create_next_version(kind_of_tree=self.tree_kind)
+        self.assertEquals(next_version.minor, 4)
+
 
 class BaseModelTreeTests(TestCase):
     @classmethod
@@ -77,7 +86,7 @@ class BaseModelTreeTests(TestCase):
         super(BaseModelTreeTests, cls).setUpClass()
         cls.tree_kind = TreeKind(name="Test Kind", description="test description")
         cls.tree_kind.save()
-        cls.version = Version(kind_of_tree=cls.tree_kind, major=0, minor=1)
+        cls.version = Version(kind_of_tree=cls.tree_kind, major=0, minor=1, valid=True)
         cls.version.save()
         cls.first_leaf = TreeLeaf(
             tree_version=cls.version,
@@ -126,7 +135,7 @@ class TreeLeafModelTests(BaseModelTreeTests):
 
     def test_get_current_leafs(self):
         new_version = Version.objects.create(
-            kind_of_tree=self.tree_kind, major=1, minor=0
+            kind_of_tree=self.tree_kind, major=1, minor=0, valid=True
         )
         third_leaf = TreeLeaf(
             tree_version=new_version,
@@ -147,7 +156,7 @@ class TreeNodeModelTests(BaseModelTreeTests):
 
     def test_get_nodes_of_version(self):
         new_version = Version.objects.create(
-            kind_of_tree=self.tree_kind, major=1, minor=0
+            kind_of_tree=self.tree_kind, major=1, minor=0, valid=True
         )
         second_node = TreeNode(
             tree_version=new_version,
@@ -166,7 +175,7 @@ class TreeNodeModelTests(BaseModelTreeTests):
 
     def test_get_current_nodes(self):
         new_version = Version.objects.create(
-            kind_of_tree=self.tree_kind, major=1, minor=0
+            kind_of_tree=self.tree_kind, major=1, minor=0, valid=True
         )
         second_node = TreeNode(
             tree_version=new_version,
@@ -193,6 +202,51 @@ class TreeManagerTests(TestCase):
         result = Tree.objects.get_complete_tree(version=None)
         self.assertIsNone(result)
 
+    def build_chain(self, version, data_type, length):
+        """
+        saves a tree of `length` nodes, each with a leaf as true successor and the
+        next node as false successor (the last one ends in two leaves)
+        """
+        successor = TreeLeaf(tree_version=version, number=0, result=False)
+        successor.save()
+        for number in range(1, length + 1):
+            leaf = TreeLeaf(tree_version=version, number=2 * number, result=True)
+            leaf.save()
+            successor = TreeNode(
+                tree_version=version,
+                number=2 * number + 1,
+                data_type=data_type,
+                data_value=number,
+                true_successor=leaf,
+                false_successor=successor,
+            )
+            successor.save()
+        Tree.objects.create(root=successor, tree_version=version)
+
+    def test_complete_tree_constant_queries(self):
+        tree_kind = TreeKind.objects.create(name="Test Kind", description="test")
+        data_type = DataType.objects.create(name="TEST", display_name="test type")
+        for major, length in [(1, 1), (2, 50)]:
+            version = Version.objects.create(
+                kind_of_tree=tree_kind, major=major, minor=0
+            )
+            self.build_chain(version, data_type, length)
+            version = Version.objects.get(id=version.id)
+            # tree, nodes and leafs, but nothing per loaded row
+            with self.assertNumQueries(3):
+                tree, nodes, leafs, _ = Tree.objects.get_complete_tree(version)
+                nodes = list(nodes)
+                leafs = list(leafs)
+            self.assertEqual(len(nodes), length)
+            self.assertEqual(len(leafs), length + 1)
+            self.assertEqual(
+                {node.id for node in nodes},
+                {
+                    f"{tree_kind.id}_{major}.0_N.{2 * number + 1}"
+                    for number in range(1, length + 1)
+                },
+            )
+
 
 class TreeModelTests(BaseModelTreeTests):
     def test_tree_creation(self):
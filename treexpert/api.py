@@ -1,6 +1,8 @@
 from ninja import NinjaAPI
 from core.api import router as core_router
 from decision.api import router as decision_router
+from decision.async_api import router as decision_async_router
+from decision.jobs_api import router as decision_jobs_router
 from tree.api import router as tree_router
 
 api = NinjaAPI(
@@ -11,3 +13,5 @@ api = NinjaAPI(
 api.add_router("/core/", core_router)
 api.add_router("/tree/", tree_router)
 api.add_router("/decision/", decision_router)
+api.add_router("/decision/async/", decision_async_router)
+api.add_router("/decision/jobs/", decision_jobs_router)
@@ -118,3 +118,127 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Decision evaluator cache
+# number of evaluators (one per tree version) that are kept in memory per process
+# and the maximum age of an entry in seconds (None = no age limit)
+
+TREEXPERT_EVALUATOR_CACHE_SIZE = 32
+TREEXPERT_EVALUATOR_CACHE_MAX_AGE = None
+
+# Decision log partitions
+# requests, their data and decisions are partitioned by month. the management command
+# create_log_partitions creates the partitions of this and the next months, run it
+# regularly. expire_log_partitions drops the partitions older than the retention
+# period (None = keep everything), archived as compressed csv files to the archive
+# directory if one is set.
+
+TREEXPERT_PARTITION_MONTHS_AHEAD = 3
+TREEXPERT_LOG_RETENTION_MONTHS = None
+TREEXPERT_PARTITION_ARCHIVE_DIR = None
+
+# Request data storage
+# "rows" saves one RequestData row per input value, "document" saves all input
+# values of a request as one document on the request (one insert instead of one per
+# value), "blob" saves each distinct input once, addressed by its hash, and requests
+# with the same input refer to it. requests saved as rows are packed into documents
+# by the management command pack_request_data, /decision/data reads all of them.
+
+TREEXPERT_REQUEST_DATA_STORAGE = "rows"
+
+# Decision log archive
+# compact_logs moves the requests, data and decisions of closed months out of the
+# database into compressed files in the archive directory (blocks of this many
+# requests). /decision/result and /decision/data look up requests there that are no
+# longer in the database, the most recently read blocks are kept in memory.
+
+TREEXPERT_ARCHIVE_DIR = BASE_DIR.parent / "archive"
+TREEXPERT_ARCHIVE_BLOCK_SIZE = 1000
+TREEXPERT_ARCHIVE_BLOCK_CACHE = 16
+
+# Streamed lists
+# rows fetched per round trip of the server side cursor when a list endpoint or an
+# export streams NDJSON
+
+TREEXPERT_STREAM_CHUNK_SIZE = 2000
+
+# entities decided and saved at once (in one transaction) by the streaming bunch
+# endpoint /decision/bunch/stream, it holds one chunk of entities and results in
+# memory
+
+TREEXPERT_DECISION_STREAM_CHUNK_SIZE = 500
+
+# Decision jobs
+# /decision/jobs splits a job into chunks of this many entities, each decided by a
+# decision_worker process in one transaction. a chunk that isn't finished this many
+# seconds after it was claimed is claimed again, after this many claims it fails.
+
+TREEXPERT_JOB_CHUNK_SIZE = 1000
+TREEXPERT_JOB_CLAIM_TIMEOUT = 600
+TREEXPERT_JOB_MAX_ATTEMPTS = 3
+
+# Current tree versions
+# seconds the current version of each tree kind is cached. this process drops it as
+# soon as a tree is published or rolled back, other processes after this time.
+
+TREEXPERT_CURRENT_VERSION_CACHE_SIZE = 128
+TREEXPERT_CURRENT_VERSION_CACHE_MAX_AGE = 5
+
+# Decision evaluator backend
+# "interpreter" walks the compiled arrays of a tree, "codegen" generates and compiles
+# a python function for every tree version (faster for deep trees, generated once
+# per cached evaluator)
+
+TREEXPERT_EVALUATOR_BACKEND = "interpreter"
+
+# Decision cache
+# results of recently evaluated inputs per tree version, clients that send the same
+# input again get the cached result (size 0 = off). the requests are still saved
+# unless TREEXPERT_DECISION_CACHE_LOG_HITS is False, then a cache hit is answered
+# without writing anything.
+
+TREEXPERT_DECISION_CACHE_SIZE = 10000
+TREEXPERT_DECISION_CACHE_MAX_AGE = None
+TREEXPERT_DECISION_CACHE_LOG_HITS = True
+
+# Decision batch engine
+# /decision/bunch evaluates bunches with at least this many entities with the
+# vectorized (numpy) batch engine instead of one entity after the other
+
+TREEXPERT_BATCH_ENGINE_MIN_SIZE = 1000
+
+# Tree files
+# the compiled tree of every published version is written to a file in this
+# directory, worker processes map it instead of loading the tree from the database.
+# None turns tree files off, e.g. BASE_DIR.parent / "trees" turns them on.
+
+TREEXPERT_TREE_FILE_DIR = None
+
+# Decision process pool
+# number of worker processes that walk bunches with at least POOL_MIN_SIZE entities
+# that are not cached, in chunks of POOL_CHUNK_SIZE rows (0 workers: not used). the
+# workers are started by a fork server (unix only) with the compiled trees,
+# decision_worker --processes uses a pool of its own.
+
+TREEXPERT_PROCESS_POOL_WORKERS = 0
+TREEXPERT_PROCESS_POOL_MIN_SIZE = 10000
+TREEXPERT_PROCESS_POOL_CHUNK_SIZE = 2000
+
+# Decision data types
+# seconds the set of known data type ids is cached before it is reloaded
+
+TREEXPERT_DATA_TYPE_CACHE_MAX_AGE = 60
+
+# Decision audit log
+# with write-behind enabled, /decision answers before the request, its data and the
+# decision are saved: they are appended to a spool file in the spool directory and
+# written in batches by a background thread. submitting waits while the queue of
+# records that are not written yet is full. the request ids are reserved up front,
+# so /decision/result/{request_id} works as soon as the records are written.
+
+TREEXPERT_AUDIT_WRITE_BEHIND = False
+TREEXPERT_AUDIT_SPOOL_DIR = BASE_DIR.parent / "spool"
+TREEXPERT_AUDIT_QUEUE_SIZE = 10000
+TREEXPERT_AUDIT_BATCH_SIZE = 500
+TREEXPERT_AUDIT_FLUSH_INTERVAL = 1.0